@@ -0,0 +1,125 @@
+"""
+Micro-benchmark of SSEParser against the previous str-buffer SSE parsing.
+
+Streams compact and OpenAI-style frames, cut into network chunks of several
+sizes: one frame per chunk (token by token) and large chunks holding many
+frames (a stream read after a stall). Both parsers also have to decode the
+JSON payloads, as the client does.
+
+    python -m distiller_cm5_python.client.llm_infra.bench_sse_parser
+"""
+
+import argparse
+import json
+import time
+from typing import Callable, Iterable, List
+
+from distiller_cm5_python.client.llm_infra.sse_parser import SSEParser
+
+
+def legacy_parse(chunks: Iterable[bytes]) -> int:
+    """The previous _parse_llm_stream loop: decode, append and split per line."""
+    events = 0
+    buffer = ""
+    for chunk in chunks:
+        try:
+            buffer += chunk.decode("utf-8")
+        except UnicodeDecodeError:
+            continue
+        while "\n" in buffer:
+            line, buffer = buffer.split("\n", 1)
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("data:"):
+                data_str = line[len("data:") :].strip()
+                if data_str == "[DONE]":
+                    return events
+                if data_str:
+                    try:
+                        json.loads(data_str)
+                        events += 1
+                    except json.JSONDecodeError:
+                        pass
+    return events
+
+
+def parser_parse(chunks: Iterable[bytes]) -> int:
+    """SSEParser with the same payload handling."""
+    events = 0
+    parser = SSEParser()
+    for chunk in chunks:
+        for data in parser.feed(chunk):
+            data = data.strip()
+            if data == b"[DONE]":
+                return events
+            if data:
+                json.loads(data.decode("utf-8"))
+                events += 1
+    return events
+
+
+def make_stream(frames: int, stream_format: str) -> bytes:
+    words = ["Hello", " world", ",", " température", " 温度", " is", " 21", "°C", "."]
+    out = []
+    for i in range(frames):
+        content = words[i % len(words)]
+        if stream_format == "compact":
+            payload = {"c": content}
+        else:
+            payload = {
+                "id": "chatcmpl-0",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": "model.gguf",
+                "choices": [{"index": 0, "delta": {"content": content}}],
+            }
+        out.append(b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+    out.append(b"data: [DONE]")
+    return b"\n\n".join(out) + b"\n\n"
+
+
+def split_stream(stream: bytes, chunk_size: int) -> List[bytes]:
+    if chunk_size <= 0:
+        # One frame per chunk
+        return [frame + b"\n\n" for frame in stream.split(b"\n\n") if frame]
+    return [stream[i : i + chunk_size] for i in range(0, len(stream), chunk_size)]
+
+
+def bench(parse: Callable[[Iterable[bytes]], int], chunks: List[bytes], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        parse(chunks)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SSE stream parsing")
+    parser.add_argument("--frames", type=int, default=5000, help="Frames per stream")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case, best is kept")
+    args = parser.parse_args()
+
+    print(
+        f"{'format':<8} {'chunking':<12} {'events':>7} {'legacy ms':>10} "
+        f"{'parser ms':>10} {'speedup':>8}"
+    )
+    for stream_format in ("compact", "openai"):
+        stream = make_stream(args.frames, stream_format)
+        for chunk_size, label in ((0, "per frame"), (1024, "1 KiB"), (65536, "64 KiB")):
+            chunks = split_stream(stream, chunk_size)
+            events = parser_parse(chunks)
+            legacy_events = legacy_parse(chunks)
+            legacy = bench(legacy_parse, chunks, args.repeat)
+            new = bench(parser_parse, chunks, args.repeat)
+            # The legacy parser drops chunks that split a UTF-8 character
+            note = "" if legacy_events == events else f" (legacy lost {events - legacy_events})"
+            print(
+                f"{stream_format:<8} {label:<12} {events:>7} {legacy * 1000:>10.2f} "
+                f"{new * 1000:>10.2f} {legacy / new:>7.2f}x{note}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ Manages the lifecycle and connection status of a local llama-cpp server process.
 """
 
 import os
+import select
 import sys
 import subprocess
 import time
@@ -14,6 +15,7 @@ from urllib.parse import urlparse
 
 from distiller_cm5_python.utils.config import N_CTX, LLAMA_CPP_START_WAIT_TIME
 from distiller_cm5_python.utils.distiller_exception import UserVisibleError
+from distiller_cm5_python.utils.server_utils import unix_socket_path, unix_http_get
 
 # Get logger instance for this module
 logger = logging.getLogger(__name__)
@@ -28,7 +30,8 @@ class LlamaCppServerManager:
         """Initialize the manager.
 
         Args:
-            server_url: The URL where the server should run (e.g., "http://127.0.0.1:8000").
+            server_url: The URL where the server should run (e.g., "http://127.0.0.1:8000"
+                or "unix:///run/distiller/llm.sock").
             model_name: The name of the model the server should load.
             health_endpoint: The endpoint path used for health checks.
         """
@@ -79,66 +82,84 @@ class LlamaCppServerManager:
                 "Cannot start llama-cpp server: server script not found."
             )
 
-        # Parse host and port
-        try:
-            parsed_url = urlparse(self.server_url)
-            host = parsed_url.hostname
-            port = parsed_url.port
-            if not host or not port:
-                raise ValueError("Host or port not found in server_url")
-        except Exception as e:
-            logger.error(
-                f"Invalid server URL format for starting server: {self.server_url}. Error: {e}"
-            )
-            raise UserVisibleError(
-                f"Invalid server URL: {self.server_url}. Expected format like http://127.0.0.1:8000"
-            )
+        socket_path = unix_socket_path(self.server_url)
+        if socket_path:
+            bind_args = ["--uds", socket_path]
+        else:
+            # Parse host and port
+            try:
+                parsed_url = urlparse(self.server_url)
+                host = parsed_url.hostname
+                port = parsed_url.port
+                if not host or not port:
+                    raise ValueError("Host or port not found in server_url")
+            except Exception as e:
+                logger.error(
+                    f"Invalid server URL format for starting server: {self.server_url}. Error: {e}"
+                )
+                raise UserVisibleError(
+                    f"Invalid server URL: {self.server_url}. Expected format like http://127.0.0.1:8000"
+                )
+            bind_args = ["--host", host, "--port", str(port)]
 
         command = [
             sys.executable,
             self.script_path,
-            "--host",
-            host,
-            "--port",
-            str(port),
+            *bind_args,
             "--model_name",
             self.model_name,
             "--n_ctx",
             str(N_CTX),
         ]
+        # The server writes one line to this pipe once its model is loaded
+        ready_read, ready_write = os.pipe()
+        command += ["--ready_fd", str(ready_write)]
         logger.info(f"Starting llama-cpp server with command: {' '.join(command)}")
 
         try:
             # Start in background, allow output to parent terminal for debugging
-            self.process = subprocess.Popen(command)
+            self.process = subprocess.Popen(command, pass_fds=(ready_write,))
             self.pid = self.process.pid
             logger.info(f"Started llama-cpp server process with PID: {self.pid}")
         except Exception as e:
             logger.error(f"Failed to execute Popen command: {e}")
             self.process = None
             self.pid = None
+            os.close(ready_read)
             raise UserVisibleError(f"Failed to start the llama-cpp server process: {e}")
+        finally:
+            # Only the server keeps the write end, so its exit ends the pipe
+            os.close(ready_write)
 
-        # Wait for server to become responsive
+        # Wait for server to report readiness
         logger.info(
-            f"Waiting up to {LLAMA_CPP_START_WAIT_TIME}s for server to become responsive..."
+            f"Waiting up to {LLAMA_CPP_START_WAIT_TIME}s for server to become ready..."
         )
-        start_wait = time.time()
-        connection_ok = False
-        while time.time() - start_wait < LLAMA_CPP_START_WAIT_TIME:
-            if self.process and self.process.poll() is not None:
-                logger.error(
-                    f"Server process {self.pid} terminated prematurely with code {self.process.returncode}."
-                )
-                self._clear_process_info()
-                raise UserVisibleError(
-                    "Local llama-cpp server process failed to stay running."
-                )
+        try:
+            status = self._wait_ready(ready_read, LLAMA_CPP_START_WAIT_TIME)
+        finally:
+            os.close(ready_read)
 
-            if self.check_connection():  # Use the manager's own check method
-                connection_ok = True
-                break
-            time.sleep(0.5)
+        if status is not None and status.startswith("failed"):
+            logger.error(f"Llama-cpp server failed to start: {status}")
+            self.stop()
+            raise UserVisibleError(f"Local llama-cpp LLM server failed to start: {status}")
+        if status is None and self.process and self.process.poll() is not None:
+            logger.error(
+                f"Server process {self.pid} terminated prematurely with code {self.process.returncode}."
+            )
+            self._clear_process_info()
+            raise UserVisibleError(
+                "Local llama-cpp server process failed to stay running."
+            )
+
+        connection_ok = status == "ready"
+        if not connection_ok and self.check_liveness():
+            # Serving HTTP but still loading, requests queue behind the load
+            logger.warning(
+                f"Llama-cpp server (PID: {self.pid}) is up but still loading its model after {LLAMA_CPP_START_WAIT_TIME}s."
+            )
+            connection_ok = True
 
         if not connection_ok:
             logger.error(
@@ -154,6 +175,54 @@ class LlamaCppServerManager:
         )
         return True
 
+    def _wait_ready(self, ready_fd: int, timeout: float) -> Optional[str]:
+        """Wait for the server's readiness line.
+
+        Returns:
+            "ready", "failed: <reason>", or None on timeout or if the server
+            closed the pipe without reporting.
+        """
+        deadline = time.time() + timeout
+        received = b""
+        while time.time() < deadline:
+            readable, _, _ = select.select([ready_fd], [], [], deadline - time.time())
+            if not readable:
+                break
+            chunk = os.read(ready_fd, 4096)
+            if not chunk:
+                return None
+            received += chunk
+            if b"\n" in received:
+                return received.split(b"\n", 1)[0].decode("utf-8", "replace")
+        return None
+
+    def _get_status(self, path: str, timeout: float = 2) -> int:
+        """GET a server endpoint over TCP or the server's UNIX socket.
+
+        Returns:
+            The HTTP status code.
+        """
+        socket_path = unix_socket_path(self.server_url)
+        if socket_path:
+            status_code, _ = unix_http_get(socket_path, path, timeout=timeout)
+            return status_code
+        # Ensure URL includes scheme for requests
+        url = self.server_url
+        if not url.startswith(("http://", "https://")):
+            url = "http://" + url
+        endpoint = f"{url.rstrip('/')}/{path.lstrip('/')}"
+        return requests.get(endpoint, timeout=timeout).status_code
+
+    def check_liveness(self) -> bool:
+        """Check if the server process is serving HTTP, loaded model or not."""
+        try:
+            return self._get_status("/livez") == 200
+        except (requests.exceptions.RequestException, OSError) as e:
+            logger.debug(
+                f"Llama-cpp liveness check failed at {self.server_url}. Error: {e}"
+            )
+            return False
+
     def stop(self) -> bool:
         """Stop the managed llama-cpp server process.
 
@@ -226,16 +295,11 @@ class LlamaCppServerManager:
 
     def check_connection(self) -> bool:
         """Check if the server is responsive at its health endpoint."""
+        endpoint = f"{self.server_url}/{self.health_endpoint.lstrip('/')}"
         try:
-            # Ensure URL includes scheme for requests
-            url_to_check = self.server_url
-            if not url_to_check.startswith(("http://", "https://")):
-                url_to_check = "http://" + url_to_check
-
-            endpoint = f"{url_to_check.rstrip('/')}/{self.health_endpoint.lstrip('/')}"
             # Use a short timeout for health checks
-            response = requests.get(endpoint, timeout=2)
-            if response.status_code == 200:
+            status_code = self._get_status(self.health_endpoint, timeout=2)
+            if status_code == 200:
                 # Optional: Check if the process associated with self.pid still exists
                 if self.pid and not psutil.pid_exists(self.pid):
                     logger.warning(
@@ -248,10 +312,10 @@ class LlamaCppServerManager:
                 return True
             else:
                 logger.debug(
-                    f"Llama-cpp connection check failed at {endpoint}. Status: {response.status_code}"
+                    f"Llama-cpp connection check failed at {endpoint}. Status: {status_code}"
                 )
                 return False
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, OSError) as e:
             logger.debug(f"Llama-cpp connection check failed at {endpoint}. Error: {e}")
             return False
         except Exception as e:
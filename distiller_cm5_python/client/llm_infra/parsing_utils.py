@@ -71,6 +71,99 @@ def normalize_tool_call_json(tool_call_str: str) -> str:
     return tool_call_str
 
 
+def parse_tool_call_block(tool_call_content: str, i: int = 0) -> Optional[Dict[str, Any]]:
+    """Parses the content of one <tool_call> block into an OpenAI-compatible tool call.
+
+    Args:
+        tool_call_content: Text between <tool_call> and </tool_call>.
+        i: Index of the block in the response, used in the generated call id.
+
+    Returns:
+        The tool call, or None if the content is not a valid tool call.
+    """
+    original_content_for_log = tool_call_content[:200]  # Log snippet
+    try:
+        # Normalize the extracted content (remove ```json, fix common issues)
+        normalized_content = normalize_tool_call_json(tool_call_content)
+
+        # Attempt to parse the normalized JSON
+        tool_call_data = json.loads(normalized_content)
+
+        # Validate the basic structure (needs 'name' and 'arguments')
+        if (
+            not isinstance(tool_call_data, dict)
+            or "name" not in tool_call_data
+            or "arguments" not in tool_call_data
+        ):
+            raise ValueError(
+                "Parsed JSON missing required 'name' or 'arguments' fields."
+            )
+
+        # Ensure arguments are dumped back to a string for the final format,
+        # even if they were parsed from a string initially.
+        arguments_value = tool_call_data["arguments"]
+        if isinstance(arguments_value, dict):
+            arguments_str = json.dumps(arguments_value)
+        elif isinstance(arguments_value, str):
+            # If it's already a string, try to validate if it's JSON, but keep as string
+            try:
+                json.loads(arguments_value)
+                arguments_str = arguments_value  # Keep valid JSON string
+            except json.JSONDecodeError:
+                # Truncate potentially sensitive argument value in log
+                log_arg_snippet = arguments_value[:100] + (
+                    "..." if len(arguments_value) > 100 else ""
+                )
+                logger.warning(
+                    f"Tool call arguments for '{tool_call_data['name']}' is a string but not valid JSON: '{log_arg_snippet}'. Keeping as string."
+                )
+                arguments_str = (
+                    arguments_value  # Keep non-JSON string as is? Or error?
+                )
+        else:
+            # Handle other types (int, list etc.) by converting to string representation?
+            logger.warning(
+                f"Tool call arguments for '{tool_call_data['name']}' is of unexpected type {type(arguments_value)}. Converting to string."
+            )
+            arguments_str = str(arguments_value)
+
+        # Format into OpenAI-compatible structure
+        # Generate a unique-ish ID based on index or content hash? For now, use name + index.
+        tool_call_id = f"call_{tool_call_data['name']}_{i}"
+
+        formatted_tool_call = {
+            "id": tool_call_id,
+            "type": "function",  # Assuming all are function calls
+            "function": {
+                "name": tool_call_data["name"],
+                "arguments": arguments_str,
+            },
+        }
+        logger.debug(
+            f"parse_tool_calls: Successfully parsed tool call {i}: {formatted_tool_call}"
+        )
+        return formatted_tool_call
+
+    except json.JSONDecodeError as e:
+        logger.error(
+            f"parse_tool_calls: Failed JSON parsing for tool call {i}. Error: {e}. Content snippet: '{original_content_for_log}...'",
+            exc_info=True,
+        )
+        return None
+    except ValueError as e:
+        logger.error(
+            f"parse_tool_calls: Invalid structure for tool call {i}. Error: {e}. Content snippet: '{original_content_for_log}...'",
+            exc_info=True,
+        )
+        return None
+    except Exception as e:
+        logger.error(
+            f"parse_tool_calls: Unexpected error processing tool call {i}: {e}. Content snippet: '{original_content_for_log}...'",
+            exc_info=True,
+        )
+        return None
+
+
 def parse_tool_calls(text: str) -> List[Dict[str, Any]]:
     """Parses <tool_call>...</tool_call> blocks from model response text.
 
@@ -91,87 +184,9 @@ def parse_tool_calls(text: str) -> List[Dict[str, Any]]:
     logger.debug(f"Found {len(matches)} potential tool call blocks in text.")
 
     for i, tool_call_content in enumerate(matches):
-        original_content_for_log = tool_call_content[:200]  # Log snippet
-        try:
-            # Normalize the extracted content (remove ```json, fix common issues)
-            normalized_content = normalize_tool_call_json(tool_call_content)
-
-            # Attempt to parse the normalized JSON
-            tool_call_data = json.loads(normalized_content)
-
-            # Validate the basic structure (needs 'name' and 'arguments')
-            if (
-                not isinstance(tool_call_data, dict)
-                or "name" not in tool_call_data
-                or "arguments" not in tool_call_data
-            ):
-                raise ValueError(
-                    "Parsed JSON missing required 'name' or 'arguments' fields."
-                )
-
-            # Ensure arguments are dumped back to a string for the final format,
-            # even if they were parsed from a string initially.
-            arguments_value = tool_call_data["arguments"]
-            if isinstance(arguments_value, dict):
-                arguments_str = json.dumps(arguments_value)
-            elif isinstance(arguments_value, str):
-                # If it's already a string, try to validate if it's JSON, but keep as string
-                try:
-                    json.loads(arguments_value)
-                    arguments_str = arguments_value  # Keep valid JSON string
-                except json.JSONDecodeError:
-                    # Truncate potentially sensitive argument value in log
-                    log_arg_snippet = arguments_value[:100] + (
-                        "..." if len(arguments_value) > 100 else ""
-                    )
-                    logger.warning(
-                        f"Tool call arguments for '{tool_call_data['name']}' is a string but not valid JSON: '{log_arg_snippet}'. Keeping as string."
-                    )
-                    arguments_str = (
-                        arguments_value  # Keep non-JSON string as is? Or error?
-                    )
-            else:
-                # Handle other types (int, list etc.) by converting to string representation?
-                logger.warning(
-                    f"Tool call arguments for '{tool_call_data['name']}' is of unexpected type {type(arguments_value)}. Converting to string."
-                )
-                arguments_str = str(arguments_value)
-
-            # Format into OpenAI-compatible structure
-            # Generate a unique-ish ID based on index or content hash? For now, use name + index.
-            tool_call_id = f"call_{tool_call_data['name']}_{i}"
-
-            formatted_tool_call = {
-                "id": tool_call_id,
-                "type": "function",  # Assuming all are function calls
-                "function": {
-                    "name": tool_call_data["name"],
-                    "arguments": arguments_str,
-                },
-            }
-            tool_calls.append(formatted_tool_call)
-            logger.debug(
-                f"parse_tool_calls: Successfully parsed tool call {i}: {formatted_tool_call}"
-            )
-
-        except json.JSONDecodeError as e:
-            logger.error(
-                f"parse_tool_calls: Failed JSON parsing for tool call {i}. Error: {e}. Content snippet: '{original_content_for_log}...'",
-                exc_info=True,
-            )
-            # Continue to next match
-        except ValueError as e:
-            logger.error(
-                f"parse_tool_calls: Invalid structure for tool call {i}. Error: {e}. Content snippet: '{original_content_for_log}...'",
-                exc_info=True,
-            )
-            # Continue to next match
-        except Exception as e:
-            logger.error(
-                f"parse_tool_calls: Unexpected error processing tool call {i}: {e}. Content snippet: '{original_content_for_log}...'",
-                exc_info=True,
-            )
-            # Continue to next match
+        tool_call = parse_tool_call_block(tool_call_content, i)
+        if tool_call is not None:
+            tool_calls.append(tool_call)
 
     if tool_calls:
         logger.info(
@@ -0,0 +1,74 @@
+"""
+Incremental server-sent events parser for LLM streams.
+
+Each chunk is split into lines once, at C speed, and only an unterminated
+line is carried over to the next chunk; chunks without a line end are only
+appended to it. A chunk holding many events therefore costs linear time.
+Lines are split on bytes and data fields are returned as bytes, so a
+multi-byte UTF-8 character split across two chunks is simply completed by
+the next chunk. Each event's data is decoded once it is complete.
+
+Events follow the SSE format: ``data:`` lines of one event are joined with
+newlines and the event is complete at the blank line ending it; comments
+(``: keep-alive``) and other fields are skipped.
+"""
+
+from typing import List
+
+_DATA = b"data:"
+_DATA_FRAME = b"data: "
+
+
+class SSEParser:
+    """Turns a stream of byte chunks into the data payloads of complete events."""
+
+    def __init__(self):
+        # Unterminated line carried over from earlier chunks
+        self._partial = bytearray()
+        # Data lines of the event being read
+        self._data: List[bytes] = []
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """Add a chunk and return the data of the events it completed."""
+        # Fast path for the common token-by-token case: the chunk is exactly
+        # one ``data: ...\n\n`` frame and nothing is carried over
+        if (
+            chunk.startswith(_DATA_FRAME)
+            and chunk.find(b"\n", 6) == len(chunk) - 2
+            and chunk[-1] == 10
+            and chunk[-3] != 13
+            and not (self._partial or self._data)
+        ):
+            return [chunk[6:-2]]
+        lines = chunk.split(b"\n")
+        if len(lines) == 1:
+            self._partial += chunk
+            return []
+        if self._partial:
+            lines[0] = bytes(self._partial) + lines[0]
+            self._partial.clear()
+        # The part after the last line end belongs to the next line
+        tail = lines.pop()
+        if tail:
+            self._partial += tail
+
+        events: List[bytes] = []
+        data = self._data
+        for line in lines:
+            if not line or line == b"\r":
+                if data:
+                    events.append(data[0] if len(data) == 1 else b"\n".join(data))
+                    data.clear()
+            elif line.startswith(_DATA):
+                if line.endswith(b"\r"):
+                    line = line[:-1]
+                data.append(line[6:] if line[5:6] == b" " else line[5:])
+            # Comments and other fields are skipped
+        return events
+
+    def close(self) -> List[bytes]:
+        """Return the data of an event the stream ended without terminating."""
+        events = self.feed(b"\n") if self._partial else []
+        if self._data:
+            events += self.feed(b"\n")
+        return events
@@ -0,0 +1,166 @@
+"""
+Incremental detection of tool calls in streamed model text.
+
+Models served by llama-cpp write tool calls into their content as
+``<tool_call>{"name": ..., "arguments": {...}}</tool_call>``. Waiting for the
+end of the stream to parse them delays every tool by the rest of the
+generation, and matching the literal tag in single deltas misses tags split
+across tokens. The StreamingToolCallDetector is a small state machine fed
+with every content delta:
+
+- outside a block it looks for ``<tool_call>``, holding back a trailing
+  partial tag until the next delta,
+- inside a block it tracks the JSON brace balance (ignoring braces in
+  strings) and returns the call as soon as the object closes, before
+  ``</tool_call>`` or the end of the stream arrive,
+- after a block it notes text other than another call in
+  ``text_after_call``, the point where generating more is wasted.
+
+Blocks that only parse once complete (e.g. wrapped in a ```json fence) are
+parsed again at ``</tool_call>``, and an unterminated block at the end of
+the stream by ``close()``.
+"""
+
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from distiller_cm5_python.client.llm_infra.parsing_utils import parse_tool_call_block
+
+logger = logging.getLogger(__name__)
+
+TOOL_CALL_OPEN = "<tool_call>"
+TOOL_CALL_CLOSE = "</tool_call>"
+
+
+def _partial_tag_length(text: str, tag: str) -> int:
+    """Length of the longest end of ``text`` that starts ``tag``."""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+class StreamingToolCallDetector:
+    """Finds <tool_call> blocks in streamed text and parses each once it is complete."""
+
+    def __init__(self):
+        self.tool_calls: List[Dict[str, Any]] = []
+        self.in_tool_call = False
+        self.seen_tool_call = False
+        # Text other than another call followed a closed block
+        self.text_after_call = False
+        self._blocks = 0
+        # Text held back because it may be the start of a tag
+        self._carry = ""
+        self._body: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._emitted = False
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Add streamed text and return the tool calls it completed."""
+        completed: List[Dict[str, Any]] = []
+        text = self._carry + text
+        self._carry = ""
+        pos = 0
+        while pos < len(text):
+            if not self.in_tool_call:
+                start = text.find(TOOL_CALL_OPEN, pos)
+                held = 0
+                if start < 0:
+                    held = _partial_tag_length(text[pos:], TOOL_CALL_OPEN)
+                outside = text[pos:start] if start >= 0 else text[pos : len(text) - held]
+                if self._blocks and outside.strip():
+                    self.text_after_call = True
+                if start < 0:
+                    if held:
+                        self._carry = text[-held:]
+                    break
+                self._open_block()
+                pos = start + len(TOOL_CALL_OPEN)
+                continue
+
+            end = text.find(TOOL_CALL_CLOSE, pos)
+            segment = text[pos:] if end < 0 else text[pos:end]
+            if end < 0:
+                held = _partial_tag_length(segment, TOOL_CALL_CLOSE)
+                if held:
+                    self._carry = segment[-held:]
+                    segment = segment[:-held]
+            self._scan(segment, completed)
+            if end < 0:
+                break
+            self._close_block(completed)
+            pos = end + len(TOOL_CALL_CLOSE)
+        return completed
+
+    def close(self) -> List[Dict[str, Any]]:
+        """End of the stream: parse a block the model did not close."""
+        completed: List[Dict[str, Any]] = []
+        if self.in_tool_call:
+            self._body.append(self._carry)
+            self._carry = ""
+            self._close_block(completed)
+        return completed
+
+    def _open_block(self):
+        self.in_tool_call = True
+        self.seen_tool_call = True
+        self._body = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._emitted = False
+
+    def _scan(self, segment: str, completed: List[Dict[str, Any]]):
+        if self._emitted:
+            return
+        for index, char in enumerate(segment):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._body.append(segment[: index + 1])
+                    call = self._parse(quiet=True)
+                    if call is not None:
+                        completed.append(call)
+                        return
+                    # Keep collecting, the block is parsed again when it closes
+                    self._body.append(segment[index + 1 :])
+                    return
+        self._body.append(segment)
+
+    def _close_block(self, completed: List[Dict[str, Any]]):
+        if not self._emitted:
+            call = self._parse(quiet=False)
+            if call is not None:
+                completed.append(call)
+        self.in_tool_call = False
+        self._blocks += 1
+
+    def _parse(self, quiet: bool) -> Optional[Dict[str, Any]]:
+        body = "".join(self._body)
+        if quiet:
+            # The object closed but may still be wrapped (```json), avoid error logs
+            try:
+                json.loads(body)
+            except ValueError:
+                return None
+        call = parse_tool_call_block(body, self._blocks)
+        if call is not None:
+            self._emitted = True
+            self.tool_calls.append(call)
+            logger.debug(f"Tool call complete in stream: {call['function']['name']}")
+        return call
@@ -0,0 +1,112 @@
+"""
+Boot-time KV cache warmup for the discovered MCP servers.
+
+Connecting to an MCP server restores the KV state of its system prompt,
+few-shot prompts and tools on the llama-cpp server, and the first connect
+after boot pays for a full prefill of that prefix. The warmup starts every
+discovered server once, builds the exact messages ``MCPClient`` would send,
+and asks the LLM server to restore them; the server persists the states, so
+later connects are cache hits.
+
+Warmup runs on its own thread and event loop, leaving the UI's loop alone.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from distiller_cm5_python.client.mid_layer.llm_client import LLMClient
+from distiller_cm5_python.client.mid_layer.mcp_client import MCPClient
+from distiller_cm5_python.client.ui.bridge.ServerDiscovery import ServerDiscovery
+
+logger = logging.getLogger(__name__)
+
+# MCP servers started at once; their startup overlaps with the prefill of
+# the previous one, while the LLM server runs the prefills one at a time
+WARMUP_CONCURRENCY = 2
+# Longest time one server may take to start and have its state restored
+WARMUP_TIMEOUT = 300
+
+
+async def warm_up_server(server_script_path: str, llm_provider: LLMClient) -> bool:
+    """Restore the KV state of one MCP server's initial prompt.
+
+    Returns:
+        True if the LLM server restored the state.
+    """
+    client = MCPClient(llm_provider=llm_provider)
+    started = time.time()
+    try:
+        await client.open_session(server_script_path)
+        result = await llm_provider.restore_cache(
+            client.message_processor.get_formatted_messages(),
+            client.available_tools,
+        )
+        if result.get("status") == "error":
+            logger.warning(
+                f"Cache warmup of {server_script_path} failed: {result.get('detail')}"
+            )
+            return False
+        logger.info(
+            f"Warmed up cache for {client.server_name} in {time.time() - started:.2f}s"
+        )
+        return True
+    except Exception as e:
+        logger.warning(f"Cache warmup of {server_script_path} failed: {e}")
+        return False
+    finally:
+        try:
+            await client.exit_stack.aclose()
+        except Exception as e:
+            logger.debug(f"Error closing warmup session for {server_script_path}: {e}")
+
+
+async def warm_up_servers(
+    server_script_paths: List[str], llm_provider: LLMClient
+) -> Dict[str, bool]:
+    """Warm up every server, returning whether each one succeeded."""
+    semaphore = asyncio.Semaphore(WARMUP_CONCURRENCY)
+
+    async def run(path: str) -> bool:
+        async with semaphore:
+            try:
+                # The session is opened and closed inside the task wait_for runs
+                return await asyncio.wait_for(
+                    warm_up_server(path, llm_provider), WARMUP_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"Cache warmup of {path} timed out after {WARMUP_TIMEOUT}s")
+                return False
+
+    try:
+        results = await asyncio.gather(*(run(path) for path in server_script_paths))
+    finally:
+        # The pooled session belongs to this thread's loop, which ends here
+        await llm_provider.close()
+    return dict(zip(server_script_paths, results))
+
+
+def start_cache_warmup(
+    llm_provider: LLMClient, config=None
+) -> Optional[threading.Thread]:
+    """Discover MCP servers and warm up their caches on a background thread."""
+    if llm_provider.provider_type != "llama-cpp":
+        return None
+    servers = ServerDiscovery().discover_mcp_servers(config)
+    paths = [server["path"] for server in servers]
+    if not paths:
+        return None
+
+    def run():
+        started = time.time()
+        results = asyncio.run(warm_up_servers(paths, llm_provider))
+        logger.info(
+            f"Cache warmup finished in {time.time() - started:.2f}s: "
+            f"{sum(results.values())}/{len(results)} servers ready"
+        )
+
+    thread = threading.Thread(target=run, name="cache-warmup", daemon=True)
+    thread.start()
+    return thread
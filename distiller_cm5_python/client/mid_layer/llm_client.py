@@ -2,13 +2,25 @@
 LLM Server Provider - Unified provider for all LLM backends via HTTP
 """
 
+import asyncio
+import copy
 import json
 import aiohttp
 import time
 import requests  # Add requests for sync check
 import uuid
 import logging  # Added
-from typing import Any, Dict, List, Optional, AsyncGenerator, Callable, AsyncIterator
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    AsyncGenerator,
+    Callable,
+    AsyncIterator,
+    Tuple,
+    Union,
+)
 from distiller_cm5_python.utils.config import (
     TEMPERATURE,
     TOP_P,
@@ -17,11 +29,16 @@ from distiller_cm5_python.utils.config import (
     N_CTX,
     MAX_TOKENS,
     STOP,
+    CHAT_SESSIONS,
+    STREAM_EVENT_INTERVAL_MS,
+    TOOL_CALL_STOP,
+    MAX_TOOL_CALLS,
 )  # Removed unused OPENAI_URL, DEEPSEEK_URL
 from distiller_cm5_python.utils.distiller_exception import (
     UserVisibleError,
     LogOnlyError,
 )
+from distiller_cm5_python.utils.server_utils import unix_socket_path, unix_http_get
 
 # Import parsing utils
 from distiller_cm5_python.client.llm_infra.parsing_utils import (
@@ -29,23 +46,49 @@ from distiller_cm5_python.client.llm_infra.parsing_utils import (
     parse_tool_calls,
     check_is_c_ntx_too_long,
 )
+from distiller_cm5_python.client.llm_infra.sse_parser import SSEParser
+from distiller_cm5_python.client.llm_infra.tool_call_stream import (
+    StreamingToolCallDetector,
+)
 from distiller_cm5_python.client.ui.events.event_types import (
     EventType,
     StatusType,
     MessageSchema,
 )
 from distiller_cm5_python.client.ui.events.event_dispatcher import EventDispatcher
+from distiller_cm5_python.client.ui.events.event_coalescer import EventCoalescer
 
 # Get logger instance for this module
 logger = logging.getLogger(__name__)
 
+# Pooled connections per LLMClient; a stream, an abort and a cache restore may overlap
+HTTP_POOL_LIMIT = 8
+# Idle keep-alive connections are closed after this many seconds
+HTTP_KEEPALIVE_TIMEOUT = 60
+
+
+def _arguments_complete(arguments: str) -> bool:
+    """Whether streamed tool call arguments form a complete JSON value."""
+    if not arguments.rstrip().endswith("}"):
+        return False
+    try:
+        json.loads(arguments)
+        return True
+    except ValueError:
+        return False
+
 
 class _ToolCallAccumulator:
     """Helper class to accumulate tool call chunks from a stream and dispatch when complete."""
 
-    def __init__(self, dispatcher: Optional[EventDispatcher] = None):
+    def __init__(
+        self,
+        dispatcher: Optional[EventDispatcher] = None,
+        on_complete: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
         self._calls: List[Dict[str, Any]] = []
         self._dispatcher = dispatcher
+        self._on_complete = on_complete
 
     def add_chunk(self, index: int, chunk: Dict[str, Any]):
         """Adds a tool call chunk (delta) to the accumulator."""
@@ -53,6 +96,10 @@ class _ToolCallAccumulator:
             logger.warning(f"Tool call chunk missing index: {chunk}")
             return
 
+        # A new index means the calls before it are complete
+        for previous_tool in self._calls[:index]:
+            self._check_and_dispatch(previous_tool, final=True)
+
         # Ensure list is long enough
         while len(self._calls) <= index:
             self._calls.append(
@@ -80,23 +127,30 @@ class _ToolCallAccumulator:
         # Check for completion and dispatch if needed
         self._check_and_dispatch(current_tool)
 
-    def _check_and_dispatch(self, tool_call: Dict[str, Any]):
-        """Checks if a tool call is complete and dispatches it if so."""
+    def _check_and_dispatch(self, tool_call: Dict[str, Any], final: bool = False):
+        """Checks if a tool call is complete and dispatches it if so.
+
+        A call is complete once its arguments parse as JSON, or when ``final``
+        (a later call started or the stream ended).
+        """
         if (
             not tool_call.get("_dispatched")
             and tool_call.get("id")
             and tool_call.get("function", {}).get("name")
+            and (final or _arguments_complete(tool_call["function"]["arguments"]))
         ):
             # Mark as dispatched *before* dispatching to prevent race conditions if sync
             tool_call["_dispatched"] = True
+            # We need to pass a copy without the internal '_dispatched' flag
+            dispatch_payload = {
+                k: v for k, v in tool_call.items() if k != "_dispatched"
+            }
+            if self._on_complete:
+                self._on_complete(dispatch_payload)
             if self._dispatcher:
                 logger.debug(
                     f"Dispatching completed tool call: {tool_call['id']} - {tool_call['function']['name']}"
                 )
-                # We need to pass a copy without the internal '_dispatched' flag
-                dispatch_payload = {
-                    k: v for k, v in tool_call.items() if k != "_dispatched"
-                }
                 self._dispatcher.dispatch(MessageSchema.tool_call(dispatch_payload))
             else:
                 logger.warning(
@@ -107,6 +161,8 @@ class _ToolCallAccumulator:
         """Returns the list of fully accumulated and valid tool calls."""
         final_calls = []
         for i, tool in enumerate(self._calls):
+            # The stream ended, the last call is complete too
+            self._check_and_dispatch(tool, final=True)
             # Ensure essential fields are present
             if tool.get("id") and tool.get("function", {}).get("name"):
                 # Clean up internal flag before returning
@@ -126,65 +182,62 @@ async def _parse_llm_stream(
     response: aiohttp.ClientResponse,
 ) -> AsyncIterator[Dict[str, Any]]:
     """Parses Server-Sent Events (SSE) from an LLM stream response."""
-    buffer = ""
+    parser = SSEParser()
     async for chunk in response.content.iter_any():
         if not chunk:
             continue
-        try:
-            buffer += chunk.decode("utf-8")
-        except UnicodeDecodeError as e:
-            logger.error(
-                f"Unicode decode error in stream chunk: {e}. Chunk (bytes): {chunk!r}"
-            )
-            yield {"type": "error", "error": e, "detail": "Unicode decode error"}
-            continue  # Skip this chunk
-
-        while "\n" in buffer:
-            line, buffer = buffer.split("\n", 1)
-            line = line.strip()
-
-            if not line:  # Skip empty lines (often between events)
-                continue
-
-            if line.startswith("data:"):
-                data_str = line[len("data:") :].strip()
-                if data_str == "[DONE]":
-                    yield {"type": "done"}
+        for data in parser.feed(chunk):
+            event = _stream_event(data)
+            if event is not None:
+                yield event
+                if event["type"] == "done":
                     return  # End iteration
 
-                if not data_str:
-                    continue  # Skip empty data lines
-
-                try:
-                    # logger.debug(f"Processing stream data line: '{data_str}'") # Re-commented: Very verbose, uncomment for deep stream debugging
-                    chunk_data = json.loads(data_str)
-                    yield {"type": "data", "payload": chunk_data}
-                except json.JSONDecodeError as json_err:
-                    log_buffer_snippet = buffer[:200] + (
-                        "..." if len(buffer) > 200 else ""
-                    )
-                    logger.error(
-                        f"JSON Decode Error in streaming response line: '{line}' | Error: {json_err}. Buffer snippet: '{log_buffer_snippet}'"
-                    )  # Added buffer
-                    yield {"type": "error", "error": json_err, "line": line}
-                except Exception as e:  # Catch other potential errors during processing
-                    log_buffer_snippet = buffer[:200] + (
-                        "..." if len(buffer) > 200 else ""
-                    )
-                    logger.error(
-                        f"Unexpected error processing stream line '{line}': {e}. Buffer snippet: '{log_buffer_snippet}'",
-                        exc_info=True,
-                    )  # Added buffer
-                    yield {"type": "error", "error": e, "line": line}
-            else:
-                # Log lines that don't conform to SSE "data:" format, if any
-                logger.warning(f"Received unexpected non-data line in stream: '{line}'")
+    for data in parser.close():
+        event = _stream_event(data)
+        if event is not None:
+            yield event
+            if event["type"] == "done":
+                return
 
     # If the loop finishes without receiving "[DONE]", log a warning.
     logger.warning("LLM stream ended without a '[DONE]' marker.")
     yield {"type": "done"}  # Still signal completion
 
 
+def _stream_event(data: bytes) -> Optional[Dict[str, Any]]:
+    """Turns the data of one SSE event into a stream event, None for empty data."""
+    data = data.strip()
+    if not data:
+        return None  # Skip empty data lines
+    if data == b"[DONE]":
+        return {"type": "done"}
+    try:
+        # Events end on line breaks, so their data holds whole UTF-8 sequences
+        return {"type": "data", "payload": json.loads(data.decode("utf-8"))}
+    except (json.JSONDecodeError, UnicodeDecodeError) as json_err:
+        snippet = data[:200]
+        logger.error(
+            f"JSON Decode Error in streaming response data: {snippet!r} | Error: {json_err}"
+        )
+        return {"type": "error", "error": json_err, "line": snippet}
+
+
+def _stream_delta(chunk_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Returns the delta of a streamed chunk, either OpenAI-style or a compact frame."""
+    if "choices" in chunk_data:
+        if not chunk_data["choices"]:
+            return None
+        return chunk_data["choices"][0].get("delta", {})
+    # Compact frames from the llama-cpp server: {"c": content, "t": tool deltas, "f": finish}
+    delta = {}
+    if "c" in chunk_data:
+        delta["content"] = chunk_data["c"]
+    if "t" in chunk_data:
+        delta["tool_calls"] = chunk_data["t"]
+    return delta
+
+
 class LLMClient:
     """Provides LLM capabilities through HTTP API calls to various backends"""
 
@@ -200,7 +253,7 @@ class LLMClient:
         """Initialize the LLM server provider. Assumes server is already running.
 
         Args:
-            server_url: URL of the LLM server (e.g., "http://localhost:8000" for llama-cpp or "https://openrouter.ai/api/v1" for openrouter)
+            server_url: URL of the LLM server (e.g., "http://localhost:8000" or "unix:///run/distiller/llm.sock" for llama-cpp or "https://openrouter.ai/api/v1" for openrouter)
             model: Model to use for completions (e.g., "local-model.gguf" or "openai/gpt-4o")
             provider_type: Type of provider ("llama-cpp" or "openrouter")
             api_key: API key (required for "openrouter")
@@ -213,6 +266,8 @@ class LLMClient:
         self.api_key = api_key
         self.timeout = timeout
         self.streaming = streaming
+        # Seconds between UI events of one streamed message
+        self.stream_event_interval = STREAM_EVENT_INTERVAL_MS / 1000
         # Removed manager instance: self.llama_manager = None
 
         # Define common endpoint paths
@@ -222,6 +277,7 @@ class LLMClient:
         # Llama.cpp specific paths (relative to its server_url)
         self.restore_cache_url = "/restore_cache"
         self.load_model_url = "/setModel"
+        self.abort_url = "/abort"
         # Llama.cpp health endpoint (used for simple check)
         self.health_endpoint = "/health"
 
@@ -232,8 +288,22 @@ class LLMClient:
             "repetition_penalty": REPETITION_PENALTY,
             "max_tokens": MAX_TOKENS,
             "stop": STOP,
+            # Tool call stop policy, applied by the llama-cpp server and by
+            # closing the stream in get_chat_completion_streaming_response
+            "tool_call_stop": TOOL_CALL_STOP,
+            "max_tool_calls": MAX_TOOL_CALLS,
         }
 
+        # Llama.cpp session: the server keeps the conversation, and requests
+        # carry only the messages added since the last one it accepted
+        self.session_id = str(uuid.uuid4()) if CHAT_SESSIONS else None
+        self._session_messages: Optional[List[Dict[str, Any]]] = None
+        self._session_tools: Optional[List[Dict[str, Any]]] = None
+        # Keep-alive HTTP sessions, one per event loop
+        self._http_sessions: Dict[
+            asyncio.AbstractEventLoop, Tuple[aiohttp.ClientSession, str]
+        ] = {}
+
         # Simplified initialization: Check connection but don't try to start server
         if self.provider_type == "llama-cpp":
             if not self._check_llama_cpp_connection_sync():
@@ -258,14 +328,63 @@ class LLMClient:
             )
             raise ValueError(f"Unsupported provider type: {self.provider_type}")
 
+    @property
+    def unix_socket(self) -> Optional[str]:
+        """Socket path when the server is reached over a UNIX domain socket."""
+        return unix_socket_path(self.server_url)
+
     def _get_endpoint(self, path: str) -> str:
         """Constructs the full endpoint URL"""
-        base = self.server_url.rstrip("/")
+        # Requests over a UNIX socket still need an HTTP URL; the host is ignored
+        base = "http://localhost" if self.unix_socket else self.server_url.rstrip("/")
         path = path.lstrip("/")
         return f"{base}/{path}"
 
+    def _new_session(self) -> aiohttp.ClientSession:
+        """Creates a keep-alive HTTP session to the server, over its UNIX socket for unix:// URLs."""
+        if self.unix_socket:
+            connector = aiohttp.UnixConnector(
+                path=self.unix_socket,
+                limit=HTTP_POOL_LIMIT,
+                keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            )
+        else:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_LIMIT,
+                keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=300,
+                enable_cleanup_closed=True,
+            )
+        return aiohttp.ClientSession(connector=connector)
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Returns the pooled session of the running event loop, (re)creating it as needed.
+
+        Sessions are bound to the loop they were created on, so each loop
+        (the UI's, the cache warmup thread's) gets its own. A session made for
+        another server URL, e.g. before switch_provider, is closed and replaced.
+        """
+        loop = asyncio.get_running_loop()
+        for other_loop in [l for l in self._http_sessions if l.is_closed()]:
+            del self._http_sessions[other_loop]
+        entry = self._http_sessions.get(loop)
+        if entry is not None:
+            session, server_url = entry
+            if not session.closed and server_url == self.server_url:
+                return session
+            await session.close()
+        session = self._new_session()
+        self._http_sessions[loop] = (session, self.server_url)
+        return session
+
+    async def close(self):
+        """Closes the pooled session of the running event loop."""
+        entry = self._http_sessions.pop(asyncio.get_running_loop(), None)
+        if entry is not None and not entry[0].closed:
+            await entry[0].close()
+
     # TODO : questionable implementation, revisit later
-    def switch_provider(
+    async def switch_provider(
         self,
         server_url: str,
         model: str,
@@ -274,7 +393,11 @@ class LLMClient:
         timeout: Optional[int] = None,
         streaming: Optional[bool] = None,
     ):
-        """Switch the LLM provider configuration, checking connection for the new provider."""
+        """Switch the LLM provider configuration, checking connection for the new provider.
+
+        The check runs on the event loop instead of blocking it, from a copy
+        of the client so requests in flight keep the current provider.
+        """
         new_provider_type = provider_type.lower()
         new_server_url = server_url.rstrip("/")
         new_model = model
@@ -302,25 +425,18 @@ class LLMClient:
         # --- Pre-switch Validation ---
         # Check connection for the *new* provider *before* changing self state
         connection_valid = False
-        # Removed temporary manager logic
+        probe = copy.copy(self)
+        probe.provider_type = new_provider_type
+        probe.server_url = new_server_url
+        probe.api_key = new_api_key
+        probe._http_sessions = {}
         try:
-            if new_provider_type == "llama-cpp":
-                # Check connection using temporary values
-                original_url = self.server_url
-                self.server_url = new_server_url
-                connection_valid = self._check_llama_cpp_connection_sync()
-                self.server_url = original_url  # Restore
-            elif new_provider_type == "openrouter":
-                # Check cloud connection using temporary values
-                original_values = (self.server_url, self.api_key)
-                self.server_url = new_server_url
-                self.api_key = new_api_key
-                connection_valid = self._check_cloud_api_connection_sync()  # Sync check
-                self.server_url, self.api_key = original_values  # Restore
-
+            connection_valid = await probe.check_connection_async()
         except (UserVisibleError, ValueError, Exception) as e:
             logger.error(f"Connection check failed during provider switch attempt: {e}")
             connection_valid = False
+        finally:
+            await probe.close()
         # Removed temporary manager stop logic
 
         # --- End Pre-switch Validation ---
@@ -341,6 +457,8 @@ class LLMClient:
         self.api_key = new_api_key
         self.timeout = new_timeout
         self.streaming = new_streaming
+        self._session_messages = None
+        self._session_tools = None
 
         # Removed creation/start of new manager
         return True
@@ -348,7 +466,11 @@ class LLMClient:
     # Removed terminate_llama_cpp_server method
 
     def check_connection(self) -> bool:
-        """Check if the connection to the configured server is valid"""
+        """Check if the connection to the configured server is valid.
+
+        Blocks on the request; code running on an event loop uses
+        check_connection_async instead.
+        """
         if self.provider_type == "llama-cpp":
             # Use the synchronous check for external calls
             return self._check_llama_cpp_connection_sync()
@@ -361,21 +483,62 @@ class LLMClient:
             )
             return False
 
+    async def check_connection_async(self) -> bool:
+        """Check the connection over the pooled session, without blocking the event loop."""
+        if self.provider_type == "llama-cpp":
+            return await self._check_llama_cpp_connection_async()
+        elif self.provider_type == "openrouter":
+            return await self._check_cloud_api_connection_async()
+        else:
+            logger.error(
+                f"Checking connection for unknown provider type: {self.provider_type}"
+            )
+            return False
+
+    async def _check_llama_cpp_connection_async(self) -> bool:
+        """Asynchronously check connection for llama-cpp server using health endpoint."""
+        endpoint = self._get_endpoint(self.health_endpoint)
+        try:
+            session = await self._get_session()
+            async with session.get(endpoint, timeout=2) as response:
+                if response.status == 200:
+                    return True
+                logger.warning(
+                    f"Async llama-cpp connection check failed at {self.server_url}. Status: {response.status}"
+                )
+                return False
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(
+                f"Async llama-cpp connection check failed at {self.server_url}. Error: {e}"
+            )
+            return False
+        except Exception as e:
+            logger.error(
+                f"Unexpected error during async llama-cpp connection check: {e}"
+            )
+            return False
+
     # --- New method for Llama-cpp sync connection check ---
     def _check_llama_cpp_connection_sync(self) -> bool:
         """Synchronously check connection for llama-cpp server using health endpoint."""
         endpoint = self._get_endpoint(self.health_endpoint)
         try:
             # Use requests for sync check, short timeout
-            response = requests.get(endpoint, timeout=2)
-            if response.status_code == 200:
+            if self.unix_socket:
+                endpoint = f"{self.server_url}{self.health_endpoint}"
+                status_code, _ = unix_http_get(
+                    self.unix_socket, self.health_endpoint, timeout=2
+                )
+            else:
+                status_code = requests.get(endpoint, timeout=2).status_code
+            if status_code == 200:
                 return True
             else:
                 logger.warning(
-                    f"Sync llama-cpp connection check failed at {endpoint}. Status: {response.status_code}"
+                    f"Sync llama-cpp connection check failed at {endpoint}. Status: {status_code}"
                 )
                 return False
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, OSError) as e:
             logger.warning(
                 f"Sync llama-cpp connection check failed at {endpoint}. Error: {e}"
             )
@@ -388,7 +551,7 @@ class LLMClient:
 
     # --- End new method ---
 
-    # Sync version for use in __init__ and external checks
+    # Sync version for use in __init__ and check_connection, which cannot await
     def _check_cloud_api_connection_sync(self) -> bool:
         """Synchronously check connection for cloud-based APIs (e.g., OpenRouter)."""
         endpoint = self._get_endpoint(self.models_url)
@@ -423,7 +586,7 @@ class LLMClient:
             logger.error(f"Unexpected error during sync cloud connection check: {e}")
             return False
 
-    # Async version for internal use during API calls if needed later (currently unused)
+    # Async version for check_connection_async
     async def _check_cloud_api_connection_async(self) -> bool:
         """Asynchronously check connection for cloud-based APIs (e.g., OpenRouter)."""
         endpoint = self._get_endpoint(self.models_url)
@@ -435,18 +598,18 @@ class LLMClient:
             return False
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    endpoint, timeout=10, headers=headers
-                ) as response:
-                    if response.status == 200:
-                        return True
-                    else:
-                        response_text = await response.text()
-                        logger.warning(
-                            f"Async cloud API connection check failed at {endpoint}. Status: {response.status}, Response: {response_text[:100]}..."
-                        )
-                        return False
+            session = await self._get_session()
+            async with session.get(
+                endpoint, timeout=10, headers=headers
+            ) as response:
+                if response.status == 200:
+                    return True
+                else:
+                    response_text = await response.text()
+                    logger.warning(
+                        f"Async cloud API connection check failed at {endpoint}. Status: {response.status}, Response: {response_text[:100]}..."
+                    )
+                    return False
         except aiohttp.ClientError as e:
             logger.warning(
                 f"Async cloud API connection check failed at {endpoint}. Error: {e}"
@@ -464,9 +627,19 @@ class LLMClient:
         return headers
 
     def _prepare_chat_completion_payload(
-        self, messages: List[Dict], tools: Optional[List[Dict]], stream: bool
+        self,
+        messages: List[Dict],
+        tools: Optional[List[Dict]],
+        stream: bool,
+        request_id: Optional[str] = None,
+        full: bool = False,
     ) -> Dict:
-        """Prepares the payload for the /chat/completions endpoint."""
+        """Prepares the payload for the /chat/completions endpoint.
+
+        With a llama-cpp session, only the messages after those the server
+        already holds are sent, and tools only when they changed, unless
+        ``full`` is set.
+        """
         payload = {
             "messages": messages,
             "model": self.model,
@@ -479,11 +652,32 @@ class LLMClient:
         }
         if tools:
             payload["tools"] = tools
+        if self.session_id and self.provider_type == "llama-cpp":
+            payload["session_id"] = self.session_id
+            sent = self._session_messages
+            if (
+                not full
+                and sent is not None
+                and len(messages) >= len(sent)
+                and messages[: len(sent)] == sent
+            ):
+                payload["base_length"] = len(sent)
+                payload["messages"] = messages[len(sent) :]
+                if (tools or []) == self._session_tools:
+                    payload.pop("tools", None)
+                else:
+                    payload["tools"] = tools or []
+        if stream and self.provider_type == "llama-cpp":
+            # Delta-only frames are cheaper to encode and parse on-device
+            payload["stream_format"] = "compact"
+        if request_id and self.provider_type == "llama-cpp":
+            payload["request_id"] = request_id
 
         # Log summary
         log_summary = {
             "model": payload["model"],
             "num_messages": len(payload["messages"]),
+            "base_length": payload.get("base_length"),
             "num_tools": len(payload.get("tools", [])),
             "stream": payload["stream"],
             "provider": self.provider_type,
@@ -491,6 +685,39 @@ class LLMClient:
         logger.debug(f"Prepared chat completion payload: {log_summary}")
         return payload
 
+    async def _post_chat_completion(
+        self,
+        session: aiohttp.ClientSession,
+        messages: List[Dict],
+        tools: Optional[List[Dict]],
+        stream: bool,
+        request_id: Optional[str] = None,
+    ) -> aiohttp.ClientResponse:
+        """POST a chat completion, resending the full conversation if the session is out of sync."""
+        endpoint = self._get_endpoint(self.chat_completion_url)
+        payload = self._prepare_chat_completion_payload(
+            messages, tools, stream=stream, request_id=request_id
+        )
+        response = await session.post(
+            endpoint, json=payload, headers=self._get_headers(), timeout=self.timeout
+        )
+        if response.status == 409 and "base_length" in payload:
+            logger.info(
+                f"LLM server session {self.session_id} is out of sync ({await response.text()}), resending the full conversation"
+            )
+            response.release()
+            payload = self._prepare_chat_completion_payload(
+                messages, tools, stream=stream, request_id=request_id, full=True
+            )
+            response = await session.post(
+                endpoint, json=payload, headers=self._get_headers(), timeout=self.timeout
+            )
+        if response.status == 200 and "session_id" in payload:
+            # Copies, the caller keeps appending to its own lists
+            self._session_messages = copy.deepcopy(messages)
+            self._session_tools = copy.deepcopy(tools or [])
+        return response
+
     async def restore_cache(self, messages: List[Dict], tools: List[Dict]):
         """(Llama-cpp only) Restore the KV cache via API call."""
         if self.provider_type != "llama-cpp":
@@ -507,19 +734,19 @@ class LLMClient:
             "inference_configs": self.inference_configs,
         }
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    endpoint,
-                    json=payload,
-                    headers=self._get_headers(),
-                    timeout=self.timeout,
-                ) as response:
-                    response_data = await response.json()
-                    logger.debug(
-                        f"Restore cache response status: {response.status}, data: {response_data}"
-                    )
-                    response.raise_for_status()
-                    return response_data
+            session = await self._get_session()
+            async with session.post(
+                endpoint,
+                json=payload,
+                headers=self._get_headers(),
+                timeout=self.timeout,
+            ) as response:
+                response_data = await response.json()
+                logger.debug(
+                    f"Restore cache response status: {response.status}, data: {response_data}"
+                )
+                response.raise_for_status()
+                return response_data
         except aiohttp.ClientError as e:
             logger.error(f"Error restoring cache: {e}")
             return {"status": "error", "detail": str(e)}
@@ -541,19 +768,19 @@ class LLMClient:
         endpoint = self._get_endpoint(self.load_model_url)
         payload = {"model_name": self.model, "inference_configs": {"n_ctx": N_CTX}}
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    endpoint,
-                    json=payload,
-                    headers=self._get_headers(),
-                    timeout=max(self.timeout, 120),
-                ) as response:
-                    response_data = await response.json()
-                    logger.debug(
-                        f"Load model response status: {response.status}, data: {response_data}"
-                    )
-                    response.raise_for_status()
-                    return response_data
+            session = await self._get_session()
+            async with session.post(
+                endpoint,
+                json=payload,
+                headers=self._get_headers(),
+                timeout=max(self.timeout, 120),
+            ) as response:
+                response_data = await response.json()
+                logger.debug(
+                    f"Load model response status: {response.status}, data: {response_data}"
+                )
+                response.raise_for_status()
+                return response_data
         except aiohttp.ClientError as e:
             logger.error(f"Error requesting model load: {e}")
             return {"status": "error", "detail": str(e)}
@@ -561,6 +788,27 @@ class LLMClient:
             logger.error(f"Unexpected error requesting model load: {e}")
             return {"status": "error", "detail": str(e)}
 
+    async def abort(self, request_id: str) -> bool:
+        """(Llama-cpp only) Stop a queued or running generation on the server."""
+        if self.provider_type != "llama-cpp":
+            return False
+
+        endpoint = self._get_endpoint(f"{self.abort_url}/{request_id}")
+        try:
+            session = await self._get_session()
+            async with session.post(endpoint, timeout=2) as response:
+                if response.status == 200:
+                    logger.info(f"Aborted LLM request {request_id}")
+                    return True
+                # 404: the generation already finished
+                logger.debug(
+                    f"Abort of request {request_id} returned status {response.status}"
+                )
+                return False
+        except Exception as e:
+            logger.warning(f"Failed to abort LLM request {request_id}: {e}")
+            return False
+
     # --- Get Completion Methods ---
 
     async def get_chat_completion_response(
@@ -581,50 +829,54 @@ class LLMClient:
         Returns:
             Dict: The full response from the LLM, formatted as {"message": {...}}
         """
-        endpoint = self._get_endpoint(self.chat_completion_url)
-        payload = self._prepare_chat_completion_payload(messages, tools, stream=False)
-        headers = self._get_headers()
-
         start_time_req = time.time()
 
         response_data = None
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    endpoint, json=payload, headers=headers, timeout=self.timeout
-                ) as response:
-                    status_code = response.status
-                    response_text = await response.text()
-                    # logger.debug(f"Response Status: {status_code}") # Removed: Redundant, status checked below
-                    # logger.debug(f"Response Text (full): {response_text}") # Avoid logging full potentially large response
+            session = await self._get_session()
+            async with await self._post_chat_completion(
+                session, messages, tools, stream=False
+            ) as response:
+                status_code = response.status
+                response_text = await response.text()
+                # logger.debug(f"Response Status: {status_code}") # Removed: Redundant, status checked below
+                # logger.debug(f"Response Text (full): {response_text}") # Avoid logging full potentially large response
+
+                if status_code != 200:
+                    error_detail = response_text
+                    try:
+                        error_json = json.loads(response_text)
+                        error_detail = error_json.get(
+                            "detail", error_json.get("error", response_text)
+                        )
+                    except json.JSONDecodeError:
+                        pass
 
-                    if status_code != 200:
-                        error_detail = response_text
-                        try:
-                            error_json = json.loads(response_text)
-                            error_detail = error_json.get(
-                                "detail", error_json.get("error", response_text)
+                    if self.provider_type == "llama-cpp":
+                        ctx_info = check_is_c_ntx_too_long(str(error_detail))
+                        if ctx_info:
+                            error_msg = f"Requested tokens ({ctx_info[0]}) exceed context window ({ctx_info[1]})."
+                            logger.error(
+                                f"LLMClient.get_chat_completion_response: {error_msg}"
+                            )
+                            raise UserVisibleError(
+                                f"{error_msg} Please reduce message history length or query size."
                             )
-                        except json.JSONDecodeError:
-                            pass
-
-                        if self.provider_type == "llama-cpp":
-                            ctx_info = check_is_c_ntx_too_long(str(error_detail))
-                            if ctx_info:
-                                error_msg = f"Requested tokens ({ctx_info[0]}) exceed context window ({ctx_info[1]})."
-                                logger.error(
-                                    f"LLMClient.get_chat_completion_response: {error_msg}"
-                                )
-                                raise UserVisibleError(
-                                    f"{error_msg} Please reduce message history length or query size."
-                                )
 
-                        logger.error(
-                            f"LLMClient.get_chat_completion_response: Request failed. Status: {status_code}, Detail: {error_detail}"
-                        )
-                        response.raise_for_status()
+                    logger.error(
+                        f"LLMClient.get_chat_completion_response: Request failed. Status: {status_code}, Detail: {error_detail}"
+                    )
+                    response.raise_for_status()
 
-                    response_data = json.loads(response_text)
+                response_data = json.loads(response_text)
+                if response_data.get("tool_call_stop"):
+                    logger.info(
+                        f"LLM server stopped generation after the tool calls: {response_data['tool_call_stop']}"
+                    )
+                if response_data.get("context_window"):
+                    logger.warning(
+                        f"LLM server fitted the conversation into its context window: {response_data['context_window']}"
+                    )
 
             end_time_req = time.time()
             # Log summary of successful response at DEBUG
@@ -736,7 +988,11 @@ class LLMClient:
             }
 
     def _emit_success(
-        self, dispatcher: EventDispatcher, id: str, event_type: EventType, content: str
+        self,
+        dispatcher: Union[EventDispatcher, EventCoalescer],
+        id: str,
+        event_type: EventType,
+        content: str,
     ):
         dispatcher.dispatch(
             MessageSchema(
@@ -744,11 +1000,23 @@ class LLMClient:
             )
         )
 
+    def _tool_calls_done(self, detector: StreamingToolCallDetector) -> bool:
+        """Whether the tool call stop policy says the rest of the stream is wasted."""
+        if not self.inference_configs.get("tool_call_stop"):
+            return False
+        if detector.in_tool_call:
+            return False
+        max_calls = self.inference_configs.get("max_tool_calls") or 0
+        if max_calls and len(detector.tool_calls) >= max_calls:
+            return True
+        return detector.text_after_call
+
     async def get_chat_completion_streaming_response(
         self,
         messages: List[Dict[str, Any]],
         tools: Optional[List[Dict[str, Any]]] = [],
         dispatcher: Optional[EventDispatcher] = None,
+        on_tool_call: Optional[Callable[[Dict[str, Any]], None]] = None,
     ) -> Dict[str, Any]:
         """Sends a request to the LLM and processes the streaming response asynchronously.
 
@@ -756,176 +1024,219 @@ class LLMClient:
             messages: List of messages to send to the LLM
             tools: List of tools to include in the request
             dispatcher: Optional event dispatcher to dispatch events (chunks, tool calls)
+            on_tool_call: Optional callback receiving each tool call as soon as its
+                arguments are complete, while the model is still generating
 
         Returns:
             Dict: The final aggregated response dictionary after the stream ends.
         """
         start_time_req = time.time()
         endpoint = self._get_endpoint(self.chat_completion_url)
-        payload = self._prepare_chat_completion_payload(messages, tools, stream=True)
-        headers = self._get_headers()
-
-        # Use a unique ID for this streaming request for event tracking
+        # Use a unique ID for this streaming request for event tracking and aborts
         stream_request_id = str(uuid.uuid4())
+
         logger.info(
             f"Starting streaming chat completion request ({stream_request_id}) to {endpoint} for model {self.model}"
         )
         # Payload logging is now handled within _prepare_chat_completion_payload
 
         full_response_content = ""
-        tool_accumulator = _ToolCallAccumulator(dispatcher)  # Pass dispatcher here
+        # Content deltas are batched into one UI event per interval
+        events = EventCoalescer(dispatcher, self.stream_event_interval)
+        tool_accumulator = _ToolCallAccumulator(
+            events if dispatcher else None, on_complete=on_tool_call
+        )  # Tool calls flush pending content first
+        # <tool_call> blocks written into the content (llama-cpp)
+        tool_call_detector = StreamingToolCallDetector()
+        tool_calls_done = False
+
+        def text_tool_call_ready(call: Dict[str, Any]):
+            if on_tool_call:
+                on_tool_call(call)
+            if dispatcher:
+                events.dispatch(MessageSchema.tool_call(call))
+
         current_content_event_id = str(
             uuid.uuid4()
         )  # ID for the current continuous message/action content
         current_content_type = EventType.MESSAGE  # Start expecting message content
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    endpoint, json=payload, headers=headers, timeout=self.timeout
-                ) as response:
-                    # --- Initial Response Check ---
-                    if response.status != 200:
-                        response_text = await response.text()
-                        error_detail = response_text
-                        try:
-                            error_json = json.loads(response_text)
-                            error_detail = error_json.get(
-                                "detail", error_json.get("error", response_text)
-                            )
-                        except json.JSONDecodeError:
-                            pass
+            session = await self._get_session()
+            async with await self._post_chat_completion(
+                session,
+                messages,
+                tools,
+                stream=True,
+                request_id=stream_request_id,
+            ) as response:
+                # --- Initial Response Check ---
+                if response.status != 200:
+                    response_text = await response.text()
+                    error_detail = response_text
+                    try:
+                        error_json = json.loads(response_text)
+                        error_detail = error_json.get(
+                            "detail", error_json.get("error", response_text)
+                        )
+                    except json.JSONDecodeError:
+                        pass
 
-                        # Check for specific llama-cpp context length error
-                        if self.provider_type == "llama-cpp":
-                            req_tokens, ctx_window = check_is_c_ntx_too_long(
-                                str(error_detail)
+                    # Check for specific llama-cpp context length error
+                    if self.provider_type == "llama-cpp":
+                        req_tokens, ctx_window = check_is_c_ntx_too_long(
+                            str(error_detail)
+                        )
+                        if req_tokens is not None:
+                            error_msg = f"Requested tokens ({req_tokens}) exceed context window ({ctx_window})."
+                            logger.error(
+                                f"LLMClient.get_chat_completion_streaming_response: {error_msg}"
+                            )
+                            raise UserVisibleError(
+                                f"{error_msg} Please reduce message history length or query size."
                             )
-                            if req_tokens is not None:
-                                error_msg = f"Requested tokens ({req_tokens}) exceed context window ({ctx_window})."
-                                logger.error(
-                                    f"LLMClient.get_chat_completion_streaming_response: {error_msg}"
-                                )
-                                raise UserVisibleError(
-                                    f"{error_msg} Please reduce message history length or query size."
-                                )
 
-                        # General HTTP error logging and exception
-                        logger.error(
-                            f"LLMClient.get_chat_completion_streaming_response: Stream request failed. Status: {response.status}, Detail: {error_detail}"
-                        )
-                        response.raise_for_status()  # Raise ClientResponseError for non-200 status
+                    # General HTTP error logging and exception
+                    logger.error(
+                        f"LLMClient.get_chat_completion_streaming_response: Stream request failed. Status: {response.status}, Detail: {error_detail}"
+                    )
+                    response.raise_for_status()  # Raise ClientResponseError for non-200 status
+
+                if response.headers.get("X-Context-Window"):
+                    logger.warning(
+                        f"LLM server fitted the conversation into its context window: {response.headers['X-Context-Window']}"
+                    )
+
+                # --- Stream Processing ---
+                async for event in _parse_llm_stream(response):
+                    if event["type"] == "data":
+                        try:
+                            stop_report = event["payload"].get("s") or event[
+                                "payload"
+                            ].get("tool_call_stop")
+                            if stop_report:
+                                logger.info(
+                                    f"LLM server stopped generation after the tool calls: {stop_report}"
+                                )
+                            delta = _stream_delta(event["payload"])
+                            if delta is not None:
 
-                    # --- Stream Processing ---
-                    async for event in _parse_llm_stream(response):
-                        if event["type"] == "data":
-                            try:
-                                chunk_data = event["payload"]
+                                # -- Handle Content Delta --
                                 if (
-                                    "choices" in chunk_data
-                                    and len(chunk_data["choices"]) > 0
+                                    "content" in delta
+                                    and delta["content"] is not None
                                 ):
-                                    delta = chunk_data["choices"][0].get("delta", {})
+                                    delta_content = delta["content"]
+                                    full_response_content += delta_content
+                                    completed_calls = tool_call_detector.feed(
+                                        delta_content
+                                    )
 
-                                    # -- Handle Content Delta --
+                                    # Detect inline tool call markers, also split across deltas
+                                    # Switch content type if marker found and not already ACTION
                                     if (
-                                        "content" in delta
-                                        and delta["content"] is not None
+                                        tool_call_detector.seen_tool_call
+                                        and current_content_type != EventType.ACTION
                                     ):
-                                        delta_content = delta["content"]
-                                        full_response_content += delta_content
-
-                                        # Detect potential inline tool call markers (fallback)
-                                        # Switch content type if marker found and not already ACTION
+                                        # cut the last one
+                                        self._emit_success(
+                                            events,
+                                            current_content_event_id,
+                                            current_content_type,
+                                            full_response_content,
+                                        )
+                                        # finish and dispatch the last one
+                                        logger.info(
+                                            "Detected '<tool_call>' tag in content stream. Switching to ACTION type."
+                                        )
+                                        current_content_event_id = str(
+                                            uuid.uuid4()
+                                        )  # New ID for this action segment
+                                        current_content_type = EventType.ACTION
+
+                                    # Queue content chunk, dispatched coalesced
+                                    events.add_content(
+                                        current_content_event_id,
+                                        current_content_type,
+                                        delta_content,
+                                    )
+                                    for call in completed_calls:
+                                        text_tool_call_ready(call)
+                                    if tools and self._tool_calls_done(
+                                        tool_call_detector
+                                    ):
+                                        # The llama-cpp server applies the same policy and ends
+                                        # the stream itself; only more content means it did not
                                         if (
-                                            "<tool_call>" in delta_content
-                                            and current_content_type != EventType.ACTION
+                                            self.provider_type != "llama-cpp"
+                                            or tool_calls_done
                                         ):
-                                            # cut the last one
-                                            self._emit_success(
-                                                dispatcher,
-                                                current_content_event_id,
-                                                current_content_type,
-                                                full_response_content,
-                                            )
-                                            # finish and dispatch the last one
+                                            # Closing the stream cancels the generation on the server
                                             logger.info(
-                                                "Detected '<tool_call>' tag in content stream. Switching to ACTION type."
-                                            )
-                                            current_content_event_id = str(
-                                                uuid.uuid4()
-                                            )  # New ID for this action segment
-                                            current_content_type = EventType.ACTION
-
-                                        # Dispatch content chunk
-                                        if dispatcher:
-                                            dispatcher.dispatch(
-                                                MessageSchema(
-                                                    id=current_content_event_id,
-                                                    type=current_content_type,
-                                                    content=delta_content,
-                                                    status=StatusType.IN_PROGRESS,
-                                                )
+                                                f"Tool calls complete after {len(tool_call_detector.tool_calls)} calls, closing the stream"
                                             )
-
-                                    # -- Handle Tool Call Delta --
-                                    if "tool_calls" in delta and delta["tool_calls"]:
-                                        # Ensure we switch back to MESSAGE type after tool calls start
-                                        # in case content follows later
-                                        for tool_call_chunk in delta["tool_calls"]:
-                                            index = tool_call_chunk.get("index")
-                                            tool_accumulator.add_chunk(
-                                                index, tool_call_chunk
-                                            )
-
-                            except Exception as processing_error:
-                                logger.error(
-                                    f"Error processing stream data chunk: {processing_error}",
-                                    exc_info=True,
-                                )
-                                if dispatcher:
-                                    error_event = MessageSchema(
-                                        type=EventType.ERROR,
-                                        content=f"Internal error processing stream chunk: {processing_error}",
-                                        status=StatusType.FAILED,
-                                    )
-                                    dispatcher.dispatch(error_event)
-
-                        elif event["type"] == "done":
-                            break  # Exit the async for loop
-
-                        elif event["type"] == "error":
+                                            response.close()
+                                            break
+                                        tool_calls_done = True
+
+                                # -- Handle Tool Call Delta --
+                                if "tool_calls" in delta and delta["tool_calls"]:
+                                    # Ensure we switch back to MESSAGE type after tool calls start
+                                    # in case content follows later
+                                    for tool_call_chunk in delta["tool_calls"]:
+                                        index = tool_call_chunk.get("index")
+                                        tool_accumulator.add_chunk(
+                                            index, tool_call_chunk
+                                        )
+
+                        except Exception as processing_error:
                             logger.error(
-                                f"Stream parsing error: {event.get('error')} on line: {event.get('line', 'N/A')}"
+                                f"Error processing stream data chunk: {processing_error}",
+                                exc_info=True,
                             )
                             if dispatcher:
-                                error_content = f"Error parsing response stream: {event.get('error')}"
-                                if event.get("detail"):
-                                    error_content += f" ({event['detail']})"
                                 error_event = MessageSchema(
                                     type=EventType.ERROR,
-                                    content=error_content,
+                                    content=f"Internal error processing stream chunk: {processing_error}",
                                     status=StatusType.FAILED,
                                 )
-                                dispatcher.dispatch(error_event)
-                            # Decide if we should continue or break on parsing error?
-                            # For now, let's continue processing subsequent lines if possible.
-
-                    # dispatch the last one
-                    if current_content_type == EventType.MESSAGE:
-                        self._emit_success(
-                            dispatcher,
-                            current_content_event_id,
-                            current_content_type,
-                            full_response_content,
-                        )
+                                events.dispatch(error_event)
 
-                    # --- Stream Finished ---
-                    end_time_req = time.time()
-                    logger.info(
-                        f"LLMClient.get_chat_completion_streaming_response ===== STREAMING COMPLETED ({end_time_req - start_time_req:.2f}s) ====="
+                    elif event["type"] == "done":
+                        break  # Exit the async for loop
+
+                    elif event["type"] == "error":
+                        logger.error(
+                            f"Stream parsing error: {event.get('error')} on line: {event.get('line', 'N/A')}"
+                        )
+                        if dispatcher:
+                            error_content = f"Error parsing response stream: {event.get('error')}"
+                            if event.get("detail"):
+                                error_content += f" ({event['detail']})"
+                            error_event = MessageSchema(
+                                type=EventType.ERROR,
+                                content=error_content,
+                                status=StatusType.FAILED,
+                            )
+                            events.dispatch(error_event)
+                        # Decide if we should continue or break on parsing error?
+                        # For now, let's continue processing subsequent lines if possible.
+
+                # dispatch the last one
+                if current_content_type == EventType.MESSAGE:
+                    self._emit_success(
+                        events,
+                        current_content_event_id,
+                        current_content_type,
+                        full_response_content,
                     )
 
+                # --- Stream Finished ---
+                end_time_req = time.time()
+                logger.info(
+                    f"LLMClient.get_chat_completion_streaming_response ===== STREAMING COMPLETED ({end_time_req - start_time_req:.2f}s) ====="
+                )
+
             # --- Post-Stream Processing ---
             final_tool_calls = tool_accumulator.get_final_calls()
 
@@ -933,38 +1244,19 @@ class LLMClient:
                 f"LLMClient.get_chat_completion_streaming_response: Full response content: {full_response_content}"
             )
 
-            # Fallback: Check accumulated text content for tool calls if none were found structurally
-            if (
-                not final_tool_calls
-                and isinstance(full_response_content, str)
-                and "<tool_call>" in full_response_content
-            ):
-                logger.warning(
-                    "Stream ended. No structured tool calls found, but found '<tool_call>' tags in accumulated text. Attempting parse."
+            # Tool calls written as <tool_call> blocks into the content were
+            # dispatched as they completed; an unterminated last one ends here
+            for call in tool_call_detector.close():
+                text_tool_call_ready(call)
+            if not final_tool_calls and tool_call_detector.tool_calls:
+                final_tool_calls = tool_call_detector.tool_calls
+                # Remove the tool call section from the final content
+                full_response_content = full_response_content.split("<tool_call>")[
+                    0
+                ].strip()
+                logger.debug(
+                    f"Content updated after extracting tool calls from text: '{full_response_content[:100]}...'"
                 )
-                parsed_calls = parse_tool_calls(full_response_content)
-                if parsed_calls:
-                    final_tool_calls = parsed_calls
-                    # Remove the tool call section from the final content
-                    full_response_content = full_response_content.split("<tool_call>")[
-                        0
-                    ].strip()
-                    logger.debug(
-                        f"Content updated after extracting tool calls from text: '{full_response_content[:100]}...'"
-                    )
-                    # Re-dispatch the extracted tool calls if a dispatcher exists
-                    if dispatcher:
-                        logger.info(
-                            f"Dispatching {len(parsed_calls)} tool calls parsed from text."
-                        )
-                        for call in parsed_calls:
-                            # Ensure the call structure matches what MessageSchema.tool_call expects
-                            if isinstance(call, dict) and "function" in call:
-                                dispatcher.dispatch(MessageSchema.tool_call(call))
-                            else:
-                                logger.warning(
-                                    f"Skipping dispatch of invalid tool call parsed from text: {call}"
-                                )
 
             logger.info(
                 f"LLMClient.get_chat_completion_streaming_response: Processed result. Content length: {len(full_response_content)}, Tool calls: {len(final_tool_calls)}"
@@ -981,12 +1273,29 @@ class LLMClient:
         except UserVisibleError:
             # Logged and raised within the stream check
             raise
+        except asyncio.CancelledError:
+            # The caller gave up on this query, don't let the server run to max_tokens
+            await self.abort(stream_request_id)
+            raise
+        except asyncio.TimeoutError as e:
+            error_msg = f"Timed out after {self.timeout}s waiting for the LLM stream"
+            logger.error(error_msg)
+            await self.abort(stream_request_id)
+            if dispatcher:
+                events.dispatch(
+                    MessageSchema(
+                        type=EventType.ERROR,
+                        content=error_msg,
+                        status=StatusType.FAILED,
+                    )
+                )
+            raise LogOnlyError(error_msg) from e
         except aiohttp.ClientResponseError as e:
             # Error during initial connection or non-200 status before stream starts fully
             error_msg = f"HTTP Error {e.status} during streaming setup from LLM server: {e.message}"
             logger.error(error_msg, exc_info=True)
             if dispatcher:
-                dispatcher.dispatch(
+                events.dispatch(
                     MessageSchema(
                         type=EventType.ERROR,
                         content=error_msg,
@@ -1009,7 +1318,7 @@ class LLMClient:
                 pass
             logger.error(error_msg, exc_info=True)
             if dispatcher:
-                dispatcher.dispatch(
+                events.dispatch(
                     MessageSchema(
                         type=EventType.ERROR,
                         content=error_msg,
@@ -1022,7 +1331,7 @@ class LLMClient:
             error_msg = f"Unexpected error during streaming chat completion: {str(e)} (Type: {type(e).__name__})"
             logger.error(error_msg, exc_info=True)
             if dispatcher:
-                dispatcher.dispatch(
+                events.dispatch(
                     MessageSchema(
                         type=EventType.ERROR,
                         content=f"An unexpected error occurred: {str(e)}",
@@ -1031,4 +1340,6 @@ class LLMClient:
                 )
             # Convert to LogOnlyError so MCPClient can handle UI feedback gracefully
             raise LogOnlyError(error_msg) from e
-        # No finally block needed now as resource closing (session) is handled by 'async with'
+        finally:
+            # Pending content of an interrupted stream, and the flush timer
+            events.close()
@@ -1,6 +1,6 @@
 import time
 import asyncio
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import json
 import logging
 
@@ -22,6 +22,9 @@ from distiller_cm5_python.utils.config import (
     PROVIDER_TYPE,
     MODEL_NAME,
     TIMEOUT,
+    TOOL_CONCURRENCY,
+    TOOL_TIMEOUT,
+    TOOL_LIMITS,
 )
 from contextlib import AsyncExitStack
 
@@ -57,6 +60,7 @@ class MCPClient:
         api_key: Optional[str] = None,
         timeout: Optional[int] = None,
         dispatcher: Optional[EventDispatcher] = None,
+        llm_provider: Optional[LLMClient] = None,
     ):
         self.session = None
         self.write = None
@@ -84,88 +88,109 @@ class MCPClient:
         self.message_processor = MessageProcessor()
         self.prompt_processor = PromptProcessor()
 
-        # Initialize the LLM provider with unified configuration
+        # Initialize the LLM provider with unified configuration, unless one
+        # is shared with this client
         # Pass the streaming flag to LLMClient as it might have internal uses
-        logger.debug(
-            f"Initializing LLMClient with server_url={_llm_server_url}, model={_model}, type={_provider_type}, stream={self.streaming}"
-        )
-        self.llm_provider = LLMClient(
-            server_url=_llm_server_url,
-            model=_model,
-            provider_type=_provider_type,
-            api_key=_api_key,
-            timeout=_timeout,
-            streaming=self.streaming,
-        )
+        if llm_provider is not None:
+            self.llm_provider = llm_provider
+        else:
+            logger.debug(
+                f"Initializing LLMClient with server_url={_llm_server_url}, model={_model}, type={_provider_type}, stream={self.streaming}"
+            )
+            self.llm_provider = LLMClient(
+                server_url=_llm_server_url,
+                model=_model,
+                provider_type=_provider_type,
+                api_key=_api_key,
+                timeout=_timeout,
+                streaming=self.streaming,
+            )
 
         # ToolProcessor initialized after session creation in connect_to_server
         self.tool_processor = None
 
+        # Tool calls started while the model was still streaming, by call id
+        self._early_tool_tasks: Dict[str, Tuple[Dict[str, Any], asyncio.Task]] = {}
+        # Concurrent tool calls per server and their timeout, set per server
+        # script in open_session
+        self.tool_concurrency = TOOL_CONCURRENCY
+        self.tool_timeout = TOOL_TIMEOUT
+        self._tool_semaphore: Optional[asyncio.Semaphore] = None
+
         logger.debug("Client initialized with components")
 
         self.dispatcher = dispatcher
 
-    async def connect_to_server(self, server_script_path: str) -> bool:
-        """Connect to an MCP server"""
-
-        if not server_script_path.endswith(".py"):
-            raise UserVisibleError("Server script must be a .py file")
+    async def open_session(self, server_script_path: str):
+        """Start an MCP server, load its capabilities and set up the initial messages.
 
+        The system prompt and few-shot messages built here are the prompt prefix
+        whose KV state ``restore_cache`` prepares.
+        """
         # use current python interpreter by default
         server_params = StdioServerParameters(
             command=sys.executable, args=[server_script_path], env=None
         )
 
-        try:
-            logger.debug(f"Setting up stdio transport")
+        logger.debug(f"Setting up stdio transport")
 
-            start_time = time.time()
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            self.stdio, self.write = stdio_transport
-            self.session = await self.exit_stack.enter_async_context(
-                ClientSession(self.stdio, self.write)
-            )
+        start_time = time.time()
+        stdio_transport = await self.exit_stack.enter_async_context(
+            stdio_client(server_params)
+        )
+        self.stdio, self.write = stdio_transport
+        self.session = await self.exit_stack.enter_async_context(
+            ClientSession(self.stdio, self.write)
+        )
 
-            logger.debug(f"Session established, initializing")
+        logger.debug(f"Session established, initializing")
 
-            init_result = await self.session.initialize()
-            self.server_name = init_result.serverInfo.name
+        init_result = await self.session.initialize()
+        self.server_name = init_result.serverInfo.name
 
-            # If the server reports a generic "cli" name, use our utility to get a better name
-            if self.server_name == "cli":
-                from distiller_cm5_python.utils.server_utils import extract_server_name
+        # If the server reports a generic "cli" name, use our utility to get a better name
+        if self.server_name == "cli":
+            from distiller_cm5_python.utils.server_utils import extract_server_name
 
-                self.server_name = extract_server_name(server_script_path)
-                logger.debug(f"Using extracted server name: {self.server_name}")
+            self.server_name = extract_server_name(server_script_path)
+            logger.debug(f"Using extracted server name: {self.server_name}")
 
-            end_time = time.time()
-            logger.debug(f"Server connection completed in {end_time - start_time:.2f}s")
+        end_time = time.time()
+        logger.debug(f"Server connection completed in {end_time - start_time:.2f}s")
 
-            # Initialize tool processor after session is created
-            self.tool_processor = ToolProcessor(self.session)
+        # Initialize tool processor after session is created
+        self.tool_processor = ToolProcessor(self.session)
+        self._configure_tool_limits(server_script_path)
 
-            logger.debug(f"Refreshing tool capabilities")
+        logger.debug(f"Refreshing tool capabilities")
 
-            await self.refresh_capabilities()
+        await self.refresh_capabilities()
 
-            # setup system prompt
-            self.message_processor.set_system_message(
-                self.prompt_processor.generate_system_prompt()
-            )
+        # setup system prompt
+        self.message_processor.set_system_message(
+            self.prompt_processor.generate_system_prompt()
+        )
 
-            # setup sample (few shot) prompts
-            for prompt in self.available_prompts:
-                for message in prompt["messages"]:
-                    if message["role"] in ["user", "assistant"]:
-                        self.message_processor.add_message(
-                            message["role"], message["content"]
-                        )
-                    else:
-                        logger.warning(
-                            f"Few shot injection message role not supported: {message['role']}"
-                        )
+        # setup sample (few shot) prompts
+        for prompt in self.available_prompts:
+            for message in prompt["messages"]:
+                if message["role"] in ["user", "assistant"]:
+                    self.message_processor.add_message(
+                        message["role"], message["content"]
+                    )
+                else:
+                    logger.warning(
+                        f"Few shot injection message role not supported: {message['role']}"
+                    )
+
+    async def connect_to_server(self, server_script_path: str) -> bool:
+        """Connect to an MCP server"""
+
+        if not server_script_path.endswith(".py"):
+            raise UserVisibleError("Server script must be a .py file")
+
+        try:
+            await self.open_session(server_script_path)
 
             # enable cache restore if provider is llama-cpp
             if self.llm_provider.provider_type == "llama-cpp":
@@ -263,14 +288,93 @@ class MCPClient:
             logger.warning(f"Failed to get prompts: {e}")
             self.available_prompts = []
 
+    def _configure_tool_limits(self, server_script_path: str):
+        """Apply the tool concurrency and timeout configured for this server script."""
+        script_name = os.path.splitext(os.path.basename(server_script_path))[0]
+        limits = TOOL_LIMITS.get(script_name, {})
+        self.tool_concurrency = max(
+            1, int(limits.get("tool_concurrency", TOOL_CONCURRENCY))
+        )
+        self.tool_timeout = limits.get("tool_timeout", TOOL_TIMEOUT)
+        self._tool_semaphore = asyncio.Semaphore(self.tool_concurrency)
+        logger.debug(
+            f"Tool calls to {script_name}: {self.tool_concurrency} at a time, "
+            f"timeout {self.tool_timeout}s"
+        )
+
+    async def _call_tool(self, tool_call: Dict[str, Any]) -> Any:
+        """Execute a tool call within the server's concurrency limit and timeout.
+
+        The timeout starts once the call holds a slot; on expiry the call is
+        cancelled and asyncio.TimeoutError raised.
+        """
+        if self._tool_semaphore is None:
+            self._tool_semaphore = asyncio.Semaphore(self.tool_concurrency)
+        async with self._tool_semaphore:
+            return await asyncio.wait_for(
+                self.tool_processor.execute_tool_call_async(tool_call),
+                timeout=self.tool_timeout or None,
+            )
+
+    def _start_tool_call(self, tool_call: Dict[str, Any]):
+        """Start a tool call detected in the stream while the model keeps generating.
+
+        Only calls with well-formed arguments are started; ``_execute_tool_calls``
+        awaits the started task instead of running the call again.
+        """
+        if self.tool_processor is None or not tool_call.get("id"):
+            return
+        raw_tool_args = tool_call.get("function", {}).get("arguments", "{}")
+        if isinstance(raw_tool_args, str) and raw_tool_args.strip():
+            try:
+                json.loads(raw_tool_args)
+            except json.JSONDecodeError:
+                return
+        elif not isinstance(raw_tool_args, (str, dict)):
+            return
+        tool_name = tool_call.get("function", {}).get("name", "unknown")
+        logger.info(f"Starting tool {tool_name} while the response is streaming")
+        task = asyncio.create_task(self._call_tool(tool_call))
+        self._early_tool_tasks[tool_call["id"]] = (tool_call, task)
+
+    async def _run_tool_call(self, tool_call: Dict[str, Any]) -> Any:
+        """Run a tool call, reusing the task started during streaming if any."""
+        early = self._early_tool_tasks.pop(tool_call.get("id", ""), None)
+        if early is not None:
+            started_call, task = early
+            if started_call.get("function") == tool_call.get("function"):
+                return await task
+            # The final call differs from the streamed one, run it again
+            task.cancel()
+        return await self._call_tool(tool_call)
+
+    def _cancel_early_tool_calls(self):
+        """Cancel tool calls started during streaming that were not used."""
+        for tool_call, task in self._early_tool_tasks.values():
+            if not task.done():
+                logger.info(
+                    f"Cancelling unused tool call {tool_call.get('id', 'N/A')}"
+                )
+                task.cancel()
+        self._early_tool_tasks.clear()
+
     async def _execute_tool_calls(self, tool_calls: List[Dict[str, Any]]) -> None:
-        """Helper method to execute tool calls and add results to history."""
+        """Execute the tool calls of one LLM turn and add their results to history.
+
+        The calls run concurrently, at most ``tool_concurrency`` at a time and
+        each with its own timeout, so a turn takes as long as its slowest tool.
+        All calls are recorded on the assistant message first and the results
+        added in call order, so the next prompt does not depend on which tool
+        finished first.
+        """
         if not tool_calls:
             return
 
         logger.info(f"Found {len(tool_calls)} tool calls to execute")
+        results = []
+        # Index in tool_calls -> running execution
+        runs: Dict[int, Any] = {}
         for i, tool_call in enumerate(tool_calls):
-            logger.info(f"Executing tool call {i + 1}/{len(tool_calls)}")
             tool_result_content = "Error: Tool call execution failed."
 
             # Create action event for tool execution start
@@ -324,60 +428,27 @@ class MCPClient:
 
             # Only attempt execution if JSON parsing succeeded
             if not parsing_failed:
-                try:
-                    if not isinstance(tool_call, dict) or "function" not in tool_call:
-                        error_msg = f"Invalid tool call format: {tool_call}"
-                        logger.error(error_msg)
-                        tool_result_content = error_msg
-
-                        # Dispatch error event
-                        error_event = ActionEvent(
-                            type=EventType.ERROR,
-                            content=error_msg,
-                            status=StatusType.FAILED,
-                            tool_name=tool_name,
-                            data={"tool_call": tool_call},
-                        )
-                        self.dispatcher.dispatch(error_event)
-                    else:
-                        self.message_processor.add_tool_call(
-                            tool_call
-                        )  # Add the call attempt
-                        tool_result_content = (
-                            await self.tool_processor.execute_tool_call_async(tool_call)
-                        )
-                        logger.info(f"Executed tool name: {tool_call.get('id', 'N/A')}")
-                        logger.info(f"Executed tool result: {tool_result_content}")
-
-                        # Dispatch success event
-                        result_event = ActionEvent(
-                            type=EventType.ACTION,
-                            content=f"Tool result: {tool_result_content}",
-                            status=StatusType.SUCCESS,
-                            tool_name=tool_name,
-                            tool_args=parsed_tool_args,  # Use the parsed dictionary here too
-                            data={
-                                "tool_call": tool_call,
-                                "result": tool_result_content,
-                            },
-                        )
-                        self.dispatcher.dispatch(result_event)
-
-                except Exception as e:
-                    error_msg = f"Error executing tool call {tool_call.get('function',{}).get('name', 'N/A')}: {e}"
-                    logger.error(f"{error_msg}")
-                    tool_result_content = error_msg  # Store error as result
+                if not isinstance(tool_call, dict) or "function" not in tool_call:
+                    error_msg = f"Invalid tool call format: {tool_call}"
+                    logger.error(error_msg)
+                    tool_result_content = error_msg
 
-                    # Dispatch error event for execution failure
+                    # Dispatch error event
                     error_event = ActionEvent(
                         type=EventType.ERROR,
                         content=error_msg,
                         status=StatusType.FAILED,
                         tool_name=tool_name,
-                        tool_args=parsed_tool_args,  # Include parsed args even on error
-                        data={"tool_call": tool_call, "error": str(e)},
+                        data={"tool_call": tool_call},
                     )
                     self.dispatcher.dispatch(error_event)
+                else:
+                    self.message_processor.add_tool_call(
+                        tool_call
+                    )  # Add the call attempt
+                    runs[i] = self._execute_tool_call(
+                        tool_call, tool_name, parsed_tool_args
+                    )
             else:  # Parsing failed case
                 # Dispatch error event specific to parsing failure
                 error_event = ActionEvent(
@@ -392,13 +463,68 @@ class MCPClient:
                     data={"tool_call": tool_call, "error": "JSONDecodeError"},
                 )
                 self.dispatcher.dispatch(error_event)
+            results.append(tool_result_content)
+
+        if runs:
+            start_time = time.time()
+            for i, tool_result_content in zip(runs, await asyncio.gather(*runs.values())):
+                results[i] = tool_result_content
+            logger.info(
+                f"Executed {len(runs)} tool calls in {time.time() - start_time:.2f}s"
+            )
 
-            # Add the tool call result (success, execution error, or parsing error) to the message history
-            # This now correctly uses the tool_result_content set in the JSONDecodeError block if parsing failed
+        # Add the tool call results (success, execution error, or parsing error)
+        # to the message history, in call order
+        for tool_call, tool_result_content in zip(tool_calls, results):
             self.message_processor.add_tool_result(
                 tool_call, tool_result_content  # Pass the original tool_call dict
             )
 
+        self._cancel_early_tool_calls()
+
+    async def _execute_tool_call(
+        self, tool_call: Dict[str, Any], tool_name: str, parsed_tool_args: Dict[str, Any]
+    ) -> str:
+        """Execute one tool call, dispatching its result; errors become the result."""
+        try:
+            tool_result_content = await self._run_tool_call(tool_call)
+            logger.info(f"Executed tool name: {tool_call.get('id', 'N/A')}")
+            logger.info(f"Executed tool result: {tool_result_content}")
+
+            # Dispatch success event
+            result_event = ActionEvent(
+                type=EventType.ACTION,
+                content=f"Tool result: {tool_result_content}",
+                status=StatusType.SUCCESS,
+                tool_name=tool_name,
+                tool_args=parsed_tool_args,  # Use the parsed dictionary here too
+                data={
+                    "tool_call": tool_call,
+                    "result": tool_result_content,
+                },
+            )
+            self.dispatcher.dispatch(result_event)
+            return tool_result_content
+
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                error_msg = f"Error executing tool call {tool_name}: timed out after {self.tool_timeout}s"
+            else:
+                error_msg = f"Error executing tool call {tool_call.get('function',{}).get('name', 'N/A')}: {e}"
+            logger.error(f"{error_msg}")
+
+            # Dispatch error event for execution failure
+            error_event = ActionEvent(
+                type=EventType.ERROR,
+                content=error_msg,
+                status=StatusType.FAILED,
+                tool_name=tool_name,
+                tool_args=parsed_tool_args,  # Include parsed args even on error
+                data={"tool_call": tool_call, "error": str(e) or error_msg},
+            )
+            self.dispatcher.dispatch(error_event)
+            return error_msg  # Store error as result
+
     async def process_query(self, query: str) -> Dict[str, Any]:
         """Process a query through the LLM client.
 
@@ -443,6 +569,7 @@ class MCPClient:
                             messages=messages,
                             tools=self.available_tools,
                             dispatcher=self.dispatcher,
+                            on_tool_call=self._start_tool_call,
                         )
                     else:
                         # Non-streaming
@@ -459,6 +586,7 @@ class MCPClient:
                         )
 
                 except LogOnlyError as e:
+                    self._cancel_early_tool_calls()
                     # Create proper error message in case of streaming failure
                     error_event = MessageEvent(
                         type=EventType.ERROR,
@@ -494,6 +622,7 @@ class MCPClient:
                 # Extract tool calls
                 tool_calls = (response or {}).get("message", {}).get("tool_calls", [])
                 if not tool_calls:
+                    self._cancel_early_tool_calls()
                     break
 
                 # Create and dispatch info event for tool execution
@@ -537,6 +666,7 @@ class MCPClient:
             logger.error(f"Error during streaming: {e}")
             raise
         except Exception as e:
+            self._cancel_early_tool_calls()
             # Handle unexpected errors by dispatching an error event
             error_event = MessageEvent(
                 type=EventType.ERROR,
@@ -597,6 +727,12 @@ class MCPClient:
             await self._safe_aclose_exit_stack()
             self._exit_stack = None
 
+        # Close the LLM client's keep-alive connections on this loop
+        try:
+            await self.llm_provider.close()
+        except Exception as e:
+            logger.error(f"Error closing LLM client session: {e}", exc_info=True)
+
         logger.info("MCP client cleanup completed")
 
     def _cancel_all_running_tasks(self):
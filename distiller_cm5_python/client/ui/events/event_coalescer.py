@@ -0,0 +1,109 @@
+"""
+Time-budgeted coalescing of streamed content events.
+
+Every dispatched MessageSchema emits a Qt signal, is converted with
+``dict()`` by the bridge and makes the UI re-join all chunks of the message.
+Streams deliver tens of deltas per second, more than a CLI reader or an
+e-ink panel can show. The EventCoalescer sits between LLMClient and the
+EventDispatcher: content deltas of one message are joined and dispatched as
+one IN_PROGRESS event per interval. The first delta of a message goes out at
+once, and any other event, e.g. the switch to a tool call or the end of
+the stream, first flushes the pending content so the order of events is kept.
+"""
+
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from distiller_cm5_python.client.ui.events.event_dispatcher import EventDispatcher
+from distiller_cm5_python.client.ui.events.event_types import (
+    EventType,
+    MessageSchema,
+    StatusType,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class EventCoalescer:
+    """Batches content deltas of one message into one event per interval."""
+
+    def __init__(self, dispatcher: Optional[EventDispatcher], interval: float = 0.04):
+        """Initialize the coalescer.
+
+        Args:
+            dispatcher: Dispatcher receiving the events; None drops them.
+            interval: Seconds between content events of one message, 0 sends
+                every delta as its own event.
+        """
+        self.dispatcher = dispatcher
+        self.interval = interval
+        self._pending: List[str] = []
+        self._pending_id: Optional[str] = None
+        self._pending_type: Optional[EventType] = None
+        # Message whose content was dispatched last, and when
+        self._last_id: Optional[str] = None
+        self._last_flush = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.dispatched = 0
+        self.coalesced = 0
+
+    def add_content(self, event_id: str, event_type: EventType, content: str):
+        """Queue a content delta, dispatching it now if its interval has passed."""
+        if self.dispatcher is None:
+            return
+        if event_id != self._pending_id or event_type != self._pending_type:
+            self.flush()
+            self._pending_id = event_id
+            self._pending_type = event_type
+        self._pending.append(content)
+        self.coalesced += 1
+        now = time.monotonic()
+        if event_id != self._last_id or now - self._last_flush >= self.interval:
+            self.flush()
+        elif self._timer is None:
+            self._schedule_flush(self.interval - (now - self._last_flush))
+
+    def dispatch(self, event: MessageSchema):
+        """Dispatch any other event, after the pending content."""
+        self.flush()
+        if self.dispatcher is not None:
+            self.dispatcher.dispatch(event)
+
+    def flush(self):
+        """Dispatch the pending content now."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending or self.dispatcher is None:
+            return
+        content = "".join(self._pending)
+        self._pending = []
+        self._last_id = self._pending_id
+        self._last_flush = time.monotonic()
+        self.dispatched += 1
+        self.dispatcher.dispatch(
+            MessageSchema(
+                id=self._pending_id,
+                type=self._pending_type,
+                content=content,
+                status=StatusType.IN_PROGRESS,
+            )
+        )
+
+    def close(self):
+        """Flush the pending content and log how much was coalesced."""
+        self.flush()
+        if self.coalesced:
+            logger.debug(
+                f"Coalesced {self.coalesced} content deltas into {self.dispatched} events"
+            )
+
+    def _schedule_flush(self, delay: float):
+        # A stalled stream still shows its pending content
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._timer = loop.call_later(max(0.0, delay), self.flush)
@@ -0,0 +1,186 @@
+"""
+Thread and batch auto-tuning for the LLM server.
+
+Prefill and decode speed on the CM5 depend on ``n_threads`` (decode),
+``n_threads_batch`` (prefill) and ``n_batch``, and the best values differ
+between board revisions and cooling setups. ``autotune`` runs a short
+micro-benchmark on a loaded model:
+
+- decode: single token evaluations for each ``n_threads`` candidate,
+- prefill: a fixed prompt for each ``n_threads_batch`` x ``n_batch`` pair,
+
+and returns the fastest settings. All of them can change on a loaded model,
+so tuning needs no reloads. Profiles are kept per model file and CPU in an
+AutotuneProfiles JSON file and applied to later loads.
+"""
+
+import functools
+import json
+import logging
+import os
+import platform
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from distiller_cm5_python.llm_server.memory_planner import usable_cpu_count
+
+logger = logging.getLogger(__name__)
+
+PROFILES_VERSION = 1
+
+PREFILL_TOKENS = 256
+DECODE_TOKENS = 16
+BATCH_SIZES = (128, 256, 512)
+
+
+@functools.lru_cache(maxsize=None)
+def cpu_signature() -> str:
+    """CPU model and usable core count, profiles are only valid on matching CPUs."""
+    model = ""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                # "model name" on x86, "Model" (the board) on Raspberry Pi
+                if key.strip() in ("model name", "Model") and value.strip():
+                    model = value.strip()
+                    if key.strip() == "Model":
+                        break
+    except OSError:
+        pass
+    return f"{model or platform.machine()} x{usable_cpu_count()}"
+
+
+def thread_candidates(cpus: int) -> List[int]:
+    """Thread counts worth trying: all cores, one spare, and half."""
+    return sorted({cpus, max(1, cpus - 1), max(1, cpus // 2)}, reverse=True)
+
+
+def _benchmark_tokens(model: Any, n_tokens: int) -> List[int]:
+    text = "The quick brown fox jumps over the lazy dog. " * (n_tokens // 8 + 1)
+    tokens = model.tokenize(text.encode("utf-8"), add_bos=False)
+    return tokens[:n_tokens]
+
+
+def _time_prefill(model: Any, tokens: Sequence[int]) -> float:
+    model.reset()
+    started = time.perf_counter()
+    model.eval(tokens)
+    return len(tokens) / (time.perf_counter() - started)
+
+
+def _time_decode(model: Any, tokens: Sequence[int], context: Sequence[int]) -> float:
+    model.reset()
+    model.eval(context)
+    started = time.perf_counter()
+    for token in tokens:
+        model.eval([token])
+    return len(tokens) / (time.perf_counter() - started)
+
+
+def autotune(
+    model: Any,
+    prefill_tokens: int = PREFILL_TOKENS,
+    decode_tokens: int = DECODE_TOKENS,
+) -> Dict[str, Any]:
+    """Benchmark a loaded llama_cpp.Llama and apply the fastest settings to it.
+
+    Returns:
+        The profile: ``n_threads``, ``n_threads_batch`` and ``n_batch`` with
+        the measured ``prefill_tps`` and ``decode_tps``.
+    """
+    # The context was created with the largest batch it accepts
+    max_batch = model.n_batch
+    batch_sizes = [b for b in BATCH_SIZES if b < max_batch] + [max_batch]
+    prefill_tokens = min(prefill_tokens, model.n_ctx() - decode_tokens - 1)
+    prompt = _benchmark_tokens(model, prefill_tokens + decode_tokens)
+    context, decode = prompt[:-decode_tokens], prompt[-decode_tokens:]
+
+    threads = thread_candidates(usable_cpu_count())
+    # Warm up page cache and thread pools before the first measurement
+    model._ctx.set_n_threads(threads[0], threads[0])
+    _time_decode(model, decode[:2], context[:8])
+
+    best_decode = (0.0, threads[0])
+    for n_threads in threads:
+        model._ctx.set_n_threads(n_threads, n_threads)
+        tps = _time_decode(model, decode, context[:32])
+        logger.info(f"Autotune decode n_threads={n_threads}: {tps:.2f} tokens/s")
+        best_decode = max(best_decode, (tps, n_threads))
+
+    best_prefill = (0.0, threads[0], max_batch)
+    for n_threads_batch in threads:
+        model._ctx.set_n_threads(best_decode[1], n_threads_batch)
+        for n_batch in batch_sizes:
+            model.n_batch = n_batch
+            tps = _time_prefill(model, context)
+            logger.info(
+                f"Autotune prefill n_threads_batch={n_threads_batch} "
+                f"n_batch={n_batch}: {tps:.1f} tokens/s"
+            )
+            best_prefill = max(best_prefill, (tps, n_threads_batch, n_batch))
+    model.reset()
+
+    profile = {
+        "n_threads": best_decode[1],
+        "n_threads_batch": best_prefill[1],
+        "n_batch": best_prefill[2],
+        "decode_tps": round(best_decode[0], 2),
+        "prefill_tps": round(best_prefill[0], 1),
+    }
+    apply_profile(model, profile)
+    return profile
+
+
+def apply_profile(model: Any, profile: Dict[str, Any]):
+    """Use a profile's threads and batch size on a loaded model."""
+    model._ctx.set_n_threads(profile["n_threads"], profile["n_threads_batch"])
+    model.context_params.n_threads = profile["n_threads"]
+    model.context_params.n_threads_batch = profile["n_threads_batch"]
+    model.n_threads = profile["n_threads"]
+    model.n_threads_batch = profile["n_threads_batch"]
+    # Python side batching; the context keeps the batch size it was created with
+    model.n_batch = min(profile["n_batch"], model.context_params.n_batch)
+
+
+class AutotuneProfiles:
+    """Tuned settings per model file and CPU, persisted as JSON."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._profiles: Optional[Dict[str, Dict[str, Any]]] = None
+
+    @staticmethod
+    def key(model_name: str, model_fingerprint: str, cpu: str) -> str:
+        return f"{model_name}|{model_fingerprint}|{cpu}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._entries().get(key)
+
+    def put(self, key: str, profile: Dict[str, Any]):
+        self._entries()[key] = dict(profile, tuned_at=time.time())
+        self._save()
+
+    def _entries(self) -> Dict[str, Dict[str, Any]]:
+        if self._profiles is None:
+            self._profiles = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path) as f:
+                        data = json.load(f)
+                    if data.get("version") == PROFILES_VERSION:
+                        self._profiles = dict(data["profiles"])
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Ignoring unreadable autotune profiles {self.path}: {e}")
+        return self._profiles
+
+    def _save(self):
+        data = {"version": PROFILES_VERSION, "profiles": self._profiles}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save autotune profiles {self.path}: {e}")
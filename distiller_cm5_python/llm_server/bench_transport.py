@@ -0,0 +1,182 @@
+"""
+Streaming latency of the LLM server transports: TCP loopback vs UNIX socket.
+
+Starts a minimal uvicorn app in a child process, once on 127.0.0.1 and once
+on a UNIX domain socket, streams SSE frames shaped like the server's compact
+frames, and measures for every frame the time from the server yielding it to
+the client parsing it. Frames are paced like generated tokens by default.
+
+    python -m distiller_cm5_python.llm_server.bench_transport --frames 2000
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+import aiohttp
+
+
+def _make_app():
+    from fastapi import FastAPI
+    from fastapi.responses import StreamingResponse
+
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/stream")
+    async def stream(frames: int, interval_ms: float):
+        async def events():
+            for i in range(frames):
+                # CLOCK_MONOTONIC is shared by both processes
+                payload = {"c": " token", "i": i, "ts": time.monotonic_ns()}
+                yield b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n"
+                await asyncio.sleep(interval_ms / 1000)
+            yield b"data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def _serve(host: str, port: int, uds: str):
+    import uvicorn
+
+    if uds:
+        uvicorn.run(_make_app(), uds=uds, log_level="warning")
+    else:
+        uvicorn.run(_make_app(), host=host, port=port, log_level="warning")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_up(base_url: str, connector_factory, timeout: float = 15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with aiohttp.ClientSession(connector=connector_factory()) as session:
+                async with session.get(f"{base_url}/health") as response:
+                    if response.status == 200:
+                        return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"Benchmark server did not start within {timeout}s")
+
+
+async def _measure(
+    base_url: str, connector_factory, frames: int, interval_ms: float
+) -> Dict[str, float]:
+    latencies: List[float] = []
+    async with aiohttp.ClientSession(connector=connector_factory()) as session:
+        started = time.monotonic()
+        async with session.get(
+            f"{base_url}/stream",
+            params={"frames": frames, "interval_ms": interval_ms},
+        ) as response:
+            async for line in response.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:") :].strip()
+                if data == b"[DONE]":
+                    break
+                sent_ns = json.loads(data)["ts"]
+                latencies.append((time.monotonic_ns() - sent_ns) / 1000)
+        elapsed = time.monotonic() - started
+    latencies.sort()
+    return {
+        "frames": len(latencies),
+        "mean_us": statistics.fmean(latencies),
+        "p50_us": latencies[len(latencies) // 2],
+        "p95_us": latencies[int(len(latencies) * 0.95)],
+        "p99_us": latencies[int(len(latencies) * 0.99)],
+        "frames_per_s": len(latencies) / elapsed,
+    }
+
+
+def run_transport(transport: str, frames: int, interval_ms: float) -> Dict[str, float]:
+    """Benchmark one transport, "tcp" or "uds", in a fresh server process."""
+    with tempfile.TemporaryDirectory() as tmp:
+        if transport == "uds":
+            uds = os.path.join(tmp, "llm.sock")
+            base_url = "http://localhost"
+            args = ("", 0, uds)
+
+            def connector_factory():
+                return aiohttp.UnixConnector(path=uds)
+
+        else:
+            port = _free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            args = ("127.0.0.1", port, "")
+
+            def connector_factory():
+                return aiohttp.TCPConnector()
+
+        process = multiprocessing.Process(target=_serve, args=args, daemon=True)
+        process.start()
+        try:
+
+            async def run():
+                await _wait_up(base_url, connector_factory)
+                # One short warmup stream, then the measured one
+                await _measure(base_url, connector_factory, min(frames, 50), interval_ms)
+                return await _measure(base_url, connector_factory, frames, interval_ms)
+
+            return asyncio.run(run())
+        finally:
+            process.terminate()
+            process.join(5)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare SSE streaming latency over TCP loopback and a UNIX socket"
+    )
+    parser.add_argument("--frames", type=int, default=1000, help="Frames per stream")
+    parser.add_argument(
+        "--interval_ms",
+        type=float,
+        default=2.0,
+        help="Pause between frames, like token generation (0 streams back to back)",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Print the results as JSON"
+    )
+    args = parser.parse_args()
+
+    results = {
+        transport: run_transport(transport, args.frames, args.interval_ms)
+        for transport in ("tcp", "uds")
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(
+        f"{'transport':<10} {'mean us':>9} {'p50 us':>9} {'p95 us':>9} "
+        f"{'p99 us':>9} {'frames/s':>10}"
+    )
+    for transport, result in results.items():
+        print(
+            f"{transport:<10} {result['mean_us']:>9.1f} {result['p50_us']:>9.1f} "
+            f"{result['p95_us']:>9.1f} {result['p99_us']:>9.1f} "
+            f"{result['frames_per_s']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
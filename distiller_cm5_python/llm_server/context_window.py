@@ -0,0 +1,259 @@
+"""
+Context window fitting for the LLM server.
+
+When a conversation outgrows ``n_ctx`` llama rejects the request after the
+client has already paid for the round trip, and the conversation cannot
+continue. The ContextFitter counts the rendered prompt before generation and
+applies a chain of policies until it fits:
+
+- ``truncate_tool_outputs``: shortens long tool results to their head and
+  tail, older turns first.
+- ``drop_oldest``: removes the oldest turns after the system message.
+- ``summarize``: like ``drop_oldest``, but adds a summary of the removed
+  turns as a system message after the system prompt.
+
+Turns are removed in steps of ``drop_step`` so consecutive requests of a
+growing conversation keep the same prefix, and with it their cached KV state,
+instead of shifting by one turn every time. A SummaryCache keeps that prefix
+stable in ``summarize`` mode too, by reusing the summary of the same removed
+turns. What was changed is returned as a report for the response.
+"""
+
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_POLICIES = ("truncate_tool_outputs", "drop_oldest", "summarize")
+DEFAULT_CONTEXT_POLICY = ("truncate_tool_outputs", "drop_oldest")
+
+Messages = List[Dict[str, Any]]
+
+
+class ContextWindowExceeded(ValueError):
+    """The prompt does not fit the context window even after fitting.
+
+    The message keeps llama's wording, which clients already recognize.
+    """
+
+    def __init__(self, requested: int, n_ctx: int):
+        super().__init__(
+            f"Requested tokens ({requested}) exceed context window of {n_ctx}"
+        )
+        self.requested = requested
+        self.n_ctx = n_ctx
+
+
+def parse_context_policy(policy: Union[str, Sequence[str], None]) -> Tuple[str, ...]:
+    """Normalize a policy given as a list or a comma separated string.
+
+    "none" or an empty policy disables fitting.
+    """
+    if policy is None:
+        return DEFAULT_CONTEXT_POLICY
+    steps = policy.split(",") if isinstance(policy, str) else policy
+    steps = tuple(step.strip() for step in steps if step.strip() not in ("", "none"))
+    unknown = [step for step in steps if step not in CONTEXT_POLICIES]
+    if unknown:
+        raise ValueError(
+            f"Unsupported context policy {', '.join(unknown)}, "
+            f"use any of {', '.join(CONTEXT_POLICIES)} or none"
+        )
+    return steps
+
+
+def _turns(messages: Messages) -> Tuple[Messages, List[Messages]]:
+    """Split into the leading system messages and turns starting at user messages."""
+    start = 0
+    while start < len(messages) and messages[start]["role"] == "system":
+        start += 1
+    turns: List[Messages] = []
+    for message in messages[start:]:
+        if not turns or message["role"] == "user":
+            turns.append([])
+        turns[-1].append(message)
+    return messages[:start], turns
+
+
+class SummaryCache:
+    """Summaries of removed messages by their content, least recently used evicted."""
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+
+    @staticmethod
+    def key(messages: Messages, max_tokens: int) -> str:
+        encoded = json.dumps(
+            [messages, max_tokens], sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        summary = self._summaries.get(key)
+        if summary is not None:
+            self._summaries.move_to_end(key)
+        return summary
+
+    def put(self, key: str, summary: str):
+        self._summaries[key] = summary
+        self._summaries.move_to_end(key)
+        while len(self._summaries) > self.max_entries:
+            self._summaries.popitem(last=False)
+
+    def clear(self):
+        self._summaries.clear()
+
+
+class ContextFitter:
+    """Fits chat messages into a token budget."""
+
+    def __init__(
+        self,
+        count_tokens: Callable[[Messages], int],
+        n_ctx: int,
+        reserve: int = 256,
+        policy: Sequence[str] = DEFAULT_CONTEXT_POLICY,
+        summarize: Optional[Callable[[Messages, int], str]] = None,
+        tool_output_chars: int = 2000,
+        drop_step: int = 2,
+        summary_tokens: int = 256,
+    ):
+        """Initialize the fitter.
+
+        Args:
+            count_tokens: Returns the prompt length of a message list.
+            n_ctx: Context window of the model.
+            reserve: Tokens kept free for the reply.
+            policy: Policies to apply in order, see CONTEXT_POLICIES.
+            summarize: Summarizes removed messages in at most the given number
+                of tokens, required by ``summarize``.
+            tool_output_chars: Length tool results are truncated to.
+            drop_step: Number of turns removed at a time.
+            summary_tokens: Room left for the summary when choosing what to
+                remove, and the summary's length limit.
+        """
+        if "summarize" in policy and summarize is None:
+            raise ValueError("context policy 'summarize' requires a summarize function")
+        self.count_tokens = count_tokens
+        self.n_ctx = n_ctx
+        self.budget = n_ctx - reserve
+        self.policy = tuple(policy)
+        self.summarize = summarize
+        self.tool_output_chars = tool_output_chars
+        self.drop_step = max(1, drop_step)
+        self.summary_tokens = summary_tokens
+
+    def fit(self, messages: Messages) -> Tuple[Messages, Dict[str, Any]]:
+        """Return messages that fit the budget and a report of what changed.
+
+        The report is empty when nothing had to change.
+
+        Raises:
+            ContextWindowExceeded: If the prompt cannot be made to fit.
+        """
+        tokens = self.count_tokens(messages)
+        if tokens <= self.budget:
+            return messages, {}
+        report: Dict[str, Any] = {
+            "n_ctx": self.n_ctx,
+            "prompt_tokens_before": tokens,
+            "truncated_tool_outputs": 0,
+            "dropped_messages": 0,
+            "summarized_messages": 0,
+        }
+        for step in self.policy:
+            if step == "truncate_tool_outputs":
+                messages, tokens = self._truncate_tool_outputs(messages, report)
+            else:
+                messages, tokens = self._drop_oldest(
+                    messages, report, summarize=step == "summarize"
+                )
+            if tokens <= self.budget:
+                report["prompt_tokens"] = tokens
+                logger.info(f"Prompt fitted into the context window: {report}")
+                return messages, report
+        raise ContextWindowExceeded(tokens, self.n_ctx)
+
+    def _truncate(self, content: str) -> str:
+        half = self.tool_output_chars // 2
+        omitted = len(content) - 2 * half
+        return f"{content[:half]}\n[... {omitted} characters omitted ...]\n{content[-half:]}"
+
+    def _truncate_tool_outputs(
+        self, messages: Messages, report: Dict[str, Any]
+    ) -> Tuple[Messages, int]:
+        # Older turns first; the current turn's results are what the reply needs
+        head, turns = _turns(messages)
+        tokens = self.count_tokens(messages)
+        for i in range(len(turns)):
+            turn = turns[i]
+            truncated = [
+                dict(m, content=self._truncate(m["content"]))
+                if m["role"] == "tool"
+                and isinstance(m.get("content"), str)
+                and len(m["content"]) > self.tool_output_chars
+                else m
+                for m in turn
+            ]
+            changed = sum(a is not b for a, b in zip(turn, truncated))
+            if not changed:
+                continue
+            turns[i] = truncated
+            report["truncated_tool_outputs"] += changed
+            messages = head + [m for t in turns for m in t]
+            tokens = self.count_tokens(messages)
+            if tokens <= self.budget:
+                break
+        return messages, tokens
+
+    def _drop_oldest(
+        self, messages: Messages, report: Dict[str, Any], summarize: bool
+    ) -> Tuple[Messages, int]:
+        head, turns = _turns(messages)
+        # The latest turn holds the request being answered and is always kept
+        droppable = len(turns) - 1
+        if droppable <= 0:
+            return messages, self.count_tokens(messages)
+        budget = self.budget - (self.summary_tokens if summarize else 0)
+
+        def kept(k: int) -> Messages:
+            return [m for t in turns[k:] for m in t]
+
+        # Smallest number of removed turns that fits, rounded up to drop_step
+        low, high = 1, droppable
+        while low < high:
+            mid = (low + high) // 2
+            if self.count_tokens(head + kept(mid)) <= budget:
+                high = mid
+            else:
+                low = mid + 1
+        k = min(droppable, -(-low // self.drop_step) * self.drop_step)
+        if summarize:
+            # Summarized once, at the drop point that left room for the summary
+            summarized = [m for t in turns[:k] for m in t]
+            head = self._with_summary(head, summarized)
+            report["summarized_messages"] += len(summarized)
+        fitted = head + kept(k)
+        tokens = self.count_tokens(fitted)
+        # The summary came out longer than its room; more turns go, unsummarized
+        while summarize and tokens > self.budget and k < droppable:
+            k = min(droppable, k + self.drop_step)
+            fitted = head + kept(k)
+            tokens = self.count_tokens(fitted)
+        report["dropped_messages"] += sum(len(t) for t in turns[:k])
+        return fitted, tokens
+
+    def _with_summary(self, head: Messages, dropped: Messages) -> Messages:
+        # A message of its own: appended to the system prompt, the summary
+        # would change the prompt's head whenever it changes
+        summary = self.summarize(dropped, self.summary_tokens)
+        return head + [
+            {
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{summary}",
+            }
+        ]
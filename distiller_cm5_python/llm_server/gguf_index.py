@@ -0,0 +1,418 @@
+"""
+GGUF metadata index for the LLM server.
+
+Learning a model's context length, quantization or chat template used to
+require loading it, which takes seconds per file on the CM5. This module reads
+only the GGUF header (metadata key/values and tensor descriptors, not the
+weights) through mmap, and keeps the results in an index keyed by file size
+and mtime, persisted across restarts, so listing models costs a stat per file.
+
+Large metadata arrays such as the vocabulary are skipped and recorded by
+length only.
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GGUF_MAGIC = b"GGUF"
+
+# Bump when the extracted summary changes so persisted entries are rebuilt
+INDEX_VERSION = 1
+
+# GGUF metadata value types
+_UINT8, _INT8, _UINT16, _INT16, _UINT32, _INT32, _FLOAT32, _BOOL = range(8)
+_STRING, _ARRAY, _UINT64, _INT64, _FLOAT64 = range(8, 13)
+
+_SCALAR_FORMATS = {
+    _UINT8: "<B",
+    _INT8: "<b",
+    _UINT16: "<H",
+    _INT16: "<h",
+    _UINT32: "<I",
+    _INT32: "<i",
+    _FLOAT32: "<f",
+    _BOOL: "<?",
+    _UINT64: "<Q",
+    _INT64: "<q",
+    _FLOAT64: "<d",
+}
+_SCALAR_SIZES = {t: struct.calcsize(f) for t, f in _SCALAR_FORMATS.items()}
+
+# Arrays longer than this are recorded by their length only
+_MAX_ARRAY_VALUES = 64
+
+# llama_ftype values of general.file_type
+FILE_TYPES = {
+    0: "F32",
+    1: "F16",
+    2: "Q4_0",
+    3: "Q4_1",
+    7: "Q8_0",
+    8: "Q5_0",
+    9: "Q5_1",
+    10: "Q2_K",
+    11: "Q3_K_S",
+    12: "Q3_K_M",
+    13: "Q3_K_L",
+    14: "Q4_K_S",
+    15: "Q4_K_M",
+    16: "Q5_K_S",
+    17: "Q5_K_M",
+    18: "Q6_K",
+    19: "IQ2_XXS",
+    20: "IQ2_XS",
+    21: "Q2_K_S",
+    22: "IQ3_XS",
+    23: "IQ3_XXS",
+    24: "IQ1_S",
+    25: "IQ4_NL",
+    26: "IQ3_S",
+    27: "IQ3_M",
+    28: "IQ2_S",
+    29: "IQ2_M",
+    30: "IQ4_XS",
+    31: "IQ1_M",
+    32: "BF16",
+    36: "TQ1_0",
+    37: "TQ2_0",
+}
+
+# ggml_type values of tensor descriptors
+TENSOR_TYPES = {
+    0: "F32",
+    1: "F16",
+    2: "Q4_0",
+    3: "Q4_1",
+    6: "Q5_0",
+    7: "Q5_1",
+    8: "Q8_0",
+    9: "Q8_1",
+    10: "Q2_K",
+    11: "Q3_K",
+    12: "Q4_K",
+    13: "Q5_K",
+    14: "Q6_K",
+    15: "Q8_K",
+    16: "IQ2_XXS",
+    17: "IQ2_XS",
+    18: "IQ3_XXS",
+    19: "IQ1_S",
+    20: "IQ4_NL",
+    21: "IQ3_S",
+    22: "IQ2_S",
+    23: "IQ4_XS",
+    24: "I8",
+    25: "I16",
+    26: "I32",
+    27: "I64",
+    28: "F64",
+    29: "IQ1_M",
+    30: "BF16",
+    34: "TQ1_0",
+    35: "TQ2_0",
+}
+
+
+class GGUFFormatError(ValueError):
+    """The file is not a GGUF file this reader understands."""
+
+
+class _Reader:
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.offset = 0
+
+    def scalar(self, value_type: int):
+        fmt = _SCALAR_FORMATS[value_type]
+        (value,) = struct.unpack_from(fmt, self.buffer, self.offset)
+        self.offset += _SCALAR_SIZES[value_type]
+        return value
+
+    def string(self) -> str:
+        length = self.scalar(_UINT64)
+        start = self.offset
+        self.offset += length
+        return bytes(self.buffer[start : self.offset]).decode("utf-8", errors="replace")
+
+    def skip_string(self):
+        length = self.scalar(_UINT64)
+        self.offset += length
+
+    def value(self, value_type: int):
+        if value_type == _STRING:
+            return self.string()
+        if value_type == _ARRAY:
+            item_type = self.scalar(_UINT32)
+            length = self.scalar(_UINT64)
+            if length > _MAX_ARRAY_VALUES:
+                self.skip_array(item_type, length)
+                return {"type": "array", "length": length}
+            return [self.value(item_type) for _ in range(length)]
+        if value_type not in _SCALAR_FORMATS:
+            raise GGUFFormatError(f"Unknown GGUF value type {value_type}")
+        return self.scalar(value_type)
+
+    def skip_array(self, item_type: int, length: int):
+        if item_type in _SCALAR_SIZES:
+            self.offset += _SCALAR_SIZES[item_type] * length
+        elif item_type == _STRING:
+            for _ in range(length):
+                self.skip_string()
+        else:
+            for _ in range(length):
+                self.value(item_type)
+
+
+def read_gguf_header(path: str) -> Dict[str, Any]:
+    """Read metadata and tensor descriptors of a GGUF file without its weights.
+
+    Returns a dict with ``version``, ``metadata`` (large arrays replaced by
+    ``{"type": "array", "length": n}``), ``n_tensors``, ``n_params`` and
+    ``tensor_types`` (tensor count per ggml type).
+
+    Raises:
+        GGUFFormatError: If the file is not a supported GGUF file.
+    """
+    with open(path, "rb") as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise GGUFFormatError(f"{path} is empty")
+    try:
+        reader = _Reader(buffer)
+        if buffer[:4] != GGUF_MAGIC:
+            raise GGUFFormatError(f"{path} is not a GGUF file")
+        reader.offset = 4
+        version = reader.scalar(_UINT32)
+        if version < 2:
+            raise GGUFFormatError(f"GGUF version {version} is not supported")
+        n_tensors = reader.scalar(_UINT64)
+        n_kv = reader.scalar(_UINT64)
+        metadata: Dict[str, Any] = {}
+        for _ in range(n_kv):
+            key = reader.string()
+            metadata[key] = reader.value(reader.scalar(_UINT32))
+
+        n_params = 0
+        tensor_types: Dict[str, int] = {}
+        for _ in range(n_tensors):
+            reader.skip_string()
+            n_dims = reader.scalar(_UINT32)
+            elements = 1
+            for _ in range(n_dims):
+                elements *= reader.scalar(_UINT64)
+            type_name = TENSOR_TYPES.get(reader.scalar(_UINT32), "unknown")
+            reader.offset += 8  # data offset
+            n_params += elements
+            tensor_types[type_name] = tensor_types.get(type_name, 0) + 1
+    except struct.error as e:
+        raise GGUFFormatError(f"{path} has a truncated GGUF header: {e}")
+    finally:
+        buffer.close()
+    return {
+        "version": version,
+        "metadata": metadata,
+        "n_tensors": n_tensors,
+        "n_params": n_params,
+        "tensor_types": tensor_types,
+    }
+
+
+def summarize_header(header: Dict[str, Any], size_bytes: int) -> Dict[str, Any]:
+    """The fields of a GGUF header that describe the model."""
+    metadata = header["metadata"]
+    arch = metadata.get("general.architecture", "")
+
+    def arch_key(name: str, default: Any = None) -> Any:
+        return metadata.get(f"{arch}.{name}", default)
+
+    file_type = metadata.get("general.file_type")
+    if file_type in FILE_TYPES:
+        quantization = FILE_TYPES[file_type]
+    else:
+        # Older files lack file_type; the most common tensor type is a fair guess
+        types = header["tensor_types"]
+        quantization = max(types, key=types.get) if types else None
+    tokens = metadata.get("tokenizer.ggml.tokens")
+    n_vocab = tokens["length"] if isinstance(tokens, dict) else len(tokens or [])
+    n_head = arch_key("attention.head_count")
+    n_head_kv = arch_key("attention.head_count_kv", n_head)
+    template = metadata.get("tokenizer.chat_template")
+    return {
+        "size_bytes": size_bytes,
+        "architecture": arch,
+        "name": metadata.get("general.name"),
+        "n_params": header["n_params"],
+        "quantization": quantization,
+        "n_ctx_train": arch_key("context_length"),
+        "n_embd": arch_key("embedding_length"),
+        "n_layer": arch_key("block_count"),
+        # Per-layer lists (e.g. sliding window models) are summarized by their maximum
+        "n_head": max(n_head) if isinstance(n_head, list) else n_head,
+        "n_head_kv": max(n_head_kv) if isinstance(n_head_kv, list) else n_head_kv,
+        "head_dim_k": arch_key("attention.key_length"),
+        "head_dim_v": arch_key("attention.value_length"),
+        "n_vocab": n_vocab,
+        "chat_template_hash": (
+            hashlib.sha1(template.encode("utf-8")).hexdigest() if template else None
+        ),
+    }
+
+
+# Bytes per KV cache element of the cache types llama.cpp supports on CPU
+KV_CACHE_BYTES = {"f16": 2.0, "q8_0": 34 / 32, "q4_0": 18 / 32}
+
+
+def estimate_memory(
+    summary: Dict[str, Any],
+    n_ctx: int,
+    n_batch: int = 512,
+    kv_cache_type: str = "f16",
+    flash_attn: bool = False,
+) -> Dict[str, int]:
+    """Rough RAM needed to run a model at ``n_ctx``, in bytes.
+
+    Weights are memory mapped and count in full once touched. The KV cache
+    holds every layer and position in ``kv_cache_type``. ``logits`` is the
+    per-batch score buffer llama-cpp-python allocates; ``compute`` approximates
+    llama.cpp's graph buffers, dominated by the attention scores of one batch
+    unless flash attention avoids materializing them.
+    """
+    n_layer = summary.get("n_layer") or 0
+    n_embd = summary.get("n_embd") or 0
+    n_head = summary.get("n_head") or 1
+    n_head_kv = summary.get("n_head_kv") or n_head
+    n_vocab = summary.get("n_vocab") or 0
+    head_dim_k = summary.get("head_dim_k") or n_embd // n_head
+    head_dim_v = summary.get("head_dim_v") or n_embd // n_head
+    n_batch = min(n_batch, n_ctx)
+
+    kv_cache = int(
+        n_layer * n_ctx * n_head_kv * (head_dim_k + head_dim_v)
+        * KV_CACHE_BYTES[kv_cache_type]
+    )
+    logits = n_batch * n_vocab * 4
+    # Flash attention works on tiles instead of the full score matrix
+    attention_width = 256 if flash_attn else n_ctx
+    compute = n_batch * (n_head * attention_width + 4 * n_embd) * 4
+    weights = summary.get("size_bytes") or 0
+    return {
+        "weights": weights,
+        "kv_cache": kv_cache,
+        "logits": logits,
+        "compute": compute,
+        "total": weights + kv_cache + logits + compute,
+    }
+
+
+class GGUFIndex:
+    """Metadata of the GGUF files in a directory, refreshed by size and mtime."""
+
+    def __init__(self, models_dir: str, index_path: Optional[str] = None):
+        """Initialize the index.
+
+        Args:
+            models_dir: Directory holding the ``.gguf`` files.
+            index_path: JSON file persisting the index between runs, if any.
+        """
+        self.models_dir = models_dir
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        # file name -> (size, mtime_ns, summary)
+        self._entries: Dict[str, Tuple[int, int, Dict[str, Any]]] = {}
+        self._loaded = False
+
+    def models(self) -> Dict[str, Dict[str, Any]]:
+        """Summaries of all GGUF files, keyed by file name.
+
+        Files whose header cannot be read are listed with an ``error``.
+        """
+        with self._lock:
+            self._load()
+            try:
+                names = sorted(
+                    name
+                    for name in os.listdir(self.models_dir)
+                    if name.endswith(".gguf")
+                )
+            except FileNotFoundError:
+                names = []
+            changed = False
+            models: Dict[str, Dict[str, Any]] = {}
+            for name in names:
+                path = os.path.join(self.models_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if not os.path.isfile(path):
+                    continue
+                entry = self._entries.get(name)
+                if entry is None or entry[:2] != (stat.st_size, stat.st_mtime_ns):
+                    entry = (stat.st_size, stat.st_mtime_ns, self._summarize(path, stat))
+                    self._entries[name] = entry
+                    changed = True
+                models[name] = entry[2]
+            for name in set(self._entries) - set(models):
+                del self._entries[name]
+                changed = True
+            if changed:
+                self._save()
+            return models
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        """Summary of one model file, None if it does not exist."""
+        return self.models().get(name)
+
+    @staticmethod
+    def _summarize(path: str, stat: os.stat_result) -> Dict[str, Any]:
+        try:
+            return summarize_header(read_gguf_header(path), stat.st_size)
+        except (OSError, GGUFFormatError) as e:
+            logger.warning(f"Could not read GGUF header of {path}: {e}")
+            return {"size_bytes": stat.st_size, "error": str(e)}
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_VERSION:
+                return
+            self._entries = {
+                name: (entry["size"], entry["mtime_ns"], entry["summary"])
+                for name, entry in data["models"].items()
+            }
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable GGUF index {self.index_path}: {e}")
+
+    def _save(self):
+        if not self.index_path:
+            return
+        data = {
+            "version": INDEX_VERSION,
+            "models": {
+                name: {"size": size, "mtime_ns": mtime_ns, "summary": summary}
+                for name, (size, mtime_ns, summary) in self._entries.items()
+            },
+        }
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.warning(f"Could not save GGUF index {self.index_path}: {e}")
@@ -0,0 +1,265 @@
+"""
+Single-owner inference worker for the LLM server.
+
+The llama model is not thread-safe and generation is CPU-bound, so every
+operation that touches the loaded model runs on one dedicated thread. HTTP
+handlers submit jobs through a bounded admission queue and await the result
+(or iterate the streamed chunks) without blocking the event loop.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Marker pushed onto a job's chunk queue once its stream is exhausted
+_STREAM_END = object()
+
+
+class QueueFullError(Exception):
+    """Raised when the admission queue cannot accept another job."""
+
+
+class WorkerUnavailableError(Exception):
+    """Raised when the inference worker is not running."""
+
+
+class JobCancelledError(Exception):
+    """Raised for a job that was cancelled or abandoned before it started."""
+
+    def __init__(self, message: str, shutdown: bool = False):
+        super().__init__(message)
+        # True if the worker stopped, False if the job itself was cancelled
+        self.shutdown = shutdown
+
+
+class InferenceJob:
+    """A unit of work executed by the InferenceWorker.
+
+    Non-streaming jobs resolve ``future`` with the return value of ``fn``.
+    Streaming jobs expect ``fn`` to return an iterator; each item is forwarded
+    to the submitting event loop and can be consumed with ``stream()``.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[], Any],
+        stream: bool = False,
+        request_id: Optional[str] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ):
+        self.request_id = request_id or str(uuid.uuid4())
+        self.fn = fn
+        self.stream_mode = stream
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self._loop = loop
+        self._chunks: Optional[asyncio.Queue] = asyncio.Queue() if stream else None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Ask the worker to skip or stop this job."""
+        self._cancelled.set()
+
+    async def result(self) -> Any:
+        """Wait for a non-streaming job to finish and return its result."""
+        return await asyncio.wrap_future(self.future)
+
+    async def stream(self) -> AsyncIterator[Any]:
+        """Yield the chunks produced by a streaming job as they arrive."""
+        if self._chunks is None:
+            raise RuntimeError("stream() called on a non-streaming job")
+        while True:
+            item = await self._chunks.get()
+            if item is _STREAM_END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def _push(self, item: Any):
+        """Hand a chunk over to the event loop that submitted the job."""
+        self._loop.call_soon_threadsafe(self._chunks.put_nowait, item)
+
+    def _run(self):
+        """Execute the job. Called on the worker thread only."""
+        self.started_at = time.monotonic()
+        try:
+            result = self.fn()
+            if not self.stream_mode:
+                self.future.set_result(result)
+                return
+            for chunk in result:
+                if self.cancelled:
+                    logger.info(f"Stopping cancelled stream job {self.request_id}")
+                    break
+                self._push(chunk)
+            self._push(_STREAM_END)
+            self.future.set_result(None)
+        except BaseException as e:
+            if self.stream_mode:
+                self._push(e)
+            self.future.set_exception(e)
+
+    def _abandon(self, shutdown: bool = False):
+        """Resolve a job that was cancelled before it started.
+
+        Raises JobCancelledError rather than asyncio.CancelledError in the
+        awaiting handler, so that it can still answer the request.
+        """
+        if shutdown:
+            error = JobCancelledError(
+                f"Job {self.request_id} abandoned, the inference worker stopped",
+                shutdown=True,
+            )
+        else:
+            error = JobCancelledError(f"Job {self.request_id} cancelled")
+        if self.stream_mode:
+            self._push(error)
+        self.future.set_exception(error)
+
+
+class InferenceWorker:
+    """Runs InferenceJobs one at a time on a dedicated thread."""
+
+    def __init__(self, max_queue_depth: int = 4):
+        """Initialize the worker.
+
+        Args:
+            max_queue_depth: Number of jobs allowed to wait behind the running one.
+        """
+        self.max_queue_depth = max_queue_depth
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_depth)
+        self._thread: Optional[threading.Thread] = None
+        self._current: Optional[InferenceJob] = None
+        # Queued and running jobs by request id, for cancel()
+        self._jobs: Dict[str, InferenceJob] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def busy(self) -> bool:
+        return self._current is not None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def current_job(self) -> Optional[InferenceJob]:
+        """The job being executed; inside a job's ``fn`` this is that job."""
+        return self._current
+
+    def cancel(self, request_id: str) -> bool:
+        """Cancel a queued or running job. Returns False if it is unknown."""
+        job = self._jobs.get(request_id)
+        if job is None:
+            return False
+        logger.info(f"Cancelling job {request_id}")
+        job.cancel()
+        return True
+
+    def start(self):
+        """Start the worker thread if it is not already running."""
+        if self.running:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="inference-worker", daemon=True
+        )
+        self._thread.start()
+        logger.info(
+            f"Inference worker started (max queue depth: {self.max_queue_depth})"
+        )
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the worker after the running job; queued jobs are abandoned."""
+        if not self.running:
+            return
+        if self._current is not None:
+            self._current.cancel()
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                job._abandon(shutdown=True)
+        self._jobs.clear()
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+        self._thread = None
+        logger.info("Inference worker stopped")
+
+    def submit(
+        self,
+        fn: Callable[[], Any],
+        stream: bool = False,
+        request_id: Optional[str] = None,
+    ) -> InferenceJob:
+        """Queue ``fn`` for execution on the worker thread.
+
+        Must be called from the event loop that will consume the job.
+
+        Raises:
+            WorkerUnavailableError: If the worker thread is not running.
+            QueueFullError: If the admission queue is at capacity.
+        """
+        if not self.running:
+            raise WorkerUnavailableError("Inference worker is not running")
+        job = InferenceJob(
+            fn,
+            stream=stream,
+            request_id=request_id,
+            loop=asyncio.get_running_loop(),
+        )
+        # Registered first: the worker may run and forget a short job before
+        # put_nowait returns
+        self._jobs[job.request_id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._forget(job)
+            raise QueueFullError(
+                f"Inference queue is full ({self.max_queue_depth} requests waiting)"
+            )
+        logger.debug(
+            f"Queued job {job.request_id} (stream={stream}, depth={self.queue_depth})"
+        )
+        return job
+
+    def _forget(self, job: InferenceJob):
+        if self._jobs.get(job.request_id) is job:
+            del self._jobs[job.request_id]
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            if job.cancelled:
+                logger.debug(f"Skipping job {job.request_id} cancelled while queued")
+                self._forget(job)
+                job._abandon()
+                continue
+            self._current = job
+            try:
+                job._run()
+            finally:
+                self._current = None
+                self._forget(job)
+                logger.debug(
+                    f"Job {job.request_id} finished in {time.monotonic() - job.started_at:.2f}s"
+                )
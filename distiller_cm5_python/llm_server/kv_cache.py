@@ -0,0 +1,563 @@
+"""
+KV state caches for the LLM server.
+
+States are the ``LlamaState`` snapshots returned by ``Llama.save_state()``.
+The in-memory pool is only touched from the inference worker thread; the
+disk cache is additionally pruned from a background thread.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def token_prefix_hash(tokens: Sequence[int]) -> str:
+    """Return a stable hash for a token sequence."""
+    return hashlib.sha1(array("i", tokens).tobytes()).hexdigest()
+
+
+def state_nbytes(state: Any) -> int:
+    """Memory held by a saved llama state.
+
+    ``llama_state_size`` only covers the context data; the state also carries
+    a copy of the logits rows, which dominates once llama keeps logits for
+    every position.
+    """
+    scores = getattr(state, "scores", None)
+    return state.llama_state_size + (scores.nbytes if scores is not None else 0)
+
+
+def common_prefix_length(a: Sequence[int], b: Sequence[int]) -> int:
+    """Return the number of leading tokens shared by ``a`` and ``b``."""
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class _RadixNode:
+    __slots__ = ("children", "key")
+
+    def __init__(self):
+        # first token of edge -> (edge tokens, child node)
+        self.children: Dict[int, Tuple[Tuple[int, ...], "_RadixNode"]] = {}
+        self.key: Optional[str] = None
+
+
+class TokenPrefixIndex:
+    """Radix tree over cached token sequences.
+
+    Maps each stored sequence to a cache key and answers "which cached sequence
+    shares the longest common prefix with these tokens" in time proportional to
+    the query length rather than the number of cached entries.
+    """
+
+    def __init__(self):
+        self._root = _RadixNode()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def insert(self, tokens: Sequence[int], key: str):
+        """Associate ``key`` with the token sequence ``tokens``."""
+        tokens = tuple(tokens)
+        node, i = self._root, 0
+        while i < len(tokens):
+            edge = node.children.get(tokens[i])
+            if edge is None:
+                leaf = _RadixNode()
+                node.children[tokens[i]] = (tokens[i:], leaf)
+                node = leaf
+                break
+            label, child = edge
+            n = self._match(label, tokens, i)
+            if n < len(label):
+                # Split the edge where the new sequence diverges
+                middle = _RadixNode()
+                middle.children[label[n]] = (label[n:], child)
+                node.children[tokens[i]] = (label[:n], middle)
+                child = middle
+            node, i = child, i + n
+        if node.key is None:
+            self._size += 1
+        node.key = key
+
+    def remove(self, tokens: Sequence[int]):
+        """Drop the key stored for exactly ``tokens``, if any."""
+        tokens = tuple(tokens)
+        path: List[Tuple[_RadixNode, int]] = []
+        node, i = self._root, 0
+        while i < len(tokens):
+            edge = node.children.get(tokens[i])
+            if edge is None:
+                return
+            label, child = edge
+            if tokens[i : i + len(label)] != label:
+                return
+            path.append((node, tokens[i]))
+            node, i = child, i + len(label)
+        if node.key is None:
+            return
+        node.key = None
+        self._size -= 1
+        # Prune empty leaves and re-merge single-child pass-through nodes
+        while path and node.key is None and len(node.children) <= 1:
+            parent, first = path.pop()
+            label, _ = parent.children[first]
+            if not node.children:
+                del parent.children[first]
+            else:
+                (child_label, grandchild), = node.children.values()
+                parent.children[first] = (label + child_label, grandchild)
+            node = parent
+
+    def longest_prefix(self, tokens: Sequence[int]) -> Tuple[Optional[str], int]:
+        """Return the key sharing the longest common prefix with ``tokens``.
+
+        Returns:
+            ``(key, prefix_len)``, or ``(None, 0)`` if nothing shares a token.
+        """
+        node, i = self._root, 0
+        while i < len(tokens):
+            edge = node.children.get(tokens[i])
+            if edge is None:
+                break
+            label, child = edge
+            n = self._match(label, tokens, i)
+            i += n
+            node = child
+            if n < len(label):
+                break
+        if i == 0:
+            return None, 0
+        # Every key below the stopping point shares exactly ``i`` tokens;
+        # prefer the shallowest one since it is the cheapest state to load.
+        return self._shallowest_key(node), i
+
+    @staticmethod
+    def _match(label: Tuple[int, ...], tokens: Sequence[int], start: int) -> int:
+        n = 0
+        limit = min(len(label), len(tokens) - start)
+        while n < limit and label[n] == tokens[start + n]:
+            n += 1
+        return n
+
+    @staticmethod
+    def _shallowest_key(node: _RadixNode) -> Optional[str]:
+        level = [node]
+        while level:
+            for candidate in level:
+                if candidate.key is not None:
+                    return candidate.key
+            level = [child for n in level for _, child in n.children.values()]
+        return None
+
+    def clear(self):
+        self._root = _RadixNode()
+        self._size = 0
+
+
+class StatePool:
+    """In-memory LRU pool of saved llama states keyed by token prefix.
+
+    Implements the lookup/store protocol of llama_cpp's ``BaseLlamaCache`` so it
+    can be attached with ``Llama.set_cache`` without importing llama_cpp here.
+    """
+
+    def __init__(self, capacity_bytes: int = 512 << 20, max_entries: int = 8):
+        """Initialize the pool.
+
+        Args:
+            capacity_bytes: Total size of the stored states before LRU eviction.
+            max_entries: Maximum number of states kept regardless of size.
+        """
+        self.capacity_bytes = capacity_bytes
+        self.max_entries = max_entries
+        # key hash -> (tokens, state), least recently used first
+        self._states: "OrderedDict[str, Tuple[Tuple[int, ...], Any]]" = OrderedDict()
+        self._index = TokenPrefixIndex()
+        # Running total of state sizes, readable from other threads
+        self._size = 0
+        # Prefix lookups that found / did not find a state
+        self.hits = 0
+        self.misses = 0
+
+    def __bool__(self) -> bool:
+        # Llama only consults its cache when ``if self.cache`` is true, so an
+        # empty pool must not evaluate as falsy.
+        return True
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    @property
+    def cache_size(self) -> int:
+        return self._size
+
+    def get(self, tokens: Sequence[int]) -> Optional[Any]:
+        """Return the state saved for exactly ``tokens``, or None."""
+        key = token_prefix_hash(tokens)
+        entry = self._states.get(key)
+        if entry is None:
+            return None
+        self.hits += 1
+        self._states.move_to_end(key)
+        return entry[1]
+
+    def longest_prefix(self, tokens: Sequence[int]) -> Tuple[Optional[Any], int]:
+        """Return the pooled state sharing the most leading tokens with ``tokens``.
+
+        Returns:
+            ``(state, prefix_len)``, or ``(None, 0)`` if no state shares a prefix.
+        """
+        key, prefix_len = self._index.longest_prefix(tokens)
+        if key is None:
+            self.misses += 1
+            return None, 0
+        self.hits += 1
+        self._states.move_to_end(key)
+        return self._states[key][1], prefix_len
+
+    def prefix_length(self, tokens: Sequence[int]) -> int:
+        """Length of the longest pooled prefix, without touching LRU order or stats."""
+        return self._index.longest_prefix(tokens)[1]
+
+    def _find_longest_prefix_key(self, tokens: Sequence[int]) -> Optional[str]:
+        return self._index.longest_prefix(tokens)[0]
+
+    def __getitem__(self, tokens: Sequence[int]) -> Any:
+        key = self._find_longest_prefix_key(tokens)
+        if key is None:
+            self.misses += 1
+            raise KeyError("Key not found")
+        self.hits += 1
+        self._states.move_to_end(key)
+        return self._states[key][1]
+
+    def __contains__(self, tokens: Sequence[int]) -> bool:
+        return self._find_longest_prefix_key(tokens) is not None
+
+    def __setitem__(self, tokens: Sequence[int], state: Any):
+        nbytes = state_nbytes(state)
+        if nbytes > self.capacity_bytes:
+            logger.warning(
+                f"Not pooling state of {nbytes} bytes, larger than capacity {self.capacity_bytes}"
+            )
+            return
+        key = token_prefix_hash(tokens)
+        previous = self._states.pop(key, None)
+        if previous is not None:
+            self._size -= state_nbytes(previous[1])
+        self._states[key] = (tuple(tokens), state)
+        self._size += nbytes
+        self._index.insert(tokens, key)
+        self._evict()
+
+    def _evict(self):
+        while self._states and (
+            self._size > self.capacity_bytes or len(self._states) > self.max_entries
+        ):
+            key, (tokens, state) = self._states.popitem(last=False)
+            self._index.remove(tokens)
+            nbytes = state_nbytes(state)
+            self._size -= nbytes
+            logger.debug(
+                f"Evicted pooled state {key[:12]} ({len(tokens)} tokens, {nbytes} bytes)"
+            )
+
+    def clear(self):
+        self._states.clear()
+        self._index.clear()
+        self._size = 0
+
+
+class DiskStateCache:
+    """Size-bounded on-disk store of llama states with a SQLite manifest.
+
+    Each state is pickled into its own file, fanned out over sub-directories by
+    key hash. The manifest records the owning model, its file fingerprint and
+    chat template hash, n_ctx, size and hit statistics. States of a model whose
+    file or template changed are dropped when that model is bound, and a
+    background thread evicts entries (LRU or LFU) once the byte budget is
+    exceeded.
+    """
+
+    MANIFEST_NAME = "manifest.sqlite3"
+
+    def __init__(
+        self,
+        cache_dir: str,
+        capacity_bytes: int = 2 << 30,
+        policy: str = "lru",
+        prune_interval: float = 300.0,
+    ):
+        """Initialize the cache.
+
+        Args:
+            cache_dir: Directory holding the state files and manifest.
+            capacity_bytes: Total size of stored states before eviction.
+            policy: Eviction order, "lru" (last hit) or "lfu" (hit count).
+            prune_interval: Seconds between background pruning passes.
+        """
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unsupported eviction policy: {policy}")
+        self.cache_dir = cache_dir
+        self.capacity_bytes = capacity_bytes
+        self.policy = policy
+        self.prune_interval = prune_interval
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(cache_dir, self.MANIFEST_NAME), check_same_thread=False
+        )
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS states (
+                key TEXT PRIMARY KEY,
+                model_name TEXT NOT NULL,
+                model_fingerprint TEXT NOT NULL,
+                template_hash TEXT NOT NULL,
+                n_ctx INTEGER NOT NULL,
+                n_tokens INTEGER NOT NULL,
+                tokens BLOB NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_hit REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        self._db.commit()
+
+        # Identity of the bound model; only its states are served
+        self._identity: Optional[Tuple[str, str, str, int]] = None
+        self._index = TokenPrefixIndex()
+        self.hits = 0
+        self.misses = 0
+
+        self._prune_requested = threading.Event()
+        self._stopping = threading.Event()
+        self._pruner: Optional[threading.Thread] = None
+
+    @staticmethod
+    def model_fingerprint(model_path: str) -> str:
+        """Cheap fingerprint that changes whenever the model file is replaced."""
+        stat = os.stat(model_path)
+        return f"{stat.st_size}-{int(stat.st_mtime)}"
+
+    @staticmethod
+    def template_hash(template: Optional[str]) -> str:
+        return hashlib.sha1((template or "").encode("utf-8")).hexdigest()
+
+    def bind_model(
+        self, model_name: str, model_fingerprint: str, template_hash: str, n_ctx: int
+    ):
+        """Serve states of the given model, dropping any from older versions of it."""
+        with self._lock:
+            stale = self._db.execute(
+                "SELECT key FROM states WHERE model_name = ? AND (model_fingerprint != ? OR template_hash != ?)",
+                (model_name, model_fingerprint, template_hash),
+            ).fetchall()
+            for (key,) in stale:
+                self._delete_locked(key)
+            self._db.commit()
+            if stale:
+                logger.info(
+                    f"Invalidated {len(stale)} cached states of '{model_name}' (model file or chat template changed)"
+                )
+
+            self._identity = (model_name, model_fingerprint, template_hash, n_ctx)
+            self._index.clear()
+            rows = self._db.execute(
+                "SELECT key, tokens FROM states WHERE model_name = ? AND model_fingerprint = ? AND template_hash = ? AND n_ctx = ?",
+                self._identity,
+            ).fetchall()
+            for key, tokens in rows:
+                self._index.insert(self._decode_tokens(tokens), key)
+        logger.debug(f"Disk cache bound to '{model_name}' with {len(rows)} states")
+
+    def longest_prefix(self, tokens: Sequence[int]) -> Tuple[Optional[Any], int]:
+        """Load the stored state sharing the most leading tokens with ``tokens``.
+
+        Returns:
+            ``(state, prefix_len)``, or ``(None, 0)`` if no stored state shares a prefix.
+        """
+        with self._lock:
+            key, prefix_len = self._index.longest_prefix(tokens)
+            if key is None:
+                self.misses += 1
+                return None, 0
+            try:
+                with open(self._path(key), "rb") as f:
+                    state = pickle.load(f)
+            except Exception as e:
+                logger.warning(f"Dropping unreadable cached state {key[:12]}: {e}")
+                self._delete_locked(key)
+                self._db.commit()
+                self.misses += 1
+                return None, 0
+            self.hits += 1
+            self._db.execute(
+                "UPDATE states SET last_hit = ?, hit_count = hit_count + 1 WHERE key = ?",
+                (time.time(), key),
+            )
+            self._db.commit()
+            return state, prefix_len
+
+    def put(self, tokens: Sequence[int], state: Any):
+        """Persist ``state`` as the evaluated result of ``tokens``."""
+        if self._identity is None:
+            raise RuntimeError("DiskStateCache.put() called before bind_model()")
+        nbytes = state_nbytes(state)
+        if nbytes > self.capacity_bytes:
+            logger.warning(
+                f"Not persisting state of {nbytes} bytes, larger than capacity {self.capacity_bytes}"
+            )
+            return
+        key = token_prefix_hash(tokens)
+        key = hashlib.sha1(("|".join(map(str, self._identity)) + key).encode()).hexdigest()
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial state
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        size_bytes = os.path.getsize(tmp_path)
+
+        now = time.time()
+        with self._lock:
+            # Publish file and manifest row together so pruning never sees one without the other
+            os.replace(tmp_path, path)
+            self._db.execute(
+                "INSERT OR REPLACE INTO states VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (
+                    key,
+                    *self._identity,
+                    len(tokens),
+                    array("i", tokens).tobytes(),
+                    size_bytes,
+                    now,
+                    now,
+                ),
+            )
+            self._db.commit()
+            self._index.insert(tokens, key)
+        self._prune_requested.set()
+
+    @property
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM states").fetchone()[0]
+
+    def prune(self):
+        """Evict entries beyond the byte budget and reconcile manifest with files."""
+        with self._lock:
+            order = "last_hit" if self.policy == "lru" else "hit_count, last_hit"
+            rows = self._db.execute(
+                f"SELECT key, size_bytes FROM states ORDER BY {order}"
+            ).fetchall()
+            total = sum(size for _, size in rows)
+            evicted = 0
+            for key, size in rows:
+                if total <= self.capacity_bytes:
+                    break
+                self._delete_locked(key)
+                total -= size
+                evicted += 1
+
+            # Drop manifest rows whose file vanished and files the manifest lost
+            known = {key for (key,) in self._db.execute("SELECT key FROM states")}
+            for key in list(known):
+                if not os.path.exists(self._path(key)):
+                    self._delete_locked(key)
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    path = os.path.join(root, name)
+                    if name.endswith(".state") and name[: -len(".state")] not in known:
+                        os.remove(path)
+                    elif name.endswith(".tmp") and time.time() - os.path.getmtime(path) > 3600:
+                        # Left behind by a write that crashed mid-way
+                        os.remove(path)
+            self._db.commit()
+        if evicted:
+            logger.info(
+                f"Evicted {evicted} cached states, {total} bytes remain (capacity {self.capacity_bytes})"
+            )
+
+    def start_pruner(self):
+        """Start the background pruning thread."""
+        if self._pruner is not None and self._pruner.is_alive():
+            return
+        self._stopping.clear()
+        self._pruner = threading.Thread(
+            target=self._prune_loop, name="kv-cache-pruner", daemon=True
+        )
+        self._pruner.start()
+
+    def stop_pruner(self):
+        self._stopping.set()
+        self._prune_requested.set()
+        if self._pruner is not None:
+            self._pruner.join(timeout=5.0)
+            self._pruner = None
+
+    def _prune_loop(self):
+        self._prune_requested.set()  # reconcile once at startup
+        while not self._stopping.is_set():
+            self._prune_requested.wait(timeout=self.prune_interval)
+            self._prune_requested.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.prune()
+            except Exception as e:
+                logger.error(f"KV cache pruning failed: {e}", exc_info=True)
+
+    def _path(self, key: str) -> str:
+        # Fan out over sub-directories to keep directory listings short
+        return os.path.join(self.cache_dir, key[:2], f"{key}.state")
+
+    def _delete_locked(self, key: str):
+        row = self._db.execute(
+            "SELECT model_name, model_fingerprint, template_hash, n_ctx, tokens FROM states WHERE key = ?",
+            (key,),
+        ).fetchone()
+        self._db.execute("DELETE FROM states WHERE key = ?", (key,))
+        if row is not None and tuple(row[:4]) == self._identity:
+            self._index.remove(self._decode_tokens(row[4]))
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _decode_tokens(blob: bytes) -> Tuple[int, ...]:
+        tokens = array("i")
+        tokens.frombytes(blob)
+        return tuple(tokens)
+
+
+def remove_legacy_disk_cache(cache_root: str):
+    """Delete the unbounded ``LlamaDiskCache`` store used by earlier versions."""
+    if not os.path.exists(os.path.join(cache_root, "cache.db")):
+        return
+    for name in os.listdir(cache_root):
+        path = os.path.join(cache_root, name)
+        if name.startswith("cache.db"):
+            os.remove(path)
+        elif os.path.isdir(path) and re.fullmatch(r"[0-9a-f]{2}", name):
+            shutil.rmtree(path)
+    logger.info(f"Removed legacy LlamaDiskCache files from {cache_root}")
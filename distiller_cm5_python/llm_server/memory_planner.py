@@ -0,0 +1,244 @@
+"""
+Memory-aware load planning for the LLM server.
+
+Loading with a fixed ``n_ctx`` either gets the server OOM-killed on 4 GB
+boards or reserves KV cache that is never used. The planner combines the
+model's GGUF header with the memory actually available (cgroup limits
+included) and picks the load parameters:
+
+- ``n_ctx``: the requested size, capped at the training context, and reduced
+  only when it does not fit even with a q8_0 KV cache.
+- KV cache type: f16 when it fits, otherwise q8_0 (near lossless) and, as a
+  last resort, q4_0. Quantized caches need flash attention, which is enabled
+  with them.
+- ``n_batch``/``n_ubatch``: the largest batch of 512, 256 or 128 whose
+  compute and logits buffers fit, since smaller batches prefill slower.
+- ``use_mmap``/``use_mlock`` and thread counts.
+
+Explicit values in ``load_model_configs`` win over the planner's choices.
+"""
+
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from distiller_cm5_python.llm_server.gguf_index import estimate_memory
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+# ggml_type values llama accepts for type_k / type_v
+KV_CACHE_TYPES = {"f16": 1, "q8_0": 8, "q4_0": 2}
+
+BATCH_SIZES = (512, 256, 128)
+# Contexts are clamped in steps of this many tokens, and never below the minimum
+N_CTX_STEP = 256
+MIN_N_CTX = 2048
+# load_model_configs keys passed to Llama as they are
+_LLAMA_KEYS = (
+    "n_ctx",
+    "n_batch",
+    "n_ubatch",
+    "n_threads",
+    "n_threads_batch",
+    "use_mmap",
+    "use_mlock",
+    "flash_attn",
+)
+
+
+def _read_int(path: str) -> Optional[int]:
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+        return None if value == "max" else int(value)
+    except (OSError, ValueError):
+        return None
+
+
+def cgroup_memory_available() -> Optional[int]:
+    """Memory left under this process's cgroup limit, None without a limit."""
+    for limit_path, usage_path in (
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        (
+            "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+            "/sys/fs/cgroup/memory/memory.usage_in_bytes",
+        ),
+    ):
+        limit = _read_int(limit_path)
+        # cgroup v1 reports "no limit" as a huge number
+        if limit is None or limit >= 1 << 60:
+            continue
+        usage = _read_int(usage_path) or 0
+        return max(0, limit - usage)
+    return None
+
+
+def available_memory_bytes() -> int:
+    """Memory this process can still use, the lower of system and cgroup figures."""
+    if psutil is not None:
+        available = psutil.virtual_memory().available
+    else:
+        available = 0
+        try:
+            with open("/proc/meminfo") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        available = int(line.split()[1]) << 10
+                        break
+        except (OSError, ValueError):
+            pass
+    cgroup = cgroup_memory_available()
+    if cgroup is not None:
+        available = min(available, cgroup) if available else cgroup
+    return available
+
+
+def usable_cpu_count() -> int:
+    """CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def plan_load(
+    summary: Dict[str, Any],
+    load_model_configs: Dict[str, Any],
+    budget_bytes: int,
+    default_n_ctx: int = 4096,
+    extra_bytes_per_ctx: int = 0,
+) -> Dict[str, Any]:
+    """Choose load parameters for a model from its GGUF summary.
+
+    Args:
+        summary: Model summary from gguf_index.
+        load_model_configs: Requested configs; keys in _LLAMA_KEYS and
+            ``kv_cache_type`` ("f16", "q8_0", "q4_0" or "auto") are honored.
+        budget_bytes: Memory the model may use.
+        default_n_ctx: Context size when none is requested.
+        extra_bytes_per_ctx: Additional memory per context position, e.g.
+            the speculative decoding logits buffer.
+
+    Returns:
+        A plan with ``llama_kwargs`` for the Llama constructor, the chosen
+        ``kv_cache_type``, ``estimated_memory``, ``budget_bytes``, ``notes``
+        explaining any reductions and ``over_budget``. A model that does not
+        fit even at MIN_N_CTX gets the smallest plan, over the budget; the
+        estimate counts mmap'd weights in full although the kernel can page
+        them out, so such a load usually still runs.
+    """
+    notes: List[str] = []
+    budget = budget_bytes
+    requested_ctx = load_model_configs.get("n_ctx") or default_n_ctx
+    n_ctx = requested_ctx
+    n_ctx_train = summary.get("n_ctx_train")
+    if n_ctx_train and n_ctx > n_ctx_train:
+        n_ctx = n_ctx_train
+        notes.append(f"n_ctx {requested_ctx} capped at the training context {n_ctx_train}")
+
+    requested_kv = load_model_configs.get("kv_cache_type", "auto")
+    if requested_kv != "auto" and requested_kv not in KV_CACHE_TYPES:
+        raise ValueError(
+            f"Unsupported kv_cache_type '{requested_kv}', use auto or one of "
+            f"{', '.join(KV_CACHE_TYPES)}"
+        )
+    kv_types = list(KV_CACHE_TYPES) if requested_kv == "auto" else [requested_kv]
+    batch_sizes = (
+        [load_model_configs["n_batch"]] if "n_batch" in load_model_configs else BATCH_SIZES
+    )
+
+    def estimate(n_ctx: int, kv_type: str, n_batch: int) -> Dict[str, int]:
+        memory = estimate_memory(
+            summary,
+            n_ctx,
+            n_batch=n_batch,
+            kv_cache_type=kv_type,
+            flash_attn=load_model_configs.get("flash_attn", kv_type != "f16"),
+        )
+        memory["total"] += n_ctx * extra_bytes_per_ctx
+        return memory
+
+    def max_ctx(kv_type: str, n_batch: int) -> int:
+        """Largest context in N_CTX_STEP steps that fits, 0 if none does."""
+        low, high = 0, n_ctx // N_CTX_STEP
+        while low < high:
+            middle = (low + high + 1) // 2
+            if estimate(middle * N_CTX_STEP, kv_type, n_batch)["total"] <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return low * N_CTX_STEP
+
+    # Full context first with an f16, then a q8_0 cache, at the largest batch
+    # that fits; then the largest context a q8_0 or, last, a q4_0 cache allows
+    choice = None
+    for kv_type in [t for t in kv_types if t != "q4_0"] or kv_types:
+        for n_batch in batch_sizes:
+            if estimate(n_ctx, kv_type, n_batch)["total"] <= budget:
+                choice = (n_ctx, kv_type, n_batch)
+                break
+        if choice:
+            break
+    if choice is None:
+        for kv_type in [t for t in kv_types if t != "f16"] or kv_types:
+            fitted = max_ctx(kv_type, batch_sizes[-1])
+            if fitted >= min(MIN_N_CTX, n_ctx):
+                choice = (fitted, kv_type, batch_sizes[-1])
+                notes.append(
+                    f"n_ctx reduced from {n_ctx} to {fitted} to fit "
+                    f"{budget >> 20} MB"
+                )
+                break
+    over_budget = choice is None
+    if over_budget:
+        smallest = (min(MIN_N_CTX, n_ctx), kv_types[-1], batch_sizes[-1])
+        note = (
+            f"model needs {estimate(*smallest)['total'] >> 20} MB, more than the "
+            f"{max(0, budget) >> 20} MB available even at n_ctx {smallest[0]}; "
+            f"loading the smallest plan"
+        )
+        logger.warning(note[0].upper() + note[1:])
+        notes.append(note)
+        choice = smallest
+    n_ctx, kv_type, n_batch = choice
+    if kv_type != "f16" and requested_kv == "auto" and not over_budget:
+        notes.append(f"KV cache quantized to {kv_type} to fit n_ctx {n_ctx}")
+    memory = estimate(n_ctx, kv_type, n_batch)
+
+    cpus = usable_cpu_count()
+    # mlock only when the whole model fits with room to spare; otherwise the
+    # kernel must be able to page weights back out
+    use_mlock = bool(load_model_configs.get("use_mlock", False))
+    if use_mlock and memory["total"] > budget // 2:
+        use_mlock = False
+        notes.append("use_mlock disabled, the model takes more than half of the budget")
+
+    llama_kwargs = {
+        "n_ctx": n_ctx,
+        "n_batch": n_batch,
+        "n_ubatch": n_batch,
+        "type_k": KV_CACHE_TYPES[kv_type],
+        "type_v": KV_CACHE_TYPES[kv_type],
+        "flash_attn": load_model_configs.get("flash_attn", kv_type != "f16"),
+        "use_mmap": load_model_configs.get("use_mmap", True),
+        "use_mlock": use_mlock,
+        # Decoding is memory bound, leave a core to the UI; prefill uses all
+        "n_threads": max(1, cpus - 1),
+        "n_threads_batch": cpus,
+    }
+    for key in _LLAMA_KEYS:
+        if key in load_model_configs and key not in ("n_ctx", "use_mlock", "flash_attn"):
+            llama_kwargs[key] = load_model_configs[key]
+    return {
+        "llama_kwargs": llama_kwargs,
+        "kv_cache_type": kv_type,
+        "estimated_memory": memory,
+        "budget_bytes": budget_bytes,
+        "notes": notes,
+        "over_budget": over_budget,
+    }
+
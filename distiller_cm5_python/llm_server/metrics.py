@@ -0,0 +1,353 @@
+"""
+Prometheus-style metrics for the LLM server.
+
+A small dependency-free implementation of counters, gauges and histograms
+rendered in the Prometheus text exposition format. Updates take a lock and a
+dict lookup, so they are cheap enough for the generation path; values owned by
+other components (queue depth, cache hit counts, RSS) are read through
+callbacks at scrape time instead of being pushed.
+"""
+
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+LabelValues = Tuple[str, ...]
+Samples = Union[float, Dict[LabelValues, float]]
+
+# Seconds; covers sub-second restores up to multi-minute prefills on the CM5
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing value."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    """Value that can go up and down, set directly or read from a callback."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], Samples]] = None,
+    ):
+        super().__init__(name, help, labelnames)
+        self._function = function
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self) -> Iterable[str]:
+        if self._function is None:
+            yield from super()._samples()
+            return
+        value = self._function()
+        if value is None:
+            return
+        if not isinstance(value, dict):
+            value = {(): value}
+        for key, sample in value.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(sample)}"
+
+
+class CallbackCounter(Gauge):
+    """Counter whose value is owned by another component and read at scrape time."""
+
+    kind = "counter"
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> (per-bucket counts, sum)
+        self._values: Dict[LabelValues, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(
+                    self.labelnames, key, f'le="{_format_value(bound)}"'
+                )
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together for a scrape."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def resident_memory_bytes() -> Optional[float]:
+    """Resident set size of this process, None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return float(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+REGISTRY = MetricsRegistry()
+
+PROMPT_TOKENS = REGISTRY.register(
+    Counter("llm_prompt_tokens_total", "Prompt tokens submitted for generation")
+)
+PROMPT_TOKENS_CACHED = REGISTRY.register(
+    Counter(
+        "llm_prompt_tokens_cached_total",
+        "Prompt tokens served from a cached KV state instead of being evaluated",
+    )
+)
+GENERATED_TOKENS = REGISTRY.register(
+    Counter("llm_generated_tokens_total", "Tokens generated by the model")
+)
+COMPLETIONS = REGISTRY.register(
+    Counter(
+        "llm_completions_total",
+        "Finished chat completions by outcome",
+        ["stream", "outcome"],
+    )
+)
+PREFILL_RATE = REGISTRY.register(
+    Gauge(
+        "llm_prefill_tokens_per_second",
+        "Prompt evaluation speed of the most recent completion",
+    )
+)
+DECODE_RATE = REGISTRY.register(
+    Gauge(
+        "llm_decode_tokens_per_second",
+        "Generation speed of the most recent completion",
+    )
+)
+TIME_TO_FIRST_TOKEN = REGISTRY.register(
+    Histogram(
+        "llm_time_to_first_token_seconds",
+        "Time from the start of a completion job to its first generated token",
+        ["stream"],
+    )
+)
+QUEUE_WAIT = REGISTRY.register(
+    Histogram(
+        "llm_queue_wait_seconds",
+        "Time completion jobs spent in the admission queue before running",
+    )
+)
+CACHE_RESTORE = REGISTRY.register(
+    Histogram(
+        "llm_cache_restore_seconds",
+        "Duration of /restore_cache jobs",
+        ["outcome"],
+    )
+)
+CONTEXT_SUMMARY = REGISTRY.register(
+    Histogram(
+        "llm_context_summary_seconds",
+        "Duration of summaries of messages dropped from the context window",
+        ["outcome"],
+    )
+)
+MODEL_LOAD = REGISTRY.register(
+    Gauge("llm_model_load_seconds", "Time taken to load each model", ["model"])
+)
+SPECULATIVE_DRAFTED = REGISTRY.register(
+    Counter(
+        "llm_speculative_drafted_tokens_total",
+        "Draft tokens proposed for speculative decoding",
+        ["method"],
+    )
+)
+SPECULATIVE_ACCEPTED = REGISTRY.register(
+    Counter(
+        "llm_speculative_accepted_tokens_total",
+        "Draft tokens accepted by the main model",
+        ["method"],
+    )
+)
+SPECULATIVE_ACCEPTANCE = REGISTRY.register(
+    Gauge(
+        "llm_speculative_acceptance_ratio",
+        "Accepted / drafted tokens since the drafter was attached",
+        ["method"],
+    )
+)
+TOOL_CALL_STOPS = REGISTRY.register(
+    Counter(
+        "llm_tool_call_stops_total",
+        "Completions stopped once their tool calls were complete",
+    )
+)
+TOOL_CALL_STOP_BUDGET_LEFT = REGISTRY.register(
+    Counter(
+        "llm_tool_call_stop_budget_left_tokens_total",
+        "Token budget left when completions were stopped after their tool calls",
+    )
+)
+RESIDENT_MEMORY = REGISTRY.register(
+    Gauge(
+        "process_resident_memory_bytes",
+        "Resident memory size in bytes",
+        function=resident_memory_bytes,
+    )
+)
+
+
+class CompletionTimer:
+    """Per-completion timing, fed by llama's per-token stopping criteria hook.
+
+    llama calls stopping criteria right after sampling each token, so the
+    first call marks the end of prompt evaluation and the calls after it pace
+    decoding. It calls them once more after its loop without evaluating
+    another token; that call has the same ``input_ids`` length as the one
+    before and is not counted. Pass the timer in a ``StoppingCriteriaList``
+    (it never stops generation), call ``start_prefill`` once the prompt is
+    ready and ``record`` once the completion has finished.
+    """
+
+    def __init__(self, queued_at: Optional[float] = None):
+        self.started_at = time.monotonic()
+        self.prefill_started_at = self.started_at
+        self.queued_at = queued_at
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.tokens = 0
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        # Length of input_ids at the last call
+        self._evaluated = -1
+
+    def start_prefill(self):
+        """Start the prefill clock, so that fitting the context is not counted."""
+        self.prefill_started_at = time.monotonic()
+
+    def __call__(self, input_ids, logits) -> bool:
+        if len(input_ids) == self._evaluated:
+            return False
+        self._evaluated = len(input_ids)
+        now = time.monotonic()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.last_token_at = now
+        self.tokens += 1
+        return False
+
+    def record(self, stream: bool, outcome: str):
+        """Publish this completion's numbers to the module metrics."""
+        stream_label = "true" if stream else "false"
+        COMPLETIONS.inc(stream=stream_label, outcome=outcome)
+        if self.queued_at is not None:
+            QUEUE_WAIT.observe(self.started_at - self.queued_at)
+        PROMPT_TOKENS.inc(self.prompt_tokens)
+        PROMPT_TOKENS_CACHED.inc(self.cached_tokens)
+        GENERATED_TOKENS.inc(self.tokens)
+        if self.first_token_at is None:
+            return
+        prefill_time = self.first_token_at - self.prefill_started_at
+        TIME_TO_FIRST_TOKEN.observe(prefill_time, stream=stream_label)
+        evaluated = self.prompt_tokens - self.cached_tokens
+        if evaluated > 0 and prefill_time > 0:
+            PREFILL_RATE.set(evaluated / prefill_time)
+        decode_time = self.last_token_at - self.first_token_at
+        if self.tokens > 1 and decode_time > 0:
+            DECODE_RATE.set((self.tokens - 1) / decode_time)
@@ -0,0 +1,314 @@
+"""
+Resident model registry for the LLM server.
+
+Switching models used to throw the previous model away and load the next one
+while the request waited. The ModelRegistry keeps several loaded models
+within a memory budget, evicting the least recently used ones, and can load a
+model on a background thread so that switching to it later is only a swap of
+references.
+
+Loading itself is delegated to a loader function returning a ResidentModel.
+Room is made before a model is loaded, from an estimate of its memory use,
+so the old and the new model never exceed the budget together.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ResidentModel:
+    """A loaded model with everything built for it at load time."""
+
+    def __init__(
+        self,
+        name: str,
+        model: Any,
+        load_model_configs: Dict[str, Any],
+        size_bytes: int = 0,
+        **resources: Any,
+    ):
+        """Initialize the entry.
+
+        Args:
+            name: Model file name.
+            model: The loaded model, closed on eviction if it has ``close()``.
+            load_model_configs: Configs the model was loaded with.
+            size_bytes: Estimated memory the model takes, set by the registry.
+            **resources: Objects built for the model (renderer, ...), kept as
+                attributes.
+        """
+        self.name = name
+        self.model = model
+        self.load_model_configs = dict(load_model_configs)
+        self.size_bytes = size_bytes
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.__dict__.update(resources)
+
+    def info(self) -> Dict[str, Any]:
+        info = {
+            "name": self.name,
+            "size_bytes": self.size_bytes,
+            "loaded_at": self.loaded_at,
+            "last_used": self.last_used,
+            "load_model_configs": self.load_model_configs,
+        }
+        if "load_plan" in self.__dict__:
+            info["load_plan"] = self.load_plan
+        return info
+
+    def close(self):
+        close = getattr(self.model, "close", None)
+        if close is not None:
+            close()
+        self.model = None
+
+
+class ModelRegistry:
+    """Loaded models kept within a memory budget, least recently used evicted first."""
+
+    def __init__(
+        self,
+        loader: Callable[[str, Dict[str, Any]], ResidentModel],
+        estimate: Callable[[str, Dict[str, Any], int], int],
+        budget_bytes: int,
+        max_models: int = 2,
+        matches: Optional[Callable[[ResidentModel, Dict[str, Any]], bool]] = None,
+    ):
+        """Initialize the registry.
+
+        Args:
+            loader: Loads a model by file name and load configs.
+            estimate: Memory a model will take with the given load configs,
+                also given the bytes of resident models the load may evict
+                (less loads in flight), which the caller may plan to reuse.
+            budget_bytes: Memory all resident models may take together.
+            max_models: Maximum number of resident models.
+            matches: Whether a resident model satisfies a request's load
+                configs; by default any resident instance does.
+        """
+        self.loader = loader
+        self.estimate = estimate
+        self.budget_bytes = budget_bytes
+        self.max_models = max(1, max_models)
+        self.matches = matches or (lambda entry, configs: True)
+        self._lock = threading.Lock()
+        self._models: "OrderedDict[str, ResidentModel]" = OrderedDict()
+        self._loading: Dict[str, Future] = {}
+        # Estimated memory of loads in flight, by model name
+        self._reserved: Dict[str, int] = {}
+        # Set by load(), which the worker calls; never evicted by background
+        # loads, since the worker thread may be using it
+        self.active: Optional[str] = None
+
+    @property
+    def size_bytes(self) -> int:
+        with self._lock:
+            return sum(entry.size_bytes for entry in self._models.values())
+
+    def resident(self) -> List[Dict[str, Any]]:
+        """Resident models, most recently used last."""
+        with self._lock:
+            return [entry.info() for entry in self._models.values()]
+
+    def is_resident(self, name: str) -> bool:
+        with self._lock:
+            return name in self._models
+
+    def get(
+        self, name: str, load_model_configs: Dict[str, Any]
+    ) -> Optional[ResidentModel]:
+        """The resident model satisfying ``load_model_configs``, None if not loaded."""
+        return self._get(name, load_model_configs, activate=False)
+
+    def _get(
+        self, name: str, load_model_configs: Dict[str, Any], activate: bool
+    ) -> Optional[ResidentModel]:
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is None or not self.matches(entry, load_model_configs):
+                return None
+            entry.last_used = time.time()
+            self._models.move_to_end(name)
+            if activate:
+                # Under the lock that background loads evict under, so the
+                # entry cannot be closed before the worker swaps it in
+                self.active = name
+            return entry
+
+    def load(self, name: str, load_model_configs: Dict[str, Any]) -> ResidentModel:
+        """Return the model as the active one, loading it in the calling thread if needed.
+
+        Waits for a background load of the same model instead of starting a
+        second one. The active model may be evicted to make room, so call this
+        from the thread that uses the active model.
+        """
+        entry = self._get(name, load_model_configs, activate=True)
+        if entry is not None:
+            return entry
+        with self._lock:
+            pending = self._loading.get(name)
+        if pending is not None:
+            try:
+                pending.result()
+            except Exception as e:
+                logger.warning(f"Background load of '{name}' failed, retrying: {e}")
+            entry = self._get(name, load_model_configs, activate=True)
+            if entry is not None:
+                return entry
+        return self._load(name, load_model_configs, evict_active=True)
+
+    def preload(self, name: str, load_model_configs: Dict[str, Any]) -> Future:
+        """Load a model on a background thread, leaving the active model alone.
+
+        The returned future resolves to the ResidentModel, to None if the
+        model is the active one with other load configs (only the worker may
+        replace it), or fails if the model does not fit next to the active one.
+        """
+        future: Future = Future()
+        entry = self.get(name, load_model_configs)
+        if entry is not None:
+            future.set_result(entry)
+            return future
+        with self._lock:
+            if name == self.active:
+                # Replacing it would close the instance the worker is using;
+                # the worker reloads it when the request gets there
+                future.set_result(None)
+                return future
+            pending = self._loading.get(name)
+            if pending is not None:
+                return pending
+            self._loading[name] = future
+
+        def run():
+            try:
+                entry = self._load(name, load_model_configs, evict_active=False)
+                future.set_result(entry)
+            except Exception as e:
+                logger.error(f"Background load of '{name}' failed: {e}")
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._loading.pop(name, None)
+
+        threading.Thread(target=run, name=f"preload-{name}", daemon=True).start()
+        return future
+
+    def evict(self, name: str) -> bool:
+        """Unload a resident model. The active model is only evicted explicitly."""
+        return self._evict(name, keep_active=False)
+
+    def _evict(self, name: str, keep_active: bool) -> bool:
+        with self._lock:
+            if keep_active and name == self.active:
+                return False
+            entry = self._models.pop(name, None)
+            if entry is not None and self.active == name:
+                self.active = None
+        if entry is None:
+            return False
+        entry.close()
+        logger.info(f"Evicted model '{name}' ({entry.size_bytes >> 20} MB)")
+        return True
+
+    def clear(self):
+        for name in list(self._models):
+            self.evict(name)
+
+    def _load(
+        self, name: str, load_model_configs: Dict[str, Any], evict_active: bool
+    ) -> ResidentModel:
+        with self._lock:
+            # Resident models this load may evict count as memory it can use;
+            # loads in flight have not taken theirs yet
+            reclaimable = sum(
+                entry.size_bytes
+                for entry in self._models.values()
+                if evict_active or entry.name != self.active
+            )
+            reclaimable -= sum(
+                size for other, size in self._reserved.items() if other != name
+            )
+        size_bytes = self.estimate(name, load_model_configs, reclaimable)
+        self._make_room(name, size_bytes, evict_active)
+        try:
+            entry = self.loader(name, load_model_configs)
+        except BaseException:
+            with self._lock:
+                self._reserved.pop(name, None)
+            raise
+        entry.size_bytes = size_bytes
+        with self._lock:
+            self._reserved.pop(name, None)
+            replaced = self._models.pop(name, None)
+            self._models[name] = entry
+            if evict_active:
+                self.active = name
+        if replaced is not None:
+            # Same file loaded with other configs; only the new instance stays
+            replaced.close()
+        logger.info(
+            f"Model '{name}' is resident ({entry.size_bytes >> 20} MB, "
+            f"{self.size_bytes >> 20}/{self.budget_bytes >> 20} MB in use)"
+        )
+        return entry
+
+    def _committed_bytes(self, name: str) -> int:
+        """Memory of resident models and of other loads in flight. Call under the lock."""
+        return sum(entry.size_bytes for entry in self._models.values()) + sum(
+            size for other, size in self._reserved.items() if other != name
+        )
+
+    def _make_room(self, name: str, size_bytes: int, evict_active: bool):
+        """Evict least recently used models until ``size_bytes`` more fit the budget.
+
+        Loads in flight cannot be evicted and count as taken, so that two
+        loads do not overcommit together. On success ``size_bytes`` is
+        reserved for ``name`` until the model is resident.
+        """
+        with self._lock:
+            # An instance of the same file is only replaced once the new one
+            # is loaded, so it stays counted
+            kept = [
+                entry
+                for entry in self._models.values()
+                if not evict_active and entry.name == self.active
+            ]
+            victims = [entry.name for entry in self._models.values() if entry not in kept]
+        for victim in victims:
+            with self._lock:
+                used = self._committed_bytes(name)
+                count = sum(1 for entry in self._models.values() if entry.name != name)
+                count += sum(1 for other in self._reserved if other != name)
+            if used + size_bytes <= self.budget_bytes and count < self.max_models:
+                break
+            # The worker may have activated a victim since they were chosen
+            self._evict(victim, keep_active=not evict_active)
+        with self._lock:
+            used = self._committed_bytes(name)
+            # Memory a preload cannot take back: the active model and other loads
+            pinned = used - sum(
+                entry.size_bytes
+                for entry in self._models.values()
+                if entry.name != self.active
+            )
+            if not evict_active and pinned > 0 and used + size_bytes > self.budget_bytes:
+                raise MemoryError(
+                    f"Model '{name}' ({size_bytes >> 20} MB) does not fit next to "
+                    f"the active model and loads in progress within "
+                    f"{self.budget_bytes >> 20} MB"
+                )
+            self._reserved[name] = size_bytes
+        if used + size_bytes > self.budget_bytes:
+            # A single model over the budget is still allowed to run
+            logger.warning(
+                f"Model '{name}' needs {size_bytes >> 20} MB, "
+                f"{used >> 20} MB are taken of the {self.budget_bytes >> 20} MB budget"
+            )
@@ -0,0 +1,326 @@
+"""
+Chat prompt rendering for the LLM server.
+
+Compiling the GGUF chat template and re-rendering the whole conversation on
+every request shows up in time-to-first-token once histories get long. The
+ChatPromptRenderer compiles each template once and renders a conversation as a
+head (system message and tools) followed by one chunk per user turn. Rendered
+text and tokens of every piece are memoized, so a request that appends a turn
+only renders and tokenizes that turn.
+
+Chunked rendering is only used when a probe conversation renders identically
+both ways; templates that look across turn boundaries fall back to a full
+render with the cached compiled template.
+"""
+
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import jinja2
+import jinja2.ext
+from jinja2.sandbox import ImmutableSandboxedEnvironment
+
+logger = logging.getLogger(__name__)
+
+_PROBE_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "probe",
+            "description": "Probe tool",
+            "parameters": {
+                "type": "object",
+                "properties": {"query": {"type": "string"}},
+                "required": ["query"],
+            },
+        },
+    }
+]
+
+_PROBE_MESSAGES = [
+    {"role": "system", "content": "You are a probe."},
+    {"role": "user", "content": "Hello"},
+    {"role": "assistant", "content": "Hi there."},
+    {"role": "user", "content": "Look something up"},
+    {
+        "role": "assistant",
+        "content": '<tool_call>\n{"name": "probe", "arguments": {"query": "x"}}\n</tool_call>',
+    },
+    {"role": "tool", "content": "first result"},
+    {"role": "tool", "content": "second result"},
+    {"role": "assistant", "content": "Done."},
+    {"role": "user", "content": "Thanks"},
+]
+
+
+def _raise_exception(message: str):
+    raise ValueError(message)
+
+
+def _strftime_now(fmt: str) -> str:
+    return datetime.now().strftime(fmt)
+
+
+def _tojson(
+    x: Any,
+    ensure_ascii: bool = False,
+    indent: Optional[int] = None,
+    separators: Optional[Tuple[str, str]] = None,
+    sort_keys: bool = False,
+) -> str:
+    return json.dumps(
+        x,
+        ensure_ascii=ensure_ascii,
+        indent=indent,
+        separators=separators,
+        sort_keys=sort_keys,
+    )
+
+
+@lru_cache(maxsize=8)
+def compile_template(source: str) -> jinja2.Template:
+    """Compile a chat template once per distinct source string.
+
+    The environment mirrors the one llama-cpp-python uses for GGUF templates,
+    so rendered prompts match what ``create_chat_completion`` produced.
+    """
+    environment = ImmutableSandboxedEnvironment(
+        loader=jinja2.BaseLoader(),
+        trim_blocks=True,
+        lstrip_blocks=True,
+        extensions=[jinja2.ext.loopcontrols],
+    )
+    environment.filters["tojson"] = _tojson
+    return environment.from_string(source)
+
+
+def _digest(*parts: Any) -> str:
+    return hashlib.sha1(
+        json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+class ChatPromptRenderer:
+    """Renders chat messages into a prompt string or prompt tokens."""
+
+    def __init__(
+        self,
+        template: str,
+        bos_token: str = "",
+        eos_token: str = "",
+        tokenize: Optional[Callable[[str], List[int]]] = None,
+        max_chunks: int = 512,
+    ):
+        """Initialize the renderer.
+
+        Args:
+            template: Jinja chat template source from the model metadata.
+            bos_token: Text of the model's BOS token, exposed to the template.
+            eos_token: Text of the model's EOS token, exposed to the template.
+            tokenize: Converts rendered text to tokens (special tokens parsed,
+                no BOS added). Required for ``render_tokens``.
+            max_chunks: Number of rendered turns kept in memory.
+        """
+        self.template = compile_template(template)
+        self.bos_token = bos_token
+        self.eos_token = eos_token
+        self.max_chunks = max_chunks
+        self._tokenize = tokenize
+        # head key -> (head text, generation prompt text)
+        self._heads: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        # chunk key -> rendered text of one turn
+        self._chunks: "OrderedDict[str, str]" = OrderedDict()
+        # rendered text -> tokens, for heads, turns and generation prompts
+        self._tokens: "OrderedDict[str, Tuple[int, ...]]" = OrderedDict()
+
+        self.incremental = self._probe_text()
+        self.incremental_tokens = self.incremental and self._probe_tokens()
+        logger.info(
+            f"Chat template compiled (incremental rendering: {self.incremental}, "
+            f"token reuse: {self.incremental_tokens})"
+        )
+
+    @classmethod
+    def for_model(cls, model) -> Optional["ChatPromptRenderer"]:
+        """Build a renderer for a loaded llama model, None if it has no template."""
+        template = model.metadata.get("tokenizer.chat_template")
+        if not template:
+            return None
+        eos_id, bos_id = model.token_eos(), model.token_bos()
+        return cls(
+            template,
+            bos_token=model._model.token_get_text(bos_id) if bos_id != -1 else "",
+            eos_token=model._model.token_get_text(eos_id) if eos_id != -1 else "",
+            tokenize=lambda text: model.tokenize(
+                text.encode("utf-8"), add_bos=False, special=True
+            ),
+        )
+
+    def stop_sequences(self, stop: Optional[Union[str, List[str]]]) -> List[str]:
+        """Request stop strings plus the template's end of turn."""
+        stop = [] if stop is None else [stop] if isinstance(stop, str) else list(stop)
+        return stop + [self.eos_token]
+
+    def render(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        add_generation_prompt: bool = True,
+    ) -> str:
+        """Render ``messages`` and ``tools`` into the model's prompt format."""
+        pieces = self._pieces(messages, tools, add_generation_prompt)
+        if pieces is None:
+            return self._render(messages, tools, add_generation_prompt)
+        return "".join(pieces)
+
+    def render_tokens(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        add_generation_prompt: bool = True,
+    ) -> List[int]:
+        """Render and tokenize, reusing the tokens of previously seen pieces."""
+        if self._tokenize is None:
+            raise RuntimeError("render_tokens() requires a tokenize function")
+        pieces = self._pieces(messages, tools, add_generation_prompt)
+        if pieces is None or not self.incremental_tokens:
+            text = (
+                "".join(pieces)
+                if pieces is not None
+                else self._render(messages, tools, add_generation_prompt)
+            )
+            return self._tokenize(text)
+        tokens: List[int] = []
+        for piece in pieces:
+            tokens.extend(self._piece_tokens(piece))
+        return tokens
+
+    def clear(self):
+        self._heads.clear()
+        self._chunks.clear()
+        self._tokens.clear()
+
+    def _render(
+        self,
+        messages: Sequence[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]],
+        add_generation_prompt: bool,
+    ) -> str:
+        return self.template.render(
+            messages=list(messages),
+            tools=tools,
+            bos_token=self.bos_token,
+            eos_token=self.eos_token,
+            add_generation_prompt=add_generation_prompt,
+            raise_exception=_raise_exception,
+            strftime_now=_strftime_now,
+        )
+
+    def _pieces(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]],
+        add_generation_prompt: bool,
+    ) -> Optional[List[str]]:
+        """Split the prompt into head, per-turn chunks and generation prompt.
+
+        Returns None when the conversation cannot be rendered in pieces.
+        """
+        if not self.incremental or not messages or messages[0]["role"] != "system":
+            return None
+        head = messages[:1]
+        head_key = _digest(head, tools)
+        cached = self._heads.get(head_key)
+        if cached is None:
+            head_text = self._render(head, tools, False)
+            generation = self._render(head, tools, True)
+            if not generation.startswith(head_text):
+                return None
+            cached = (head_text, generation[len(head_text) :])
+            self._remember(self._heads, head_key, cached, 8)
+        else:
+            self._heads.move_to_end(head_key)
+        head_text, generation_text = cached
+
+        pieces = [head_text]
+        for turn in self._turns(messages[1:]):
+            chunk_key = _digest(head_key, turn)
+            chunk = self._chunks.get(chunk_key)
+            if chunk is None:
+                rendered = self._render(head + turn, tools, False)
+                if not rendered.startswith(head_text):
+                    return None
+                chunk = rendered[len(head_text) :]
+                self._remember(self._chunks, chunk_key, chunk, self.max_chunks)
+            else:
+                self._chunks.move_to_end(chunk_key)
+            pieces.append(chunk)
+        if add_generation_prompt:
+            pieces.append(generation_text)
+        return pieces
+
+    @staticmethod
+    def _turns(messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Group messages into turns, each starting at a user message."""
+        turns: List[List[Dict[str, Any]]] = []
+        for message in messages:
+            if not turns or message["role"] == "user":
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    def _piece_tokens(self, piece: str) -> Tuple[int, ...]:
+        tokens = self._tokens.get(piece)
+        if tokens is None:
+            tokens = tuple(self._tokenize(piece))
+            self._remember(self._tokens, piece, tokens, self.max_chunks + 16)
+        else:
+            self._tokens.move_to_end(piece)
+        return tokens
+
+    @staticmethod
+    def _remember(cache: OrderedDict, key: Any, value: Any, limit: int):
+        cache[key] = value
+        if len(cache) > limit:
+            cache.popitem(last=False)
+
+    def _probe_conversations(self):
+        for tools in (None, _PROBE_TOOLS):
+            for end in range(2, len(_PROBE_MESSAGES) + 1):
+                for add_generation_prompt in (False, True):
+                    yield _PROBE_MESSAGES[:end], tools, add_generation_prompt
+
+    def _probe_text(self) -> bool:
+        """Check that rendering in pieces reproduces a full render."""
+        self.incremental = True
+        try:
+            for messages, tools, add_generation_prompt in self._probe_conversations():
+                pieces = self._pieces(messages, tools, add_generation_prompt)
+                full = self._render(messages, tools, add_generation_prompt)
+                if pieces is None or "".join(pieces) != full:
+                    return False
+            return True
+        except Exception as e:
+            logger.debug(f"Chat template probe failed: {e}")
+            return False
+        finally:
+            self.clear()
+
+    def _probe_tokens(self) -> bool:
+        """Check that concatenated piece tokens match tokenizing the whole prompt."""
+        if self._tokenize is None:
+            return False
+        try:
+            for messages, tools, add_generation_prompt in self._probe_conversations():
+                pieces = self._pieces(messages, tools, add_generation_prompt)
+                joined = [t for piece in pieces for t in self._tokenize(piece)]
+                if joined != list(self._tokenize("".join(pieces))):
+                    return False
+            return True
+        finally:
+            self.clear()
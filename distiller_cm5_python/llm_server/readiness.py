@@ -0,0 +1,94 @@
+"""
+Startup readiness for the LLM server.
+
+The server binds its port before the default model is loaded. ``/livez``
+answers as soon as the process serves HTTP, ``/readyz`` only once the model
+is loaded and warmed up. A process manager that would rather not poll can
+be told directly:
+
+- ``--ready_fd N``: one line written to an inherited pipe, ``ready`` or
+  ``failed: <reason>``, after which the pipe is closed.
+- ``NOTIFY_SOCKET``: the systemd notify protocol over a UNIX datagram
+  socket (``READY=1`` or ``STATUS=...``), for ``Type=notify`` units.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+STARTING = "starting"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class Readiness:
+    """Startup state of the server, reported once it is ready or has failed."""
+
+    def __init__(self):
+        self.state = STARTING
+        self.error: Optional[str] = None
+        self.ready_fd: Optional[int] = None
+        self._started = time.monotonic()
+        self._ready_after: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    def info(self) -> Dict[str, Any]:
+        info: Dict[str, Any] = {"status": self.state}
+        if self.error:
+            info["error"] = self.error
+        if self._ready_after is not None:
+            info["ready_after_s"] = round(self._ready_after, 3)
+        return info
+
+    def loading(self):
+        self.state = LOADING
+        _sd_notify("STATUS=Loading model")
+
+    def set_ready(self):
+        self._ready_after = time.monotonic() - self._started
+        self.state = READY
+        logger.info(f"Server ready {self._ready_after:.2f}s after startup")
+        self._notify("ready", "READY=1\nSTATUS=Ready")
+
+    def set_failed(self, error: str):
+        self.error = error
+        self.state = FAILED
+        # Newlines would split the one line message
+        error = " ".join(error.split())
+        self._notify(f"failed: {error}", f"STATUS=Failed: {error}")
+
+    def _notify(self, line: str, sd_message: str):
+        with self._lock:
+            fd, self.ready_fd = self.ready_fd, None
+        if fd is not None:
+            try:
+                os.write(fd, (line + "\n").encode("utf-8"))
+            except OSError as e:
+                logger.warning(f"Could not write readiness to fd {fd}: {e}")
+            finally:
+                os.close(fd)
+        _sd_notify(sd_message)
+
+
+def _sd_notify(message: str):
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not address:
+        return
+    if address.startswith("@"):
+        # Abstract namespace socket
+        address = "\0" + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(message.encode("utf-8"), address)
+    except OSError as e:
+        logger.warning(f"Could not notify {address!r}: {e}")
@@ -3,24 +3,85 @@
 LLM Server - Provides LLM services over HTTP
 """
 import argparse
+import asyncio
 import logging
 import json
 import os
+import socket
+import stat
 import sys
-from typing import Dict, List, Any, Optional
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Dict, List, Any, Optional
 
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
 import uvicorn
-from llama_cpp import Llama
 
-from llama_cpp.llama_cache import LlamaDiskCache
-from jinja2 import Template
 import re
 
 # Import the centralized logging setup
 from distiller_cm5_python.utils.logger import setup_logging
+from distiller_cm5_python.llm_server.kv_cache import (
+    DiskStateCache,
+    StatePool,
+    common_prefix_length,
+    remove_legacy_disk_cache,
+)
+from distiller_cm5_python.llm_server.autotune import (
+    AutotuneProfiles,
+    autotune,
+    cpu_signature,
+)
+from distiller_cm5_python.llm_server.context_window import (
+    DEFAULT_CONTEXT_POLICY,
+    ContextFitter,
+    SummaryCache,
+    parse_context_policy,
+)
+from distiller_cm5_python.llm_server.gguf_index import GGUFIndex, estimate_memory
+from distiller_cm5_python.llm_server.inference_worker import (
+    InferenceJob,
+    InferenceWorker,
+    JobCancelledError,
+    QueueFullError,
+    WorkerUnavailableError,
+)
+from distiller_cm5_python.llm_server.memory_planner import (
+    KV_CACHE_TYPES,
+    available_memory_bytes,
+    plan_load,
+)
+from distiller_cm5_python.llm_server.metrics import (
+    CACHE_RESTORE,
+    CONTEXT_SUMMARY,
+    MODEL_LOAD,
+    REGISTRY,
+    CallbackCounter,
+    TOOL_CALL_STOPS,
+    TOOL_CALL_STOP_BUDGET_LEFT,
+    CompletionTimer,
+    Gauge,
+)
+from distiller_cm5_python.llm_server.model_registry import ModelRegistry, ResidentModel
+from distiller_cm5_python.llm_server.prompt_renderer import ChatPromptRenderer
+from distiller_cm5_python.llm_server.readiness import LOADING, Readiness
+from distiller_cm5_python.llm_server.sessions import SessionConflict, SessionStore
+from distiller_cm5_python.llm_server.speculative import (
+    enable_speculative_decoding,
+    speculative_settings,
+)
+from distiller_cm5_python.llm_server.sse import STREAM_FORMATS, SSEStreamEncoder
+from distiller_cm5_python.llm_server.tool_grammar import (
+    ToolCallStop,
+    create_tool_call_completion,
+    tool_call_grammar,
+)
+
+if TYPE_CHECKING:
+    # llama_cpp takes most of the import time, it is imported when first used
+    from llama_cpp import Llama
 
 # --- Logging setup will be done in main() after parsing args ---
 
@@ -28,14 +89,131 @@ from distiller_cm5_python.utils.logger import setup_logging
 # We get the logger instance here, but configuration (level, stream) happens in main()
 logger = logging.getLogger(__name__)
 
+MODEL_NAME = None
+MODEL = None
+# Compiled chat template of MODEL with memoized per-turn renders
+RENDERER: Optional[ChatPromptRenderer] = None
+# Owns every call into MODEL once the server is up; replaced in main() to apply CLI limits
+WORKER = InferenceWorker()
+# Recently used KV states of the loaded model, attached to it as its prompt cache
+STATE_POOL = StatePool()
+# Summaries of turns dropped from the context, reused while the same turns are dropped
+SUMMARY_CACHE = SummaryCache()
+CACHE_ROOT = os.path.join(os.path.dirname(__file__), "cache")
+# Persisted system prompt + tools states; limits are applied in main()
+DISK_CACHE = DiskStateCache(cache_dir=os.path.join(CACHE_ROOT, "kv_states"))
+MODELS_DIR = os.path.join(os.path.dirname(__file__), "models")
+GGUF_INDEX = GGUFIndex(
+    MODELS_DIR, index_path=os.path.join(CACHE_ROOT, "gguf_index.json")
+)
+# n_ctx memory estimates are given for when a request does not name one
+DEFAULT_N_CTX = 4096
+# Memory left free for the client, UI and OS when planning a model load, and
+# load plans computed for the models the registry is about to load
+MEMORY_RESERVE_MB = 768
+LOAD_PLANS: Dict[str, Dict[str, Any]] = {}
+# Startup progress behind /readyz; the default model named on the command
+# line is loaded in the background once the port is bound
+READINESS = Readiness()
+DEFAULT_MODEL_NAME: Optional[str] = None
+DEFAULT_MODEL_CONFIGS: Dict[str, Any] = {}
+AUTOTUNE = False
+# Thread and batch settings measured by --autotune, per model file and CPU
+AUTOTUNE_PROFILES = AutotuneProfiles(os.path.join(CACHE_ROOT, "autotune.json"))
+# Budget for coalescing streamed content deltas into one SSE frame
+SSE_FLUSH_INTERVAL = 0.03
+SSE_FLUSH_BYTES = 64
+# Speculative decoding keys MODEL was loaded with, and the memory its
+# all-position logits buffer may take
+SPECULATIVE_SETTINGS: Dict[str, Any] = {}
+SPECULATIVE_LOGITS_MB = 2048
+# Constrain <tool_call> blocks with a grammar built from the request's tools
+TOOL_GRAMMAR = True
+# End generation once the tool calls are complete; requests can override it
+# with tool_call_stop and cap the calls with max_tool_calls
+TOOL_CALL_STOP = True
+# How prompts longer than the context window are fitted, and the tokens kept
+# free for the reply; requests can override the policy with context_policy
+CONTEXT_POLICY = DEFAULT_CONTEXT_POLICY
+CONTEXT_RESERVE = 256
+SUMMARY_PROMPT = (
+    "Summarize the following conversation between a user and an assistant in a "
+    "few sentences. Keep facts, names, settings and tool results the assistant "
+    "may need later."
+)
+
+# Conversations kept for clients that send only new messages; limits are
+# applied in main()
+SESSIONS = SessionStore()
+
+# Owned by the objects above and read when /metrics is scraped
+REGISTRY.register(
+    Gauge(
+        "llm_queue_depth",
+        "Jobs waiting behind the running one",
+        function=lambda: WORKER.queue_depth,
+    )
+)
+REGISTRY.register(
+    Gauge(
+        "llm_worker_busy",
+        "1 while the inference worker is running a job",
+        function=lambda: float(WORKER.busy),
+    )
+)
+REGISTRY.register(
+    Gauge(
+        "llm_chat_sessions",
+        "Chat sessions held for incremental requests",
+        function=lambda: len(SESSIONS),
+    )
+)
+REGISTRY.register(
+    CallbackCounter(
+        "llm_kv_cache_hits_total",
+        "Prefix lookups that found a cached KV state",
+        ["tier"],
+        function=lambda: {("memory",): STATE_POOL.hits, ("disk",): DISK_CACHE.hits},
+    )
+)
+REGISTRY.register(
+    CallbackCounter(
+        "llm_kv_cache_misses_total",
+        "Prefix lookups that found no cached KV state",
+        ["tier"],
+        function=lambda: {("memory",): STATE_POOL.misses, ("disk",): DISK_CACHE.misses},
+    )
+)
+REGISTRY.register(
+    Gauge(
+        "llm_kv_cache_bytes",
+        "Size of the cached KV states",
+        ["tier"],
+        function=lambda: {
+            ("memory",): STATE_POOL.cache_size,
+            ("disk",): DISK_CACHE.size_bytes,
+        },
+    )
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    WORKER.start()
+    DISK_CACHE.start_pruner()
+    _start_default_model()
+    yield
+    WORKER.stop()
+    DISK_CACHE.stop_pruner()
+
+
 # Create FastAPI app
 app = FastAPI(
-    title="LLM Server", description="A simple LLM server that provides LLM services"
+    title="LLM Server",
+    description="A simple LLM server that provides LLM services",
+    lifespan=lifespan,
 )
 
-MODEL_NAME = None
-MODEL = None
-
 
 # Define request and response models
 class Message(BaseModel):
@@ -69,6 +247,15 @@ class ChatCompletionRequest(BaseModel):
     tools: Optional[List[Tool]] = None
     model: Optional[str] = None
     stream: Optional[bool] = False
+    # "openai" chunk envelopes or "compact" delta-only frames
+    stream_format: Optional[str] = "openai"
+    # Lets the client abort the generation through /abort/{request_id}
+    request_id: Optional[str] = None
+    # With a session, messages (and tools, unless None) are kept between
+    # requests; base_length set means messages only holds those added after
+    # the first base_length ones
+    session_id: Optional[str] = None
+    base_length: Optional[int] = None
     inference_configs: Optional[Dict[str, Any]] = dict()
     load_model_configs: Optional[Dict[str, Any]] = dict()
 
@@ -100,44 +287,64 @@ class RestoreCacheRequest(BaseModel):
 
 
 class Cache:
-    def __init__(self, model: Llama):
-        self.model = model
-        self.cache_context = None
-
-    def get_cache_key(self, prompt: str):
-        return self.model.tokenize(prompt.encode("utf-8"))
-
     @staticmethod
     def build_cache(
-        cache_dir: str,
-        prompts: str,
-        model: Llama,
-        temperature: float = 0.0,
-        capacity_bytes: int = 2 << 30,
+        prompt_tokens: List[int],
+        model: "Llama",
         seed: Optional[int] = None,
+        state_pool: Optional[StatePool] = None,
+        disk_cache: Optional[DiskStateCache] = None,
     ):
-        cache = Cache(model)
         if seed:
             model.set_seed(seed)
-        cache_context = LlamaDiskCache(cache_dir=cache_dir)
-        model.set_cache(cache_context)
-        prompt_tokens = cache.get_cache_key(prompts)
 
-        try:
-            cached_state = cache_context[prompt_tokens]
-            return cached_state
-        except Exception as e:
-            # cache non exist
-            model.reset()
-            _ = model(
-                prompts,
-                max_tokens=1,  # Minimal tokens for cache creation
-                temperature=temperature,
-                echo=False,
-            )
+        # Pooled states restore without touching the disk
+        prefix_state, prefix_len = None, 0
+        if state_pool is not None:
+            exact_state = state_pool.get(prompt_tokens)
+            if exact_state is not None:
+                logger.debug(f"State pool hit for {len(prompt_tokens)} prompt tokens")
+                return exact_state
+            prefix_state, prefix_len = state_pool.longest_prefix(prompt_tokens)
+
+        if disk_cache is not None:
+            disk_state, disk_prefix_len = disk_cache.longest_prefix(prompt_tokens)
+            if disk_prefix_len > prefix_len:
+                prefix_state, prefix_len = disk_state, disk_prefix_len
+
+        # The longest prefix may belong to a longer state, which covers the
+        # whole prompt without being its state
+        if prefix_len == len(prompt_tokens) and prefix_state.n_tokens == prefix_len:
+            logger.debug(f"Disk cache hit for {len(prompt_tokens)} prompt tokens")
+            cached_state = prefix_state
+        else:
+            # cache non exist, evaluate only what the best cached prefix lacks;
+            # at least the last token, so its logits are the prompt's own
+            prefix_len = min(prefix_len, len(prompt_tokens) - 1)
+            Cache.prefill(model, prompt_tokens, prefix_state, prefix_len)
             # Save the state to cache
-            cache_context[prompt_tokens] = model.save_state()
-            return cache_context[prompt_tokens]
+            cached_state = model.save_state()
+            if disk_cache is not None:
+                disk_cache.put(prompt_tokens, cached_state)
+
+        if state_pool is not None:
+            state_pool[prompt_tokens] = cached_state
+        return cached_state
+
+    @staticmethod
+    def prefill(model: "Llama", tokens, prefix_state=None, prefix_len: int = 0):
+        """Evaluate ``tokens``, reusing the first ``prefix_len`` of them from ``prefix_state``."""
+        if prefix_state is not None and prefix_len > 0:
+            model.load_state(prefix_state)
+            # Llama.eval drops KV entries beyond n_tokens before evaluating
+            model.n_tokens = prefix_len
+            logger.debug(
+                f"Reusing {prefix_len}/{len(tokens)} cached prompt tokens, evaluating the rest"
+            )
+            model.eval(tokens[prefix_len:])
+        else:
+            model.reset()
+            model.eval(tokens)
 
 
 @app.get("/")
@@ -145,6 +352,20 @@ async def root():
     return {"status": "ok", "message": "LLM Server is running"}
 
 
+@app.get("/livez")
+async def liveness():
+    """The process is up and serving HTTP, whether or not a model is loaded."""
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+async def readiness():
+    """Ready once the default model is loaded and warmed up."""
+    if not READINESS.ready:
+        raise HTTPException(status_code=503, detail=READINESS.info())
+    return dict(READINESS.info(), model=MODEL_NAME)
+
+
 @app.get("/health")
 async def health_check():
     if MODEL is None:
@@ -159,104 +380,618 @@ async def health_check():
         return {
             "status": "ok",
             "message": f"LLM Server is healthy, using model: {MODEL_NAME}",
+            "busy": WORKER.busy,
+            "queue_depth": WORKER.queue_depth,
         }
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         raise HTTPException(status_code=503, detail=f"Health check failed: {str(e)}")
 
 
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.get("/models")
-async def list_models():
+def list_models(n_ctx: Optional[int] = None):
+    """List the GGUF files with their header metadata, no model is loaded.
+
+    Runs in the thread pool, reading the header of a new file takes a moment.
+    """
+    n_ctx = n_ctx or DEFAULT_N_CTX
     try:
-        path = os.path.join(os.path.dirname(__file__), "models")
-        model_names = [
-            f
-            for f in os.listdir(path)
-            if os.path.isfile(os.path.join(path, f)) and f.endswith(".gguf")
-        ]
-        return {"models": [m for m in model_names]}
+        models = GGUF_INDEX.models()
+        metadata = {}
+        for name, summary in models.items():
+            metadata[name] = dict(summary)
+            if "error" not in summary:
+                metadata[name]["estimated_memory"] = estimate_memory(summary, n_ctx)
+        return {
+            "models": list(models),
+            "n_ctx": n_ctx,
+            "metadata": metadata,
+            "active": MODEL_NAME,
+            "resident": MODEL_REGISTRY.resident(),
+        }
     except Exception as e:
         logger.error(f"Error listing models: {e}")
         raise HTTPException(status_code=500, detail=f"Error listing models: {str(e)}")
 
 
+def _submit(fn, stream: bool = False, request_id: Optional[str] = None):
+    """Queue work on the inference worker, mapping admission failures to HTTP errors."""
+    try:
+        return WORKER.submit(fn, stream=stream, request_id=request_id)
+    except QueueFullError as e:
+        logger.warning(f"Rejecting request: {e}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except WorkerUnavailableError as e:
+        logger.error(f"Rejecting request: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+def _cancelled_error(e: JobCancelledError) -> HTTPException:
+    """503 for a job abandoned at shutdown, 499 for one cancelled by its client."""
+    logger.info(str(e))
+    return HTTPException(status_code=503 if e.shutdown else 499, detail=str(e))
+
+
+@app.get("/load_plan")
+def get_load_plan(model_name: str, n_ctx: Optional[int] = None, kv_cache_type: str = "auto"):
+    """The parameters a model would be loaded with right now, without loading it."""
+    load_model_configs: Dict[str, Any] = {"kv_cache_type": kv_cache_type}
+    if n_ctx:
+        load_model_configs["n_ctx"] = n_ctx
+    try:
+        return _plan_load(model_name, load_model_configs)
+    except ValueError as e:
+        raise HTTPException(status_code=404 if "not found" in str(e) else 400, detail=str(e))
+
+
+@app.post("/preload")
+async def preload_model(request: SetModel):
+    """Start loading a model in the background without making it active."""
+    if MODEL_REGISTRY.get(request.model_name, request.load_model_configs):
+        return {"status": "ok", "message": f"{request.model_name} is resident"}
+    try:
+        _model_path(request.model_name)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    # Failures are logged by the registry; a later switch loads on the worker
+    MODEL_REGISTRY.preload(request.model_name, request.load_model_configs)
+    return {"status": "loading", "message": f"{request.model_name} is loading"}
+
+
 @app.post("/setModel")
 async def set_model(request: SetModel):
     try:
-        load_model(request.model_name, request.load_model_configs)
+        await _preload_model(request.model_name, request.load_model_configs)
+        job = _submit(
+            lambda: load_model(request.model_name, request.load_model_configs)
+        )
+        await job.result()
         return {"status": "ok", "message": "model is change to " + request.model_name}
+    except JobCancelledError as e:
+        raise _cancelled_error(e)
     except Exception as e:
         logger.error(f"Error setting model: {e}")
         raise HTTPException(status_code=500, detail=f"Error set models: {str(e)}")
 
 
-def load_model(model_name, load_model_configs: dict[str, Any]):
-    global MODEL
-    global MODEL_NAME
-    model_path = os.path.join(os.path.dirname(__file__), "models", model_name)
+def _model_path(model_name: str) -> str:
+    model_path = os.path.join(MODELS_DIR, model_name)
     if not os.path.exists(model_path):
         raise ValueError(f"Model '{model_name}' not found in models directory")
+    return model_path
+
+
+def _plan_load(
+    model_name: str,
+    load_model_configs: Dict[str, Any],
+    reclaimable_bytes: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Load parameters for a model fitted to the memory it can use.
+
+    ``reclaimable_bytes`` is the memory of resident models the load may evict,
+    which counts as available; by default all of them, as for a load on the
+    worker. A preload keeps the active model, so the registry passes less.
+    The registry budget caps the result.
+    """
+    model_path = _model_path(model_name)
+    summary = GGUF_INDEX.get(model_name)
+    if summary is None or "error" in summary:
+        # No header to plan from, load as requested
+        n_ctx = load_model_configs.get("n_ctx", DEFAULT_N_CTX)
+        size_bytes = os.path.getsize(model_path)
+        return {
+            "llama_kwargs": {"n_ctx": n_ctx},
+            "kv_cache_type": "f16",
+            "estimated_memory": {"weights": size_bytes, "total": size_bytes},
+            "budget_bytes": MODEL_REGISTRY.budget_bytes,
+            "notes": ["GGUF header unavailable, memory planning skipped"],
+            "over_budget": False,
+        }
+    if reclaimable_bytes is None:
+        reclaimable_bytes = MODEL_REGISTRY.size_bytes
+    budget_bytes = min(
+        available_memory_bytes() + reclaimable_bytes - (MEMORY_RESERVE_MB << 20),
+        MODEL_REGISTRY.budget_bytes,
+    )
+    extra_bytes_per_ctx = 0
+    if speculative_settings(load_model_configs).get("speculative", "none") != "none":
+        # The all-position logits buffer, see speculative.check_logits_budget
+        extra_bytes_per_ctx = summary["n_vocab"] * 4
+    plan = plan_load(
+        summary,
+        load_model_configs,
+        budget_bytes,
+        default_n_ctx=DEFAULT_N_CTX,
+        extra_bytes_per_ctx=extra_bytes_per_ctx,
+    )
+    profile = AUTOTUNE_PROFILES.get(_autotune_key(model_name))
+    if profile:
+        # Tuned values replace the planner's defaults, not explicit configs;
+        # the batch only shrinks since the planned one is what fits
+        llama_kwargs = plan["llama_kwargs"]
+        for key in ("n_threads", "n_threads_batch"):
+            if key not in load_model_configs:
+                llama_kwargs[key] = profile[key]
+        if "n_batch" not in load_model_configs:
+            n_batch = min(profile["n_batch"], llama_kwargs["n_batch"])
+            llama_kwargs["n_batch"] = llama_kwargs["n_ubatch"] = n_batch
+        plan["notes"].append("autotuned thread and batch settings applied")
+    return plan
+
+
+def _autotune_key(model_name: str) -> str:
+    return AutotuneProfiles.key(
+        model_name,
+        DiskStateCache.model_fingerprint(_model_path(model_name)),
+        cpu_signature(),
+    )
+
 
-    MODEL = Llama(
+def _estimate_model_bytes(
+    model_name: str, load_model_configs: Dict[str, Any], reclaimable_bytes: int
+) -> int:
+    """Memory the model will take when loaded with ``load_model_configs``.
+
+    Plans the load as well; the registry calls the loader right after.
+    """
+    plan = _plan_load(model_name, load_model_configs, reclaimable_bytes)
+    LOAD_PLANS[model_name] = plan
+    return plan["estimated_memory"]["total"]
+
+
+def _load_resident(model_name: str, load_model_configs: Dict[str, Any]) -> ResidentModel:
+    """Load a model and build its renderer. Called by MODEL_REGISTRY."""
+    model_path = _model_path(model_name)
+    plan = LOAD_PLANS.pop(model_name, None) or _plan_load(model_name, load_model_configs)
+    logger.info(
+        f"Loading {model_name} with {plan['llama_kwargs']}, estimated "
+        f"{plan['estimated_memory']['total'] >> 20}/{plan['budget_bytes'] >> 20} MB"
+        + "".join(f"; {note}" for note in plan["notes"])
+    )
+    load_started = time.monotonic()
+    from llama_cpp import Llama
+
+    model = Llama(
         model_path=str(model_path),
         verbose=False,
         n_gpu_layers=0,
-        n_ctx=load_model_configs["n_ctx"],
+        **plan["llama_kwargs"],
+    )
+    try:
+        enable_speculative_decoding(
+            model, load_model_configs, MODELS_DIR, SPECULATIVE_LOGITS_MB
+        )
+    except Exception:
+        model.close()
+        raise
+    MODEL_LOAD.set(time.monotonic() - load_started, model=model_name)
+    return ResidentModel(
+        model_name,
+        model,
+        load_model_configs,
+        path=model_path,
+        renderer=ChatPromptRenderer.for_model(model),
+        speculative=speculative_settings(load_model_configs),
+        load_plan=plan,
+    )
+
+
+def _matches_configs(entry: ResidentModel, load_model_configs: Dict[str, Any]) -> bool:
+    """Whether a resident model can serve a request with these load configs."""
+    # The plan may have loaded a smaller context than requested; asking for
+    # the same one again must not reload the model
+    n_ctx = load_model_configs.get("n_ctx")
+    if n_ctx and n_ctx not in (entry.model.n_ctx(), entry.load_model_configs.get("n_ctx")):
+        return False
+    kv_cache_type = load_model_configs.get("kv_cache_type", "auto")
+    if kv_cache_type != "auto" and kv_cache_type != entry.load_plan["kv_cache_type"]:
+        return False
+    requested = speculative_settings(load_model_configs)
+    return not requested or requested == entry.speculative
+
+
+MODEL_REGISTRY = ModelRegistry(
+    loader=_load_resident,
+    estimate=_estimate_model_bytes,
+    budget_bytes=4096 << 20,
+    matches=_matches_configs,
+)
+REGISTRY.register(
+    Gauge(
+        "llm_resident_model_bytes",
+        "Estimated memory of each loaded model",
+        ["model"],
+        function=lambda: {
+            (entry["name"],): entry["size_bytes"] for entry in MODEL_REGISTRY.resident()
+        },
+    )
+)
+
+
+def _system_memory_mb() -> int:
+    """Total system memory in MB, 8 GB where /proc/meminfo is unavailable."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) >> 10
+    except (OSError, ValueError):
+        pass
+    return 8192
+
+
+def _activate(entry: ResidentModel):
+    """Make a resident model the one requests run on. Runs on the worker thread."""
+    global MODEL
+    global MODEL_NAME
+    global RENDERER
+    global SPECULATIVE_SETTINGS
+    if MODEL is entry.model:
+        return
+    MODEL = entry.model
+    RENDERER = entry.renderer
+    SPECULATIVE_SETTINGS = entry.speculative
+    # Pooled states and summaries belong to the previous model
+    STATE_POOL.clear()
+    SUMMARY_CACHE.clear()
+    MODEL.set_cache(_state_pool())
+    if _state_pool() is None:
+        logger.info(
+            f"State pool disabled for {entry.name}: with speculative decoding every "
+            f"saved state carries the n_tokens x n_vocab logits"
+        )
+    DISK_CACHE.bind_model(
+        entry.name,
+        DiskStateCache.model_fingerprint(entry.path),
+        DiskStateCache.template_hash(MODEL.metadata.get("tokenizer.chat_template")),
+        MODEL.n_ctx(),
     )
+    MODEL_NAME = entry.name
+
 
-    MODEL_NAME = model_name
+def _state_pool() -> Optional[StatePool]:
+    """STATE_POOL, or None while the active model keeps all-position logits.
+
+    llama saves the state after every completion when a cache is attached,
+    and speculative decoding makes each state n_tokens x n_vocab floats,
+    gigabytes for long prompts, that the pool would then reject anyway.
+    """
+    if MODEL is not None and getattr(MODEL, "draft_model", None) is not None:
+        return None
+    return STATE_POOL
+
+
+def load_model(model_name, load_model_configs: dict[str, Any]):
+    """Make ``model_name`` the active model, loading it unless it is resident."""
+    global MODEL
+    global MODEL_NAME
+    global RENDERER
+    try:
+        entry = MODEL_REGISTRY.load(model_name, load_model_configs)
+    except Exception:
+        if MODEL_NAME is not None and not MODEL_REGISTRY.is_resident(MODEL_NAME):
+            # The active model was evicted to make room for the failed one
+            MODEL, MODEL_NAME, RENDERER = None, None, None
+        raise
+    _activate(entry)
     logger.info(f"Loaded model: {model_name}")
     return True
 
 
-def _chat_completion(messages, tools, inference_configs):
-    """Non-streaming version"""
-    logger.debug("Generating non-streaming chat completion...")
-    response = MODEL.create_chat_completion(
-        messages=messages,
-        tools=tools,
+async def _preload_model(model_name: str, load_model_configs: Dict[str, Any]):
+    """Load a model in the background so the worker only has to swap it in.
+
+    Models that do not fit next to the active one, and the active model with
+    other load configs, are left to the worker, which may evict the active
+    model.
+    """
+    try:
+        await asyncio.wrap_future(
+            MODEL_REGISTRY.preload(model_name, load_model_configs)
+        )
+    except MemoryError as e:
+        logger.info(f"{e}; loading it on the worker instead")
+
+
+def _cancel_criterion(job: Optional[InferenceJob]):
+    """Stopping criterion ending a generation once ``job`` is cancelled."""
+    return lambda tokens, logits: job is not None and job.cancelled
+
+
+def _summarize_messages(
+    messages: List[Dict[str, Any]], max_tokens: int, job: Optional[InferenceJob] = None
+) -> str:
+    """Summarize messages dropped from the context with the loaded model.
+
+    Summaries are cached by the messages, so the requests of a growing
+    conversation share one summary, and the prompt prefix it is part of,
+    until more turns are dropped. Generating one stops when ``job`` is
+    cancelled.
+    """
+    key = SummaryCache.key(messages, max_tokens)
+    summary = SUMMARY_CACHE.get(key)
+    if summary is not None:
+        return summary
+    from llama_cpp import StoppingCriteriaList
+
+    transcript = "\n".join(f"{m['role']}: {m.get('content') or ''}" for m in messages)
+    # Keep the newest part of the transcript, ~2 characters per token is conservative
+    transcript = transcript[-(MODEL.n_ctx() - CONTEXT_RESERVE) * 2 :]
+    prompt_tokens = RENDERER.render_tokens(
+        [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": transcript},
+        ]
+    )
+    started = time.monotonic()
+    outcome = "error"
+    try:
+        completion = MODEL.create_completion(
+            prompt=prompt_tokens,
+            max_tokens=max_tokens,
+            temperature=0.2,
+            stop=RENDERER.stop_sequences(None),
+            stopping_criteria=StoppingCriteriaList([_cancel_criterion(job)]),
+        )
+        outcome = "cancelled" if job is not None and job.cancelled else "ok"
+    finally:
+        CONTEXT_SUMMARY.observe(time.monotonic() - started, outcome=outcome)
+    summary = completion["choices"][0]["text"].strip()
+    if outcome == "ok":
+        SUMMARY_CACHE.put(key, summary)
+    return summary
+
+
+def _fit_context(
+    messages,
+    tools,
+    inference_configs,
+    add_generation_prompt: bool = True,
+    job: Optional[InferenceJob] = None,
+):
+    """Fit ``messages`` into the context window, see context_window.ContextFitter.
+
+    Summaries stop generating when ``job`` is cancelled. Returns the messages
+    to render and a report of what was changed.
+    """
+    if RENDERER is None:
+        # Without a template the prompt is rendered by llama-cpp, which
+        # reports an oversized prompt itself
+        return messages, {}
+    policy = parse_context_policy(
+        inference_configs.get("context_policy", CONTEXT_POLICY)
+    )
+    max_tokens = inference_configs.get("max_tokens") or 0
+    fitter = ContextFitter(
+        count_tokens=lambda msgs: len(
+            RENDERER.render_tokens(msgs, tools, add_generation_prompt)
+        ),
+        n_ctx=MODEL.n_ctx(),
+        reserve=min(max_tokens, CONTEXT_RESERVE) if max_tokens > 0 else CONTEXT_RESERVE,
+        policy=policy,
+        summarize=lambda dropped, max_tokens: _summarize_messages(
+            dropped, max_tokens, job
+        ),
+    )
+    return fitter.fit(messages)
+
+
+def _create_completion(
+    messages,
+    tools,
+    inference_configs,
+    stream: bool,
+    timer: CompletionTimer,
+    context_report: Optional[Dict[str, Any]] = None,
+    tool_stop: Optional[ToolCallStop] = None,
+):
+    """Render the prompt with the cached chat template and run the completion.
+
+    What fitting the prompt into the context window changed is added to
+    ``context_report``. ``tool_stop`` ends the generation once the tool calls
+    are complete.
+    """
+    sampling = dict(
         temperature=inference_configs["temperature"],
         max_tokens=inference_configs["max_tokens"],
         top_k=inference_configs["top_k"],
         top_p=inference_configs["top_p"],
         repeat_penalty=inference_configs["repetition_penalty"],
-        stop=inference_configs["stop"],
-        stream=False,
     )
-    return response
+    from llama_cpp import StoppingCriteriaList
+
+    job = WORKER.current_job
+    # Checked after every sampled token, so an abort stops within one token
+    stopping_criteria = StoppingCriteriaList([timer, _cancel_criterion(job)])
+    if tool_stop is not None:
+        stopping_criteria.append(tool_stop)
+    if RENDERER is None:
+        # No chat template in the GGUF metadata, let llama-cpp pick a chat format
+        return MODEL.create_chat_completion(
+            messages=messages,
+            tools=tools,
+            stop=inference_configs["stop"],
+            stopping_criteria=stopping_criteria,
+            stream=stream,
+            **sampling,
+        )
+    messages, report = _fit_context(messages, tools, inference_configs, job=job)
+    if context_report is not None:
+        context_report.update(report)
+    prompt_tokens = RENDERER.render_tokens(messages, tools)
+    timer.prompt_tokens = len(prompt_tokens)
+    timer.cached_tokens = max(
+        common_prefix_length(MODEL.input_ids[: MODEL.n_tokens], prompt_tokens),
+        STATE_POOL.prefix_length(prompt_tokens),
+    )
+    timer.start_prefill()
+    from llama_cpp.llama_chat_format import _convert_completion_to_chat
+
+    stop = RENDERER.stop_sequences(inference_configs["stop"])
+    grammar = tool_call_grammar(tools) if TOOL_GRAMMAR else None
+    if grammar is not None:
+        completion = create_tool_call_completion(
+            MODEL,
+            prompt_tokens,
+            grammar,
+            stream=stream,
+            stopping_criteria=stopping_criteria,
+            stop=stop,
+            **sampling,
+        )
+    else:
+        completion = MODEL.create_completion(
+            prompt=prompt_tokens,
+            stop=stop,
+            stopping_criteria=stopping_criteria,
+            stream=stream,
+            **sampling,
+        )
+    return _convert_completion_to_chat(completion, stream=stream)
+
+
+def _new_timer() -> CompletionTimer:
+    job = WORKER.current_job
+    return CompletionTimer(queued_at=job.enqueued_at if job is not None else None)
+
+
+def _outcome() -> str:
+    job = WORKER.current_job
+    return "cancelled" if job is not None and job.cancelled else "ok"
+
+
+def _tool_call_stop(tools, inference_configs) -> Optional[ToolCallStop]:
+    """The request's tool call stop policy, None without tools or when disabled."""
+    if not tools or not inference_configs.get("tool_call_stop", TOOL_CALL_STOP):
+        return None
+    return ToolCallStop(MODEL, max_calls=inference_configs.get("max_tool_calls") or 0)
+
+
+def _tool_call_stop_report(
+    tool_stop: Optional[ToolCallStop], timer: CompletionTimer, inference_configs
+) -> Optional[Dict[str, Any]]:
+    """How a completion stopped after its tool calls, None if it did not.
+
+    ``token_budget_left`` is max_tokens, or the rest of the context window,
+    minus the tokens generated: an upper bound on what the cut off text
+    could have cost, not a count of tokens it would have produced.
+    """
+    if tool_stop is None or not tool_stop.stopped:
+        return None
+    max_tokens = inference_configs.get("max_tokens") or 0
+    if max_tokens <= 0:
+        max_tokens = MODEL.n_ctx() - timer.prompt_tokens
+    report = {
+        "tool_calls": tool_stop.calls,
+        "completion_tokens": timer.tokens,
+        "token_budget_left": max(0, max_tokens - timer.tokens),
+    }
+    TOOL_CALL_STOPS.inc()
+    TOOL_CALL_STOP_BUDGET_LEFT.inc(report["token_budget_left"])
+    logger.info(
+        f"Stopped generation after {tool_stop.calls} tool calls and "
+        f"{timer.tokens} tokens, {report['token_budget_left']} tokens of budget left"
+    )
+    return report
 
 
-def _stream_chat_completion(messages, tools, inference_configs):
-    """Streaming version"""
-    logger.debug("Generating streaming chat completion...")
-    response_stream = MODEL.create_chat_completion(
-        messages=messages,
-        tools=tools,
-        temperature=inference_configs["temperature"],
-        max_tokens=inference_configs["max_tokens"],
-        top_k=inference_configs["top_k"],
-        top_p=inference_configs["top_p"],
-        repeat_penalty=inference_configs["repetition_penalty"],
-        stop=inference_configs["stop"],
-        stream=True,
-    )
+def _chat_completion(messages, tools, inference_configs):
+    """Non-streaming version"""
+    logger.debug("Generating non-streaming chat completion...")
+    timer = _new_timer()
+    context_report: Dict[str, Any] = {}
+    tool_stop = _tool_call_stop(tools, inference_configs)
+    try:
+        response = _create_completion(
+            messages,
+            tools,
+            inference_configs,
+            stream=False,
+            timer=timer,
+            context_report=context_report,
+            tool_stop=tool_stop,
+        )
+    except Exception:
+        timer.record(stream=False, outcome="error")
+        raise
+    timer.record(stream=False, outcome=_outcome())
+    if context_report:
+        response["context_window"] = context_report
+    stop_report = _tool_call_stop_report(tool_stop, timer, inference_configs)
+    if stop_report:
+        response["tool_call_stop"] = stop_report
+    return response
 
-    chunk_count = 0
-    for chunk in response_stream:
-        chunk_count += 1
-        # Convert dictionary to JSON string before yielding
-        yield f"data: {json.dumps(chunk)}\n\n"
-    logger.debug(f"Streaming finished after {chunk_count} chunks.")
 
+def _stream_chat_completion(
+    messages, tools, inference_configs, context_report: Optional[Dict[str, Any]] = None
+):
+    """Streaming version, yields the raw completion chunks"""
+    logger.debug("Generating streaming chat completion...")
+    timer = _new_timer()
+    outcome = "error"
+    tool_stop = _tool_call_stop(tools, inference_configs)
+    try:
+        response_stream = _create_completion(
+            messages,
+            tools,
+            inference_configs,
+            stream=True,
+            timer=timer,
+            context_report=context_report,
+            tool_stop=tool_stop,
+        )
 
-def format_prompt(messages, tools):
+        chunk_count = 0
+        for chunk in response_stream:
+            chunk_count += 1
+            # The stop shows up in the chunk that finishes the completion
+            if chunk["choices"][0].get("finish_reason") is not None:
+                stop_report = _tool_call_stop_report(tool_stop, timer, inference_configs)
+                if stop_report:
+                    chunk = dict(chunk, tool_call_stop=stop_report)
+            yield chunk
+        logger.debug(f"Streaming finished after {chunk_count} chunks.")
+        outcome = _outcome()
+    finally:
+        timer.record(stream=True, outcome=outcome)
+
+
+def format_prompt(messages, tools, add_generation_prompt: bool = False):
     # Actual input received by the model
-    model_template = MODEL.metadata.get("tokenizer.chat_template")
-    template = Template(model_template)
+    if RENDERER is None:
+        raise ValueError(f"Model '{MODEL_NAME}' has no chat template")
     logger.debug(
         f"format_prompt called with {len(messages)} messages and {len(tools) if tools else 0} tools."
     )
-    rendered_prompt = template.render(messages=messages, tools=tools)
+    rendered_prompt = RENDERER.render(messages, tools, add_generation_prompt)
     logger.debug(
         "Actual prompt into llm (truncated):\n"
         + rendered_prompt[:500]
@@ -293,37 +1028,170 @@ def format_tools(tools):
     return t_tools
 
 
-@app.post("/restore_cache")
-async def restore_cache(request: RestoreCacheRequest):
+def _restore_cache(messages, tools):
+    started = time.monotonic()
+    outcome = "error"
     try:
-        # extract messages and tools
-        messages = format_messages(request.messages)
-        tools = format_tools(request.tools)
-        # handle cache
-        prompt = format_prompt(messages, tools)
+        # Summaries are left to the completion itself, warming the cache
+        # should stay cheap
+        policy = [step for step in CONTEXT_POLICY if step != "summarize"]
+        messages, _ = _fit_context(
+            messages, tools, {"context_policy": policy}, add_generation_prompt=False
+        )
+        # Logs the prompt; its pieces are memoized so tokenizing below renders nothing new
+        format_prompt(messages, tools)
+        prompt_tokens = RENDERER.render_tokens(
+            messages, tools, add_generation_prompt=False
+        )
         cache_context = Cache.build_cache(
-            cache_dir=os.path.join(os.path.dirname(__file__), "cache"),
-            prompts=prompt,
+            prompt_tokens=prompt_tokens,
             model=MODEL,
-            temperature=request.inference_configs["temperature"],
+            state_pool=_state_pool(),
+            disk_cache=DISK_CACHE,
         )
         MODEL.load_state(cache_context)
+        outcome = "ok"
+    finally:
+        CACHE_RESTORE.observe(time.monotonic() - started, outcome=outcome)
+
+
+@app.post("/restore_cache")
+async def restore_cache(request: RestoreCacheRequest):
+    # During startup the job queues behind the default model's load
+    if MODEL is None and READINESS.state != LOADING:
+        raise HTTPException(status_code=503, detail="LLM model not loaded")
+    # extract messages and tools
+    messages = format_messages(request.messages)
+    tools = format_tools(request.tools)
+    job = _submit(lambda: _restore_cache(messages, tools))
+    try:
+        await job.result()
         return {"status": "ok", "message": "cache is restored"}
+    except JobCancelledError as e:
+        raise _cancelled_error(e)
     except Exception as e:
         logger.error(f"Error restoring cache: {e}")
         raise HTTPException(status_code=500, detail=f"Error restoring cache: {str(e)}")
 
 
+async def _cancel_on_close(job, frames):
+    """Relay SSE frames, cancelling the job if the response ends early."""
+    try:
+        async for frame in frames:
+            yield frame
+    finally:
+        if not job.future.done():
+            logger.info(f"Stream for request {job.request_id} closed, cancelling generation")
+            job.cancel()
+
+
+async def _cancel_on_disconnect(http_request: Request, job):
+    """Cancel ``job`` once its client goes away."""
+    while not job.future.done():
+        if await http_request.is_disconnected():
+            logger.info(f"Client of request {job.request_id} disconnected, cancelling generation")
+            job.cancel()
+            return
+        await asyncio.sleep(0.1)
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not SESSIONS.drop(session_id):
+        raise HTTPException(status_code=404, detail=f"No session '{session_id}'")
+    return {"status": "ok", "message": f"session {session_id} is deleted"}
+
+
+@app.post("/abort/{request_id}")
+async def abort_request(request_id: str):
+    if not WORKER.cancel(request_id):
+        raise HTTPException(
+            status_code=404, detail=f"No queued or running request '{request_id}'"
+        )
+    return {"status": "ok", "message": f"request {request_id} is aborted"}
+
+
+def _needs_load(model_name: str, load_model_configs: Dict[str, Any]) -> bool:
+    """Whether serving with these load configs requires (re)loading the model."""
+    requested = speculative_settings(load_model_configs)
+    return model_name != MODEL_NAME or bool(
+        requested and requested != SPECULATIVE_SETTINGS
+    )
+
+
+def _start_default_model():
+    """Load the default model in the background. Runs in the event loop at startup."""
+    if DEFAULT_MODEL_NAME is None:
+        READINESS.set_ready()
+        return
+    READINESS.loading()
+    # Registered as a pending load, so requests naming the model wait for it
+    # instead of loading it a second time
+    MODEL_REGISTRY.preload(DEFAULT_MODEL_NAME, DEFAULT_MODEL_CONFIGS)
+
+    def load():
+        try:
+            load_model(DEFAULT_MODEL_NAME, DEFAULT_MODEL_CONFIGS)
+            _warm_up(MODEL)
+            if AUTOTUNE:
+                logger.info(f"Autotuning {MODEL_NAME} on {cpu_signature()}")
+                profile = autotune(MODEL)
+                AUTOTUNE_PROFILES.put(_autotune_key(MODEL_NAME), profile)
+                logger.info(f"Autotuned profile for {MODEL_NAME}: {profile}")
+        except Exception as e:
+            logger.error(
+                f"Failed to load default model '{DEFAULT_MODEL_NAME}': {e}", exc_info=True
+            )
+            READINESS.set_failed(str(e))
+            return
+        READINESS.set_ready()
+
+    # Queued first, so requests run after it on the worker thread
+    _submit(load)
+
+
+def _warm_up(model: "Llama"):
+    """Evaluate a few tokens so weights are paged in before the first request."""
+    started = time.monotonic()
+    model.eval(model.tokenize(b"Hello", add_bos=True))
+    model.reset()
+    logger.info(f"Warmed up {MODEL_NAME} in {time.monotonic() - started:.2f}s")
+
+
+def _ensure_model(model_name: str, load_model_configs: dict[str, Any]):
+    """Load ``model_name`` unless it is already active. Runs on the worker thread.
+
+    Also reloads when the request asks for different speculative decoding settings.
+    """
+    if _needs_load(model_name, load_model_configs):
+        load_model(model_name, load_model_configs)
+        logger.info(f"Model has been changed to {MODEL_NAME}")
+
+
 @app.post("/chat/completions")
-async def create_chat_completion(request: ChatCompletionRequest):
-    global MODEL
-    global MODEL_NAME
+async def create_chat_completion(request: ChatCompletionRequest, http_request: Request):
     if request.model is None or request.model == "":
         raise HTTPException(status_code=400, detail="Model name must be provided")
-    elif request.model != MODEL_NAME:
+    elif request.base_length is not None and not request.session_id:
+        raise HTTPException(status_code=400, detail="base_length requires a session_id")
+    elif request.stream and request.stream_format not in STREAM_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"stream_format must be one of {', '.join(STREAM_FORMATS)}",
+        )
+    try:
+        parse_context_policy(request.inference_configs.get("context_policy"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if _needs_load(request.model, request.load_model_configs):
         try:
-            load_model(request.model, request.load_model_configs)
-            logger.info(f"Model has been changed to {MODEL_NAME}")
+            await _preload_model(request.model, request.load_model_configs)
+            job = _submit(
+                lambda: _ensure_model(request.model, request.load_model_configs)
+            )
+            await job.result()
+        except JobCancelledError as e:
+            raise _cancelled_error(e)
         except ValueError as e:
             logger.error(f"Failed to load requested model '{request.model}': {e}")
             raise HTTPException(status_code=404, detail=str(e))
@@ -335,44 +1203,106 @@ async def create_chat_completion(request: ChatCompletionRequest):
                 status_code=500, detail=f"Error loading model: {str(e)}"
             )
 
-    try:
-        # Log request details at DEBUG level (excluding potentially sensitive message content)
-        debug_request_summary = {
-            "model": request.model,
-            "num_messages": len(request.messages),
-            "num_tools": len(request.tools) if request.tools else 0,
-            "stream": request.stream,
-            "inference_keys": list(request.inference_configs.keys()),
-            "load_model_keys": list(request.load_model_configs.keys()),
-        }
-        logger.debug(f"Chat completion request details: {debug_request_summary}")
+    # Log request details at DEBUG level (excluding potentially sensitive message content)
+    debug_request_summary = {
+        "model": request.model,
+        "num_messages": len(request.messages),
+        "num_tools": len(request.tools) if request.tools else 0,
+        "session_id": request.session_id,
+        "base_length": request.base_length,
+        "stream": request.stream,
+        "inference_keys": list(request.inference_configs.keys()),
+        "load_model_keys": list(request.load_model_configs.keys()),
+    }
+    logger.debug(f"Chat completion request details: {debug_request_summary}")
+
+    messages = format_messages(request.messages)
+    tools = format_tools(request.tools) if request.tools else []
+    if request.session_id:
+        try:
+            messages, tools = SESSIONS.update(
+                request.session_id,
+                messages,
+                None if request.tools is None else tools,
+                request.base_length,
+            )
+        except SessionConflict as e:
+            logger.info(f"Session conflict, client has to resend: {e}")
+            raise HTTPException(status_code=409, detail=str(e))
 
-        messages = format_messages(request.messages)
-        tools = format_tools(request.tools) if request.tools else []
+    # Check if stream parameter is in request
+    stream = request.stream
 
-        # Check if stream parameter is in request
-        stream = request.stream
+    # Filled in by the job before the first chunk, see _create_completion
+    context_report: Dict[str, Any] = {}
 
+    # Another request may have switched models while this one was queued,
+    # so the job re-checks the active model before generating
+    def generate():
+        _ensure_model(request.model, request.load_model_configs)
+        if stream:
+            return _stream_chat_completion(
+                messages, tools, request.inference_configs, context_report
+            )
+        return _chat_completion(messages, tools, request.inference_configs)
+
+    job = _submit(generate, stream=stream, request_id=request.request_id)
+    # Covers queueing and prefill; once streaming starts the response itself
+    # notices a disconnect and _cancel_on_close takes over
+    watcher = asyncio.create_task(_cancel_on_disconnect(http_request, job))
+    try:
         if stream:
             logger.debug("Starting stream response generation.")
+            chunks = job.stream()
+            # Wait for the first chunk so that errors raised before generation
+            # starts (e.g. context window exceeded) still produce an HTTP error
+            first_chunk = await anext(chunks, None)
+            encoder = SSEStreamEncoder(
+                stream_format=request.stream_format,
+                flush_interval=SSE_FLUSH_INTERVAL,
+                flush_bytes=SSE_FLUSH_BYTES,
+            )
+            headers = {
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Request-ID": job.request_id,
+            }
+            if context_report:
+                headers["X-Context-Window"] = json.dumps(context_report)
             return StreamingResponse(
-                _stream_chat_completion(messages, tools, request.inference_configs),
+                _cancel_on_close(job, encoder.events(first_chunk, chunks)),
                 media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                },
+                headers=headers,
             )
         else:
             logger.debug("Starting non-stream response generation.")
-            # Get the generator object
-            return _chat_completion(messages, tools, request.inference_configs)
+            return await job.result()
 
+    except JobCancelledError as e:
+        # Aborted through /abort/{request_id} while still queued
+        raise _cancelled_error(e)
     except Exception as e:
         logger.error(f"Error creating chat completion: {e}", exc_info=True)
         raise HTTPException(
             status_code=500, detail=f"Error creating chat completion: {str(e)}"
         )
+    finally:
+        watcher.cancel()
+
+
+def _prepare_unix_socket(path: str):
+    """Create the socket's directory and remove a socket left by an earlier run."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if os.path.lexists(path):
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            raise OSError(f"{path} exists and is not a socket")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(path)
+            except OSError:
+                os.unlink(path)
+            else:
+                raise OSError(f"Another server is listening on {path}")
 
 
 def main():
@@ -383,6 +1313,13 @@ def main():
     parser.add_argument(
         "--port", type=int, default=8000, help="Port to bind the server to"
     )
+    parser.add_argument(
+        "--uds",
+        type=str,
+        default=None,
+        help="UNIX domain socket to serve on instead of --host/--port, "
+        "e.g. /run/distiller/llm.sock",
+    )
     parser.add_argument(
         "--model_name",
         type=str,
@@ -390,6 +1327,146 @@ def main():
         help="Default LLM model to use",
     )
     parser.add_argument("--n_ctx", type=int, default=4096, help="Default LLM N_CTX")
+    parser.add_argument(
+        "--max_queue_depth",
+        type=int,
+        default=4,
+        help="Requests allowed to wait for the model before new ones get HTTP 429",
+    )
+    parser.add_argument(
+        "--state_pool_mb",
+        type=int,
+        default=512,
+        help="Memory budget in MB for KV states kept in RAM",
+    )
+    parser.add_argument(
+        "--state_pool_entries",
+        type=int,
+        default=8,
+        help="Maximum number of KV states kept in RAM",
+    )
+    parser.add_argument(
+        "--disk_cache_mb",
+        type=int,
+        default=2048,
+        help="Disk budget in MB for persisted KV states",
+    )
+    parser.add_argument(
+        "--disk_cache_policy",
+        type=str,
+        default="lru",
+        choices=["lru", "lfu"],
+        help="Eviction order for persisted KV states",
+    )
+    parser.add_argument(
+        "--sse_flush_ms",
+        type=int,
+        default=30,
+        help="Longest time streamed tokens are held back to share one SSE frame (0 disables coalescing)",
+    )
+    parser.add_argument(
+        "--sse_flush_bytes",
+        type=int,
+        default=64,
+        help="Pending streamed content size that flushes an SSE frame immediately",
+    )
+    parser.add_argument(
+        "--speculative",
+        type=str,
+        default="none",
+        choices=["none", "prompt_lookup", "draft_model"],
+        help="Speculative decoding mode for the default model",
+    )
+    parser.add_argument(
+        "--draft_model_name",
+        type=str,
+        default=None,
+        help="Draft GGUF in the models directory for --speculative draft_model",
+    )
+    parser.add_argument(
+        "--num_pred_tokens",
+        type=int,
+        default=None,
+        help="Tokens drafted per step (default: 10 for prompt_lookup, 4 for draft_model)",
+    )
+    parser.add_argument(
+        "--speculative_logits_mb",
+        type=int,
+        default=2048,
+        help="Largest n_ctx x n_vocab logits buffer speculative decoding may allocate, in MB",
+    )
+    parser.add_argument(
+        "--no_tool_grammar",
+        action="store_true",
+        help="Generate tool calls without the grammar built from the request's tools",
+    )
+    parser.add_argument(
+        "--no_tool_call_stop",
+        action="store_true",
+        help="Keep generating after the tool calls are complete instead of stopping",
+    )
+    parser.add_argument(
+        "--context_policy",
+        type=str,
+        default=",".join(DEFAULT_CONTEXT_POLICY),
+        help="Comma separated steps for prompts over the context window: "
+        "truncate_tool_outputs, drop_oldest, summarize, or none to fail instead",
+    )
+    parser.add_argument(
+        "--context_reserve",
+        type=int,
+        default=256,
+        help="Tokens kept free for the reply when fitting the prompt",
+    )
+    parser.add_argument(
+        "--model_budget_mb",
+        type=int,
+        default=0,
+        help="Memory budget in MB for loaded models (default: system memory minus --memory_reserve_mb)",
+    )
+    parser.add_argument(
+        "--max_resident_models",
+        type=int,
+        default=2,
+        help="Maximum number of models kept loaded",
+    )
+    parser.add_argument(
+        "--memory_reserve_mb",
+        type=int,
+        default=768,
+        help="Memory in MB left free for the rest of the system when fitting a model load",
+    )
+    parser.add_argument(
+        "--kv_cache_type",
+        type=str,
+        default="auto",
+        choices=["auto", *KV_CACHE_TYPES],
+        help="KV cache type for the default model; auto quantizes it only when f16 does not fit",
+    )
+    parser.add_argument(
+        "--autotune",
+        action="store_true",
+        help="Benchmark thread and batch settings for the default model at startup "
+        "and save them for later loads on this CPU",
+    )
+    parser.add_argument(
+        "--max_sessions",
+        type=int,
+        default=8,
+        help="Chat sessions kept for clients sending only new messages",
+    )
+    parser.add_argument(
+        "--session_ttl",
+        type=int,
+        default=1800,
+        help="Seconds an idle chat session is kept",
+    )
+    parser.add_argument(
+        "--ready_fd",
+        type=int,
+        default=None,
+        help="Inherited file descriptor to write 'ready' or 'failed: <reason>' to once startup ends",
+    )
     parser.add_argument(
         "--log-level",
         type=str,
@@ -407,31 +1484,68 @@ def main():
     # --- Logging is now configured ---
     logger.info(f"Logging level set to: {args.log_level.upper()}")
 
+    global WORKER, SSE_FLUSH_INTERVAL, SSE_FLUSH_BYTES, SPECULATIVE_LOGITS_MB, TOOL_GRAMMAR
+    global TOOL_CALL_STOP
+    global CONTEXT_POLICY, CONTEXT_RESERVE, DEFAULT_N_CTX, MEMORY_RESERVE_MB
+    global DEFAULT_MODEL_NAME, DEFAULT_MODEL_CONFIGS, AUTOTUNE
+    WORKER = InferenceWorker(max_queue_depth=args.max_queue_depth)
+    STATE_POOL.capacity_bytes = args.state_pool_mb << 20
+    STATE_POOL.max_entries = args.state_pool_entries
+    DISK_CACHE.capacity_bytes = args.disk_cache_mb << 20
+    DISK_CACHE.policy = args.disk_cache_policy
+    remove_legacy_disk_cache(CACHE_ROOT)
+    SSE_FLUSH_INTERVAL = args.sse_flush_ms / 1000
+    SSE_FLUSH_BYTES = args.sse_flush_bytes
+    SPECULATIVE_LOGITS_MB = args.speculative_logits_mb
+    TOOL_GRAMMAR = not args.no_tool_grammar
+    TOOL_CALL_STOP = not args.no_tool_call_stop
+    CONTEXT_POLICY = parse_context_policy(args.context_policy)
+    CONTEXT_RESERVE = args.context_reserve
+    DEFAULT_N_CTX = args.n_ctx
+    MEMORY_RESERVE_MB = args.memory_reserve_mb
+    SESSIONS.max_sessions = args.max_sessions
+    SESSIONS.ttl_seconds = args.session_ttl
+    # Available memory caps each plan as well, so the default only excludes the reserve
+    MODEL_REGISTRY.budget_bytes = (
+        args.model_budget_mb or max(1024, _system_memory_mb() - MEMORY_RESERVE_MB)
+    ) << 20
+    MODEL_REGISTRY.max_models = args.max_resident_models
+
+    READINESS.ready_fd = args.ready_fd
     # Set default model if provided via command line, otherwise use the one from request
-    global MODEL_NAME
     if args.model_name:
         try:
-            MODEL_NAME = args.model_name
-            load_model_configs = {"n_ctx": args.n_ctx}
-            load_model(MODEL_NAME, load_model_configs)
-            # Logger is already configured, level is set
+            _model_path(args.model_name)
         except ValueError as e:
             logger.error(
                 f"Failed to load default model '{args.model_name}' from command line: {e}"
             )
-            # Decide if server should exit or continue without a default model
+            READINESS.set_failed(str(e))
             sys.exit(f"Error: {e}")
-        except Exception as e:
-            logger.error(
-                f"Unexpected error loading default model '{args.model_name}': {e}",
-                exc_info=True,
-            )
-            sys.exit("Error loading default model.")
-
-    logger.info(f"Starting LLM Server on {args.host}:{args.port}")
+        DEFAULT_MODEL_NAME = args.model_name
+        DEFAULT_MODEL_CONFIGS = {"n_ctx": args.n_ctx, "kv_cache_type": args.kv_cache_type}
+        if args.speculative != "none":
+            DEFAULT_MODEL_CONFIGS["speculative"] = args.speculative
+            if args.draft_model_name:
+                DEFAULT_MODEL_CONFIGS["draft_model_name"] = args.draft_model_name
+            if args.num_pred_tokens:
+                DEFAULT_MODEL_CONFIGS["num_pred_tokens"] = args.num_pred_tokens
+        AUTOTUNE = args.autotune
+    elif args.autotune:
+        logger.warning("--autotune needs --model_name, skipping")
 
     # Start the server
-    uvicorn.run(app, host=args.host, port=args.port)
+    if args.uds:
+        try:
+            _prepare_unix_socket(args.uds)
+        except OSError as e:
+            READINESS.set_failed(str(e))
+            sys.exit(f"Error: {e}")
+        logger.info(f"Starting LLM Server on unix://{args.uds}")
+        uvicorn.run(app, uds=args.uds)
+    else:
+        logger.info(f"Starting LLM Server on {args.host}:{args.port}")
+        uvicorn.run(app, host=args.host, port=args.port)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,111 @@
+"""
+Chat sessions for the LLM server.
+
+Clients used to resend the whole conversation and every tool schema on each
+request, including each tool iteration of a single query. A session keeps the
+conversation on the server, so a client names its session and sends only the
+messages added since its last request, together with ``base_length``, the
+number of messages it expects the session to hold. When the session is
+unknown (expired, evicted, server restarted) or holds a different number of
+messages, the request fails with a SessionConflict and the client resends the
+full conversation, which replaces the session's contents.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SessionConflict(Exception):
+    """The session cannot take the delta; the client has to resend everything."""
+
+
+class ChatSession:
+    """Messages and tools of one conversation, as formatted for rendering."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.messages: List[Dict[str, Any]] = []
+        self.tools: List[Dict[str, Any]] = []
+        self.last_used = time.monotonic()
+
+
+class SessionStore:
+    """Chat sessions, least recently used evicted first and idle ones expired."""
+
+    def __init__(self, max_sessions: int = 8, ttl_seconds: float = 1800):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def update(
+        self,
+        session_id: str,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]],
+        base_length: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Apply a request to a session and return the full messages and tools.
+
+        Args:
+            session_id: Client chosen session id.
+            messages: The whole conversation, or the messages added after the
+                first ``base_length`` ones.
+            tools: Tools of the request; None keeps the session's tools when
+                sending a delta.
+            base_length: Messages the client expects the session to hold, None
+                for a full conversation.
+
+        Raises:
+            SessionConflict: If the delta does not apply to the session.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if base_length is None:
+                if session is None:
+                    session = ChatSession(session_id)
+                session.messages = list(messages)
+                session.tools = list(tools or [])
+            else:
+                if session is None:
+                    raise SessionConflict(f"Unknown session '{session_id}'")
+                if len(session.messages) != base_length:
+                    raise SessionConflict(
+                        f"Session '{session_id}' holds {len(session.messages)} "
+                        f"messages, the request assumes {base_length}"
+                    )
+                # New lists, requests still rendering the old ones are unaffected
+                session.messages = session.messages + list(messages)
+                if tools is not None:
+                    session.tools = list(tools)
+            session.last_used = now
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                evicted, _ = self._sessions.popitem(last=False)
+                logger.debug(f"Evicted chat session '{evicted}'")
+            return session.messages, session.tools
+
+    def drop(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def _expire(self, now: float):
+        for session_id in [
+            sid
+            for sid, session in self._sessions.items()
+            if now - session.last_used > self.ttl_seconds
+        ]:
+            del self._sessions[session_id]
+            logger.debug(f"Expired chat session '{session_id}'")
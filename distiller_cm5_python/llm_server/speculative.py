@@ -0,0 +1,207 @@
+"""
+Speculative decoding drafts for the LLM server.
+
+llama-cpp-python verifies draft tokens in a single batch when a ``draft_model``
+is attached to ``Llama``. Two drafters are available:
+
+- ``prompt_lookup``: copies the continuation of the latest n-gram found earlier
+  in the context. Free to run and effective on tool-call JSON and echoed
+  values (SSIDs, paths) that repeat text from the prompt.
+- ``draft_model``: a small GGUF sharing the main model's vocabulary proposes
+  tokens greedily.
+
+Either drafter is wrapped in an AcceptanceTracker that reports how many
+proposed tokens the main model accepted, so the mode can be tuned per model.
+
+Verifying drafts requires llama to keep logits for every position, which it
+stores in an ``n_ctx x n_vocab`` float buffer (and copies into saved states);
+``check_logits_budget`` rejects configurations where that buffer would not fit.
+"""
+
+import logging
+import os
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from distiller_cm5_python.llm_server.metrics import (
+    SPECULATIVE_ACCEPTANCE,
+    SPECULATIVE_ACCEPTED,
+    SPECULATIVE_DRAFTED,
+)
+
+logger = logging.getLogger(__name__)
+
+SPECULATIVE_MODES = ("none", "prompt_lookup", "draft_model")
+
+# load_model_configs keys that select and tune speculative decoding
+SPECULATIVE_CONFIG_KEYS = (
+    "speculative",
+    "num_pred_tokens",
+    "max_ngram_size",
+    "draft_model_name",
+)
+
+
+def speculative_settings(load_model_configs: Dict[str, Any]) -> Dict[str, Any]:
+    """The speculative decoding keys present in ``load_model_configs``."""
+    return {
+        key: load_model_configs[key]
+        for key in SPECULATIVE_CONFIG_KEYS
+        if key in load_model_configs
+    }
+
+
+def _matching_prefix(a: Sequence[int], b: Sequence[int]) -> int:
+    import numpy as np
+
+    n = min(len(a), len(b))
+    if n == 0:
+        return 0
+    mismatches = np.flatnonzero(np.asarray(a[:n]) != np.asarray(b[:n]))
+    return int(mismatches[0]) if len(mismatches) else n
+
+
+def check_logits_budget(n_ctx: int, n_vocab: int, budget_mb: int):
+    """Raise ValueError if llama's all-position logits buffer exceeds the budget.
+
+    The buffer is allocated for the full context, and pages are committed as
+    positions get evaluated, so a long prompt can use most of it.
+    """
+    needed_mb = (n_ctx * n_vocab * 4) >> 20
+    if needed_mb > budget_mb:
+        max_ctx = (budget_mb << 20) // (n_vocab * 4)
+        raise ValueError(
+            f"Speculative decoding keeps logits for every position "
+            f"({n_ctx} x {n_vocab} floats = {needed_mb} MB), over the "
+            f"{budget_mb} MB budget; use n_ctx <= {max_ctx} or raise the budget"
+        )
+    logger.info(f"Speculative decoding logits buffer: up to {needed_mb} MB")
+
+
+class GGUFDraftModel:
+    """Greedy drafts from a small GGUF model sharing the main model's vocabulary."""
+
+    def __init__(self, model_path: str, n_ctx: int, num_pred_tokens: int = 4):
+        from llama_cpp import Llama
+
+        self.num_pred_tokens = num_pred_tokens
+        self.model = Llama(
+            model_path=model_path, n_ctx=n_ctx, n_gpu_layers=0, verbose=False
+        )
+
+    def __call__(self, input_ids, /, **kwargs: Any):
+        import numpy as np
+
+        draft = self.model
+        # Keep what the draft context already evaluated, but always re-evaluate
+        # at least the last token so its logits are fresh
+        evaluated = draft.input_ids[: draft.n_tokens]
+        prefix = min(_matching_prefix(evaluated, input_ids), len(input_ids) - 1)
+        draft.n_tokens = prefix
+        draft.eval(input_ids[prefix:].tolist())
+        tokens = []
+        for i in range(self.num_pred_tokens):
+            token = draft.sample(temp=0.0)
+            tokens.append(token)
+            if i + 1 < self.num_pred_tokens:
+                draft.eval([token])
+        return np.array(tokens, dtype=np.intc)
+
+
+class AcceptanceTracker:
+    """Wraps a drafter and counts how many of its tokens get accepted.
+
+    llama calls the drafter after every verification step with the context
+    so far, which then ends with the accepted draft tokens and the token the
+    main model sampled itself. Comparing that against the previous proposal
+    tells how many drafted tokens survived.
+    """
+
+    def __init__(self, drafter: Callable, method: str):
+        self.drafter = drafter
+        self.method = method
+        self.drafted = 0
+        self.accepted = 0
+        # (context length, proposal, last context token) awaiting verification
+        self._pending = None
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.drafted if self.drafted else 0.0
+
+    def __call__(self, input_ids, /, **kwargs: Any):
+        n = len(input_ids)
+        if self._pending is not None:
+            start, proposal, anchor = self._pending
+            # A new completion starts from a different context, drop the stale proposal
+            if n > start and input_ids[start - 1] == anchor:
+                self._record(len(proposal), _matching_prefix(proposal, input_ids[start:]))
+            self._pending = None
+        proposal = self.drafter(input_ids, **kwargs)
+        if len(proposal):
+            self._pending = (n, proposal, input_ids[n - 1])
+        return proposal
+
+    def _record(self, drafted: int, accepted: int):
+        self.drafted += drafted
+        self.accepted += accepted
+        SPECULATIVE_DRAFTED.inc(drafted, method=self.method)
+        SPECULATIVE_ACCEPTED.inc(accepted, method=self.method)
+        SPECULATIVE_ACCEPTANCE.set(self.acceptance_rate, method=self.method)
+
+
+def enable_speculative_decoding(
+    model, load_model_configs: Dict[str, Any], models_dir: str, logits_budget_mb: int
+) -> Optional[AcceptanceTracker]:
+    """Attach the drafter selected by ``load_model_configs`` to a loaded model.
+
+    Returns the tracker of the attached drafter, None if speculation is off.
+
+    Raises:
+        ValueError: If the mode is unknown, the draft model is missing or
+            incompatible, or the logits buffer exceeds ``logits_budget_mb``.
+    """
+    mode = load_model_configs.get("speculative") or "none"
+    if mode not in SPECULATIVE_MODES:
+        raise ValueError(
+            f"Unsupported speculative mode '{mode}', use one of {', '.join(SPECULATIVE_MODES)}"
+        )
+    if mode == "none":
+        return None
+    n_ctx, n_vocab = model.n_ctx(), model.n_vocab()
+    check_logits_budget(n_ctx, n_vocab, logits_budget_mb)
+
+    if mode == "prompt_lookup":
+        from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+
+        drafter = LlamaPromptLookupDecoding(
+            max_ngram_size=load_model_configs.get("max_ngram_size", 2),
+            num_pred_tokens=load_model_configs.get("num_pred_tokens", 10),
+        )
+    else:
+        draft_name = load_model_configs.get("draft_model_name")
+        if not draft_name:
+            raise ValueError("speculative mode 'draft_model' requires draft_model_name")
+        draft_path = os.path.join(models_dir, draft_name)
+        if not os.path.exists(draft_path):
+            raise ValueError(f"Draft model '{draft_name}' not found in models directory")
+        drafter = GGUFDraftModel(
+            draft_path,
+            n_ctx=n_ctx,
+            num_pred_tokens=load_model_configs.get("num_pred_tokens", 4),
+        )
+        if drafter.model.n_vocab() != n_vocab:
+            raise ValueError(
+                f"Draft model '{draft_name}' has {drafter.model.n_vocab()} tokens, "
+                f"the main model {n_vocab}; they must share a vocabulary"
+            )
+
+    import numpy as np
+
+    tracker = AcceptanceTracker(drafter, method=mode)
+    # The switches Llama.__init__ makes for a draft_model, applied after
+    # loading so the logits budget is checked before the buffer exists
+    model._logits_all = True
+    model.scores = np.ndarray((n_ctx, n_vocab), dtype=np.single)
+    model.draft_model = tracker
+    logger.info(f"Speculative decoding enabled: {mode}")
+    return tracker
@@ -0,0 +1,160 @@
+"""
+Server-sent event framing for streamed chat completions.
+
+Encoding a full OpenAI-style chunk envelope per token, and parsing it again on
+the client, is a visible share of CPU on the CM5 during generation. The
+SSEStreamEncoder coalesces consecutive content deltas into one frame on a
+time/size budget and can emit a compact frame format that only carries what
+the client consumes:
+
+    {"c": "<content delta>"}
+    {"t": [<tool call deltas>]}
+    {"f": "<finish reason>"}
+    {"s": {<tool call stop report>}}
+
+Keys are omitted when empty. The stream always ends with ``data: [DONE]``.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+STREAM_FORMATS = ("openai", "compact")
+
+_DONE_FRAME = b"data: [DONE]\n\n"
+_END = object()
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to compact JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _frame(obj: Any) -> bytes:
+    return b"data: " + dumps(obj) + b"\n\n"
+
+
+class SSEStreamEncoder:
+    """Turns completion chunks into SSE frames, coalescing content deltas."""
+
+    def __init__(
+        self,
+        stream_format: str = "openai",
+        flush_interval: float = 0.03,
+        flush_bytes: int = 64,
+    ):
+        """Initialize the encoder.
+
+        Args:
+            stream_format: "openai" for full chunk envelopes, "compact" for
+                delta-only frames.
+            flush_interval: Seconds pending content may wait before it is
+                sent. 0 sends every chunk as its own frame.
+            flush_bytes: Pending content size (UTF-8 bytes) that forces a flush.
+        """
+        if stream_format not in STREAM_FORMATS:
+            raise ValueError(f"Unsupported stream format: {stream_format}")
+        self.compact = stream_format == "compact"
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+
+    async def events(
+        self, first_chunk: Optional[Dict[str, Any]], chunks: AsyncIterator[Dict[str, Any]]
+    ) -> AsyncIterator[bytes]:
+        """Yield encoded frames for ``first_chunk`` followed by ``chunks``."""
+        if first_chunk is None:
+            yield _DONE_FRAME
+            return
+
+        pending: List[str] = []
+        pending_size = 0
+        pending_since = 0.0
+        envelope: Optional[Dict[str, Any]] = None
+        sent_content = False
+        next_chunk: Optional[asyncio.Future] = None
+        chunk: Any = first_chunk
+
+        try:
+            while True:
+                if chunk is None:
+                    if next_chunk is None:
+                        next_chunk = asyncio.ensure_future(anext(chunks, _END))
+                    if pending:
+                        timeout = pending_since + self.flush_interval - time.monotonic()
+                        done, _ = await asyncio.wait({next_chunk}, timeout=max(0.0, timeout))
+                        if not done:
+                            yield self._content_frame(envelope, pending)
+                            pending, pending_size = [], 0
+                            continue
+                    chunk = await next_chunk
+                    next_chunk = None
+                    if chunk is _END:
+                        break
+
+                choice = chunk["choices"][0]
+                delta = choice.get("delta") or {}
+                content = delta.get("content")
+                if content is not None and len(delta) == 1 and choice.get("finish_reason") is None:
+                    envelope = chunk
+                    if not pending:
+                        pending_since = time.monotonic()
+                    pending.append(content)
+                    pending_size += len(content.encode("utf-8"))
+                    # The first token goes out at once to keep time-to-first-token low
+                    if (
+                        not sent_content
+                        or self.flush_interval <= 0
+                        or pending_size >= self.flush_bytes
+                    ):
+                        yield self._content_frame(envelope, pending)
+                        pending, pending_size = [], 0
+                        sent_content = True
+                else:
+                    if pending:
+                        yield self._content_frame(envelope, pending)
+                        pending, pending_size = [], 0
+                    frame = self._other_frame(chunk, delta, choice)
+                    if frame is not None:
+                        yield frame
+                chunk = None
+
+            if pending:
+                yield self._content_frame(envelope, pending)
+            yield _DONE_FRAME
+        finally:
+            if next_chunk is not None:
+                next_chunk.cancel()
+
+    def _content_frame(self, envelope: Dict[str, Any], pending: List[str]) -> bytes:
+        text = "".join(pending)
+        if self.compact:
+            return _frame({"c": text})
+        if len(pending) == 1:
+            return _frame(envelope)
+        choice = dict(envelope["choices"][0], delta={"content": text})
+        return _frame(dict(envelope, choices=[choice]))
+
+    def _other_frame(
+        self, chunk: Dict[str, Any], delta: Dict[str, Any], choice: Dict[str, Any]
+    ) -> Optional[bytes]:
+        if not self.compact:
+            return _frame(chunk)
+        compact: Dict[str, Any] = {}
+        if delta.get("content"):
+            compact["c"] = delta["content"]
+        if delta.get("tool_calls"):
+            compact["t"] = delta["tool_calls"]
+        if choice.get("finish_reason") is not None:
+            compact["f"] = choice["finish_reason"]
+        if chunk.get("tool_call_stop"):
+            compact["s"] = chunk["tool_call_stop"]
+        # Role-only deltas carry nothing the compact client needs
+        return _frame(compact) if compact else None
@@ -0,0 +1,300 @@
+"""
+Grammar-constrained tool calls for the LLM server.
+
+Free-text tool calls occasionally come back as invalid JSON, with unknown tool
+names, or with prose before the closing tag, and each of those costs the
+client another round trip. Here the request's tool schemas are compiled into a
+GBNF grammar of the ``<tool_call>`` block, cached per tool set.
+
+Constraining the whole reply would slow down every token of ordinary text and
+stop the model from answering without a tool. Generation therefore runs
+unconstrained until the model emits ``<tool_call>``, then continues from that
+exact state with the grammar, which only allows well-formed calls to the
+offered tools followed by the end of the turn.
+
+ToolCallStop ends generation once the calls are complete, so text the model
+writes after its last call is not decoded only to be discarded.
+"""
+
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    # Imported where used, so importing the server does not load llama
+    from llama_cpp import LlamaGrammar, StoppingCriteriaList
+    from llama_cpp.llama_grammar import SchemaConverter
+
+logger = logging.getLogger(__name__)
+
+TOOL_CALL_OPEN = "<tool_call>"
+TOOL_CALL_CLOSE = "</tool_call>"
+_OPEN_BYTES = TOOL_CALL_OPEN.encode("utf-8")
+_CLOSE_BYTES = TOOL_CALL_CLOSE.encode("utf-8")
+
+# The Hermes-style block the chat templates ask for; the opening tag is
+# already in the context when the grammar takes over
+_ROOT_RULE = (
+    f'root ::= "\\n" call "\\n{TOOL_CALL_CLOSE}" '
+    f'("\\n{TOOL_CALL_OPEN}\\n" call "\\n{TOOL_CALL_CLOSE}")*'
+)
+
+_GRAMMARS: "OrderedDict[str, Optional[LlamaGrammar]]" = OrderedDict()
+_MAX_GRAMMARS = 16
+
+
+def _new_converter() -> "SchemaConverter":
+    from llama_cpp.llama_grammar import SchemaConverter
+
+    return SchemaConverter(
+        prop_order={"name": 0, "arguments": 1},
+        allow_fetch=False,
+        dotall=False,
+        raw_pattern=False,
+    )
+
+
+def _arguments_schema(tool: Dict[str, Any]) -> Dict[str, Any]:
+    """The tool's parameter schema, or any object if the converter rejects it."""
+    parameters = tool.get("parameters") or {"type": "object"}
+    try:
+        converter = _new_converter()
+        converter.visit(converter.resolve_refs(parameters, "tool"), "arguments")
+        return parameters
+    except Exception as e:
+        logger.warning(
+            f"Tool '{tool.get('name')}' parameters cannot be compiled to a grammar, "
+            f"accepting any object: {e}"
+        )
+        return {"type": "object"}
+
+
+def tool_call_schema(tools: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """JSON schema of a single ``{"name": ..., "arguments": ...}`` call."""
+    calls = []
+    for tool in tools:
+        function = tool.get("function", tool)
+        calls.append(
+            {
+                "type": "object",
+                "properties": {
+                    "name": {"const": function["name"]},
+                    "arguments": _arguments_schema(function),
+                },
+                "required": ["name", "arguments"],
+                "additionalProperties": False,
+            }
+        )
+    return calls[0] if len(calls) == 1 else {"oneOf": calls}
+
+
+def compile_tool_grammar(tools: Sequence[Dict[str, Any]]) -> str:
+    """GBNF source for one or more tool calls to ``tools``."""
+    converter = _new_converter()
+    converter.visit(converter.resolve_refs(tool_call_schema(tools), "tools"), "call")
+    return _ROOT_RULE + "\n" + converter.format_grammar()
+
+
+def tool_call_grammar(
+    tools: Optional[Sequence[Dict[str, Any]]],
+) -> Optional["LlamaGrammar"]:
+    """Grammar for calls to ``tools``, cached per tool set.
+
+    Returns None when there are no tools or they cannot be compiled, in which
+    case tool calls are generated unconstrained.
+    """
+    if not tools:
+        return None
+    key = hashlib.sha1(
+        json.dumps(tools, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    if key in _GRAMMARS:
+        _GRAMMARS.move_to_end(key)
+        return _GRAMMARS[key]
+    from llama_cpp import LlamaGrammar
+
+    try:
+        grammar = LlamaGrammar.from_string(compile_tool_grammar(tools), verbose=False)
+    except Exception as e:
+        logger.warning(f"Could not compile a tool call grammar, calls are unconstrained: {e}")
+        grammar = None
+    _GRAMMARS[key] = grammar
+    if len(_GRAMMARS) > _MAX_GRAMMARS:
+        _GRAMMARS.popitem(last=False)
+    return grammar
+
+
+class ToolCallTrigger:
+    """Stopping criterion that ends generation right after ``<tool_call>``.
+
+    llama passes the evaluated tokens, which end with the opening tag once the
+    model has emitted it; the token sampled after it is dropped and generated
+    again under the grammar.
+    """
+
+    def __init__(self, trigger_tokens: Sequence[int], prompt_length: int):
+        self.trigger_tokens = list(trigger_tokens)
+        self.prompt_length = prompt_length
+        self.completion_tokens: Optional[List[int]] = None
+
+    @property
+    def triggered(self) -> bool:
+        return self.completion_tokens is not None
+
+    def __call__(self, input_ids, logits) -> bool:
+        if self.triggered:
+            return True
+        n = len(self.trigger_tokens)
+        if not n or len(input_ids) < self.prompt_length + n:
+            return False
+        if list(input_ids[-n:]) != self.trigger_tokens:
+            return False
+        self.completion_tokens = [int(t) for t in input_ids[self.prompt_length :]]
+        return True
+
+
+class ToolCallStop:
+    """Stopping criterion that ends generation once the tool calls are complete.
+
+    After ``</tool_call>`` the model can only usefully open another call; any
+    other text (an imagined tool result, an answer written before the tool
+    ran) is cut off by the client, so decoding it is wasted. Generation stops
+    at the first token of such text, or after ``max_calls`` complete calls
+    when it is set. Like ``ToolCallTrigger`` it looks at the evaluated
+    tokens, one new token per call, and works across the two completions of
+    ``create_tool_call_completion``.
+    """
+
+    def __init__(self, model, max_calls: int = 0):
+        self._detokenize = model.detokenize
+        self.max_calls = max_calls
+        self.calls = 0
+        self.stopped = False
+        self._length: Optional[int] = None
+        # End of the generated text that may hold the start of a closing tag
+        self._tail = b""
+        # Text generated since the last closing tag, None inside or before a call
+        self._after_call: Optional[bytes] = None
+
+    def __call__(self, input_ids, logits) -> bool:
+        if self.stopped:
+            return True
+        length, previous = len(input_ids), self._length
+        self._length = length
+        # The first call of a completion only has prompt tokens to look at
+        if previous is None or length != previous + 1:
+            return False
+        text = self._detokenize([int(input_ids[-1])])
+        window = self._tail + text
+        self._tail = window[-(len(_CLOSE_BYTES) - 1) :]
+        closed = window.count(_CLOSE_BYTES)
+        if closed:
+            self.calls += closed
+            self._after_call = window.rsplit(_CLOSE_BYTES, 1)[1]
+        elif self._after_call is not None:
+            self._after_call += text
+
+        if self.max_calls and self.calls >= self.max_calls:
+            self.stopped = True
+        elif self._after_call is not None:
+            rest = self._after_call.lstrip()
+            if rest.startswith(_OPEN_BYTES):
+                self._after_call = None
+            elif rest and not _OPEN_BYTES.startswith(rest):
+                self.stopped = True
+        if self.stopped:
+            logger.debug(f"Stopping generation after {self.calls} complete tool calls")
+        return self.stopped
+
+
+def create_tool_call_completion(
+    model,
+    prompt_tokens: List[int],
+    grammar: "LlamaGrammar",
+    stream: bool,
+    stopping_criteria: "StoppingCriteriaList",
+    max_tokens: Optional[int],
+    **kwargs: Any,
+):
+    """``model.create_completion`` with tool call blocks constrained by ``grammar``.
+
+    Returns a completion dict, or an iterator of completion chunks if
+    ``stream``, covering both the free text and the constrained calls.
+    """
+    from llama_cpp import StoppingCriteriaList
+
+    trigger = ToolCallTrigger(
+        model.tokenize(TOOL_CALL_OPEN.encode("utf-8"), add_bos=False, special=True),
+        len(prompt_tokens),
+    )
+    first = model.create_completion(
+        prompt=prompt_tokens,
+        stream=stream,
+        max_tokens=max_tokens,
+        stopping_criteria=StoppingCriteriaList([*stopping_criteria, trigger]),
+        **kwargs,
+    )
+
+    def constrained(stream: bool):
+        remaining = max_tokens
+        if max_tokens is not None and max_tokens > 0:
+            remaining = max_tokens - len(trigger.completion_tokens)
+            if remaining <= 0:
+                return None
+        return model.create_completion(
+            prompt=prompt_tokens + trigger.completion_tokens,
+            stream=stream,
+            max_tokens=remaining,
+            stopping_criteria=stopping_criteria,
+            grammar=grammar,
+            **kwargs,
+        )
+
+    if stream:
+        return _chain_chunks(first, trigger, constrained)
+
+    if not trigger.triggered:
+        return first
+    second = constrained(False)
+    if second is None:
+        first["choices"][0]["finish_reason"] = "length"
+        return first
+    choice = dict(
+        second["choices"][0],
+        text=first["choices"][0]["text"] + second["choices"][0]["text"],
+    )
+    completion_tokens = (
+        first["usage"]["completion_tokens"] + second["usage"]["completion_tokens"]
+    )
+    usage = {
+        "prompt_tokens": first["usage"]["prompt_tokens"],
+        "completion_tokens": completion_tokens,
+        "total_tokens": first["usage"]["prompt_tokens"] + completion_tokens,
+    }
+    return dict(first, choices=[choice], usage=usage)
+
+
+def _chain_chunks(
+    first: Iterator[Dict[str, Any]], trigger: ToolCallTrigger, constrained
+) -> Iterator[Dict[str, Any]]:
+    """Stream the free text, then the constrained calls, as one completion."""
+    completion_id = None
+    for chunk in first:
+        completion_id = completion_id or chunk["id"]
+        choice = chunk["choices"][0]
+        if choice["finish_reason"] is None or not trigger.triggered:
+            yield chunk
+        elif choice["text"]:
+            yield dict(chunk, choices=[dict(choice, finish_reason=None)])
+    if not trigger.triggered:
+        return
+    second = constrained(True)
+    if second is None:
+        yield dict(
+            chunk, choices=[dict(chunk["choices"][0], text="", finish_reason="length")]
+        )
+        return
+    for chunk in second:
+        yield dict(chunk, id=completion_id)
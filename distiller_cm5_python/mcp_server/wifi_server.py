@@ -125,7 +125,11 @@ async def handle_list_tools() -> list[types.Tool]:
 async def handle_call_tool(
     name: str, arguments: dict | None
 ) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-    """Handle tool execution requests (Linux nmcli version)."""
+    """Handle tool execution requests (Linux nmcli version).
+
+    Commands run in a worker thread, so the client's concurrent tool calls
+    are not serialized on this server's event loop.
+    """
     # Log tool call entry - Log argument keys only for sensitivity
     arg_keys = list(arguments.keys()) if arguments else []
     logger.info(f"Handling tool call: '{name}' with argument keys: {arg_keys}")
@@ -153,7 +157,8 @@ async def handle_call_tool(
         logger.debug(
             f"Running command for get_wifi_networks: {command[:100]}..."
         )  # Log truncated command
-        result = subprocess.run(
+        result = await asyncio.to_thread(
+            subprocess.run,
             command, shell=True, capture_output=True, text=True, check=False
         )
 
@@ -184,7 +189,8 @@ async def handle_call_tool(
         logger.debug(
             f"Running command for get_wifi_status (Linux): {' '.join(command_list)}"
         )
-        result = subprocess.run(
+        result = await asyncio.to_thread(
+            subprocess.run,
             command_list, capture_output=True, text=True, check=False
         )
 
@@ -241,7 +247,8 @@ async def handle_call_tool(
             logger.debug(
                 f"Running command to enable WiFi (Linux): {' '.join(power_command)}"
             )
-            power_result = subprocess.run(
+            power_result = await asyncio.to_thread(
+                subprocess.run,
                 power_command, capture_output=True, text=True, shell=False, check=False
             )
             # nmcli might return 0 even if already on, check stderr just in case
@@ -286,7 +293,8 @@ async def handle_call_tool(
                 f"Running command to connect to WiFi (Linux): {masked_command_str}"
             )
 
-            connect_result = subprocess.run(
+            connect_result = await asyncio.to_thread(
+                subprocess.run,
                 connect_command,
                 capture_output=True,
                 text=True,
@@ -350,6 +350,14 @@ N_CTX = get_active_config("n_ctx", 32768)  # Context window size
 MAX_TOKENS = get_active_config("max_tokens", 4096)  # Max generation tokens
 STOP = get_active_config("stop", ["\n\n"])  # Stop sequences
 MAX_MESSAGES_LENGTH = get_active_config("max_messages_length", 100)  # History length
+# Restore the KV state of every discovered MCP server at startup (llama-cpp only)
+CACHE_WARMUP = get_active_config("cache_warmup", False)
+# Keep the conversation on the llama-cpp server and send only new messages
+CHAT_SESSIONS = get_active_config("chat_sessions", True)
+# Stop generating once the tool calls in a response are complete, and after at
+# most max_tool_calls calls (0: no limit)
+TOOL_CALL_STOP = get_active_config("tool_call_stop", True)
+MAX_TOOL_CALLS = get_active_config("max_tool_calls", 0)
 
 # Non-LLM specific configurations (remain as before)
 DEFAULT_SYSTEM_PROMPT = config.get(
@@ -361,3 +369,12 @@ MCP_SERVER_SCRIPT_PATH = config.get(
 LOGGING_LEVEL = config.get(
     "logging", "level", "INFO"
 ).upper()  # Default to INFO, ensure uppercase
+# Tool calls of one LLM turn run concurrently, at most tool_concurrency at a
+# time per MCP server, each cancelled after tool_timeout seconds; tool_limits
+# overrides both per server script, e.g. {"wifi_server": {"tool_timeout": 60}}
+TOOL_CONCURRENCY = config.get("mcp_server", "tool_concurrency", default=4)
+TOOL_TIMEOUT = config.get("mcp_server", "tool_timeout", default=30)
+TOOL_LIMITS = config.get("mcp_server", "tool_limits", default={})
+# Interval between UI events of one streamed message; match the e-ink
+# refresh interval on e-ink devices, 30-50 ms suits the CLI
+STREAM_EVENT_INTERVAL_MS = config.get("display", "stream_event_interval_ms", default=40)
@@ -1,7 +1,9 @@
+import http.client
 import os
 import logging
 import re
-from typing import Optional
+import socket
+from typing import Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -67,3 +69,46 @@ def extract_server_name(server_script_path: str) -> str:
 
     # Strategy 3: Default fallback
     return "MCP Server"
+
+
+def unix_socket_path(server_url: Optional[str]) -> Optional[str]:
+    """Socket path of a ``unix:///run/distiller/llm.sock`` style URL, None for other URLs."""
+    if server_url and server_url.startswith("unix://"):
+        return server_url[len("unix://") :] or None
+    return None
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a UNIX domain socket."""
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+def unix_http_get(socket_path: str, path: str, timeout: float = 2) -> Tuple[int, bytes]:
+    """GET ``path`` from an HTTP server listening on a UNIX socket.
+
+    Returns:
+        The status code and body.
+
+    Raises:
+        OSError: If the socket cannot be reached.
+    """
+    connection = UnixHTTPConnection(socket_path, timeout=timeout)
+    try:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
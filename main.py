@@ -21,7 +21,14 @@ from distiller_cm5_python.client.cli import main as cli_main, parse_arguments
 from distiller_cm5_python.utils.distiller_exception import UserVisibleError
 # Import necessary components for LLM server management
 from distiller_cm5_python.client.llm_infra.llama_manager import LlamaCppServerManager
-from distiller_cm5_python.utils.config import PROVIDER_TYPE, SERVER_URL, MODEL_NAME
+from distiller_cm5_python.utils.config import (
+    PROVIDER_TYPE,
+    SERVER_URL,
+    MODEL_NAME,
+    TIMEOUT,
+    CACHE_WARMUP,
+    config,
+)
 # Import UART utilities for power status signaling
 from distiller_cm5_python.utils.uart_utils import signal_app_start, signal_app_shutdown
 
@@ -67,6 +74,17 @@ async def main():
                     sys.exit(1) # Exit if server fails to start
             else:
                  logger.info(f"Existing llama-cpp server detected at {SERVER_URL}. Proceeding.")
+
+            if CACHE_WARMUP:
+                # Prefill every MCP server's prompt in the background, so that
+                # connecting to any of them is a cache hit
+                from distiller_cm5_python.client.mid_layer.cache_warmup import start_cache_warmup
+                from distiller_cm5_python.client.mid_layer.llm_client import LLMClient
+
+                start_cache_warmup(
+                    LLMClient(SERVER_URL, MODEL_NAME, provider_type=PROVIDER_TYPE, timeout=TIMEOUT),
+                    config,
+                )
         # --- End Llama.cpp Server Management ---
         
 